@@ -1,26 +1,68 @@
 import asyncio
 import logging
+import signal
+from datetime import timedelta
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton
-from aiogram.filters import CommandStart
-
-from bot.config import API_TOKEN, DATABASE_URL
+from aiogram.filters import CommandObject, CommandStart
+
+from bot.config import (
+    API_TOKEN,
+    DATABASE_URL,
+    DIGEST_SIZE,
+    DIGEST_TIME,
+    REMINDER_LEAD_MINUTES,
+    SEND_RATE,
+    CATALOG_ROLE,
+    CATALOG_SNAPSHOT_PATH,
+    CHANGE_POLL_INTERVAL,
+    PAYMENT_RECONCILE_INTERVAL,
+    PROMO_ORDER_TTL_HOURS,
+    reload_settings,
+    YOOKASSA_WEBHOOK_HOST,
+    YOOKASSA_WEBHOOK_PORT,
+    YOOKASSA_WEBHOOK_PATH,
+    YOOKASSA_WEBHOOK_VERIFY,
+    YOOKASSA_WEBHOOK_TRUST_PROXY,
+    get_settings,
+)
 from bot.handlers.organizer import router as organizer_router
 from bot.handlers.resident import router as resident_router
 from bot.handlers.admin import router as admin_router
 
 from bot.db.database import init_db, close_db
+from bot.db.change_bus import change_bus
 from bot.db.schema import ensure_schema
+from bot.services.broadcast import broadcast_engine
+from bot.services.channel import channel_publisher
+from bot.services.digest import digest_scheduler
+from bot.services.reminders import reminder_scheduler
+from bot.services.tasks import task_supervisor
+from bot.services.catalog import catalog, use_feed_source
+from bot.services.catalog_snapshot import SnapshotPublisher, SnapshotReader
+from bot.services.feed_sweeper import feed_sweeper
+from bot.services.outbox import outbox_dispatcher
+from bot.services.payment_reconciler import payment_reconciler
+from bot.services.promo_expiry import promo_expiry
+from bot.services.yookassa_client import init_yookassa_client, close_yookassa_client
+from bot.services.yookassa_webhook import YooKassaWebhook
+from bot.utils.cards import fetch_event_card, send_event_card
+from bot.utils.rate_limit import send_limiter
 from bot.handlers.promo import router as promo_router
 
 from bot.handlers.admin_delete import router as admin_delete_router
+from bot.middlewares.reachability import LastSeenMiddleware, UnreachableChatMiddleware
+from bot.services.reachability import reachability
 
 logging.basicConfig(level=logging.INFO)
 
+_webhook: YooKassaWebhook | None = None
+_snapshot: SnapshotPublisher | None = None
+
 
 def main_menu_kb() -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(
@@ -34,13 +76,117 @@ def main_menu_kb() -> ReplyKeyboardMarkup:
     )
 
 
-async def on_startup() -> None:
+def _install_reload_signal() -> None:
+    # kill -HUP <pid> -> перечитать .env (цены, админы, ключи ЮKassa) без перезапуска
+    if not hasattr(signal, "SIGHUP"):
+        return  # Windows
+
+    def _reload() -> None:
+        try:
+            reload_settings()
+        except Exception:
+            logging.exception("Settings reload failed, keeping previous settings")
+
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, _reload)
+    except NotImplementedError:
+        pass
+
+
+async def on_startup(bot: Bot) -> None:
+    global _webhook, _snapshot
+
     await init_db(DATABASE_URL)
     await ensure_schema()
     logging.info("✅ SQLite DB ready")
 
+    _install_reload_signal()
+    # проверка оплаты из хендлеров «Я оплатил» — в любом процессе
+    await init_yookassa_client()
+
+    # последние визиты пользователей, которых обслужил этот процесс (только upsert, без отправок)
+    await reachability.start()
+
+    if CATALOG_SNAPSHOT_PATH and CATALOG_ROLE == "reader":
+        # Читатель только отвечает на апдейты: лента из общего снапшота писателя,
+        # без прогревочного запроса в БД. Webhook, outbox, рассылки, дайджест,
+        # напоминания, сроки продвижения и сверка оплат — только у писателя:
+        # очереди разбираются без захвата строк, N отправителей = N копий сообщения.
+        use_feed_source(SnapshotReader(CATALOG_SNAPSHOT_PATH))
+        logging.info("✅ Catalog: reading snapshot %s", CATALOG_SNAPSHOT_PATH)
+        return
+
+    if YOOKASSA_WEBHOOK_PORT:
+        _webhook = YooKassaWebhook(
+            bot,
+            host=YOOKASSA_WEBHOOK_HOST,
+            port=YOOKASSA_WEBHOOK_PORT,
+            path=YOOKASSA_WEBHOOK_PATH,
+            verify=YOOKASSA_WEBHOOK_VERIFY,
+            trust_proxy=YOOKASSA_WEBHOOK_TRUST_PROXY,
+        )
+        await _webhook.start()
+
+    # записи других процессов (админ-CLI, читатели) -> точечная инвалидация кэшей;
+    # курсор журнала — до загрузки каталога, чтобы не потерять записи между ними
+    change_bus.interval = CHANGE_POLL_INTERVAL
+    change_bus.subscribe(catalog.on_db_change)
+    await change_bus.start()
+    await catalog.load()
+    if CATALOG_SNAPSHOT_PATH:
+        _snapshot = SnapshotPublisher(CATALOG_SNAPSHOT_PATH)
+        _snapshot.attach(catalog)
+        logging.info("✅ Catalog: publishing snapshot %s", CATALOG_SNAPSHOT_PATH)
+
+    await feed_sweeper.start()
+    # рассылки и outbox делят один бюджет отправок
+    send_limiter.rate = SEND_RATE
+    await outbox_dispatcher.start(bot)
+    # «Топ на 24ч» и прочие сроки продвижения
+    await promo_expiry.start()
+    # «📣 Оповещение всем»: незаконченные рассылки продолжаются после перезапуска
+    await broadcast_engine.start(bot)
+    # дайджест раз в день через outbox
+    digest_scheduler.at = DIGEST_TIME
+    digest_scheduler.size = DIGEST_SIZE
+    await digest_scheduler.start()
+    # «🔔 Напомнить»: в памяти только ближайший час напоминаний
+    reminder_scheduler.lead = timedelta(minutes=REMINDER_LEAD_MINUTES)
+    await reminder_scheduler.start()
+    # одобренные события -> пост в канал (через outbox, правки — триггером)
+    if get_settings().channel_id:
+        logging.info(
+            "✅ Channel autopost: %s (every %ss at most)", get_settings().channel_id, channel_publisher.interval
+        )
+
+    # заказы, по которым пользователь не вернулся к кнопке «Я оплатил»
+    payment_reconciler.interval = PAYMENT_RECONCILE_INTERVAL
+    payment_reconciler.ttl = timedelta(hours=PROMO_ORDER_TTL_HOURS)
+    await payment_reconciler.start(bot)
+
 
 async def on_shutdown() -> None:
+    global _webhook, _snapshot
+
+    if _webhook is not None:
+        await _webhook.stop()
+        _webhook = None
+    # фоновые задачи хендлеров — до закрытия БД и клиента ЮKassa;
+    # у читателя сервисы писателя не запущены, их stop() ничего не делает
+    await task_supervisor.stop()
+    await payment_reconciler.stop()
+    await reminder_scheduler.stop()
+    await digest_scheduler.stop()
+    await broadcast_engine.stop()
+    await outbox_dispatcher.stop()
+    await reachability.stop()
+    await promo_expiry.stop()
+    await feed_sweeper.stop()
+    await change_bus.stop()
+    if _snapshot is not None:
+        await _snapshot.stop()
+        _snapshot = None
+    await close_yookassa_client()
     await close_db()
     logging.info("✅ SQLite closed")
 
@@ -51,7 +197,10 @@ async def main() -> None:
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
 
+    # кто из пользователей жив: last_seen_at по апдейтам, unreachable_at по ошибкам отправки
+    bot.session.middleware(UnreachableChatMiddleware())
     dp = Dispatcher(storage=MemoryStorage())
+    dp.update.outer_middleware(LastSeenMiddleware())
 
     dp.include_router(organizer_router)
     dp.include_router(resident_router)
@@ -59,6 +208,15 @@ async def main() -> None:
     dp.include_router(promo_router)
     dp.include_router(admin_delete_router)
 
+    # «📄 Подробнее в боте» из поста в канале: t.me/<бот>?start=event_<id>
+    @dp.message(CommandStart(deep_link=True, magic=F.args.regexp(r"^event_\d+$")))
+    async def cmd_start_event(message: Message, command: CommandObject) -> None:
+        card = await fetch_event_card(int(command.args.split("_", 1)[1]))
+        if card is None:
+            await message.answer("Это мероприятие уже прошло или снято с публикации 🙁", reply_markup=main_menu_kb())
+            return
+        await send_event_card(message.bot, message.chat.id, card)
+
     @dp.message(CommandStart())
     async def cmd_start(message: Message) -> None:
         await message.answer(
@@ -72,7 +230,7 @@ async def main() -> None:
     async def feedback(message: Message) -> None:
         await message.answer("📩 Напиши своё сообщение — мы обязательно ответим!")
 
-    await on_startup()
+    await on_startup(bot)
     try:
         await dp.start_polling(bot)
     finally:
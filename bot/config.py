@@ -1,33 +1,224 @@
+import logging
 import os
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Callable, Mapping
+
 from dotenv import load_dotenv
 
+from bot.utils.rate_limit import MAX_SEND_RATE
+
 load_dotenv()
 
-API_TOKEN = os.getenv("BOT_TOKEN", "").strip()
-DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
+logger = logging.getLogger(__name__)
+
+
+def _str(name: str, default: str = "") -> str:
+    return (os.getenv(name, default) or default).strip()
+
+
+def _int(name: str, default: int) -> int:
+    try:
+        return int(_str(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _float(name: str, default: float) -> float:
+    try:
+        return float(_str(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _ids(raw: str) -> frozenset[int]:
+    return frozenset(int(x) for x in raw.replace(";", ",").split(",") if x.strip().isdigit())
+
+
+@dataclass(frozen=True)
+class YooKassaSettings:
+    # PAYMENT_MODE=0 -> тестовый магазин, PAYMENT_MODE=1 -> боевой
+    test: bool
+    shop_id: str
+    secret_key: str
+    return_url: str
+    receipt_email: str = ""
+    receipt_phone: str = ""
+    tax_system_code: int = 1
+    vat_code: int = 1
+    payment_subject: str = "service"
+    payment_mode: str = "full_payment"
+
+    @property
+    def mode(self) -> str:
+        return "TEST" if self.test else "PROD"
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Настройки процесса. Собираются и проверяются один раз (load_settings),
+    дальше только чтение атрибутов. reload_settings() подменяет объект целиком.
+
+    Без перезапуска меняются: admin_ids, promo_prices, yookassa, channel_id.
+    Остальное (токен, БД, порты, роли воркеров) читается только при старте.
+    """
+
+    bot_token: str
+    database_url: str
+    admin_ids: frozenset[int]
+    promo_prices: Mapping[str, int]
+    yookassa: YooKassaSettings
+
+    # --- CATALOG SNAPSHOT (несколько воркеров) ---
+    catalog_snapshot_path: str = ""
+    catalog_role: str = "writer"
+    # --- CROSS-PROCESS INVALIDATION ---
+    change_poll_interval: float = 0.5
+    # --- YOOKASSA WEBHOOK ---
+    webhook_host: str = "0.0.0.0"
+    webhook_port: int = 0
+    webhook_path: str = "/yookassa/webhook"
+    webhook_verify: bool = True
+    webhook_trust_proxy: bool = False
+    # --- PAYMENT RECONCILIATION ---
+    payment_reconcile_interval: float = 60.0
+    promo_order_ttl_hours: float = 24.0
+    # --- BROADCASTS / OUTBOX ---
+    send_rate: float = 20.0
+    # --- DIGEST ---
+    digest_time: str = "10:00"
+    digest_size: int = 5
+    # --- REMINDERS ---
+    reminder_lead_minutes: int = 120
+    # --- CHANNEL ---
+    channel_id: str = ""
+
+
+def load_settings() -> Settings:
+    """Читает окружение (.env) и проверяет обязательные значения."""
+    bot_token = _str("BOT_TOKEN")
+    if not bot_token:
+        raise RuntimeError("BOT_TOKEN is missing in .env")
+
+    database_url = _str("DATABASE_URL")
+    if not database_url:
+        raise RuntimeError("DATABASE_URL is missing in .env")
+
+    test = _str("PAYMENT_MODE", "1") == "0"
+    prefix = "YOOKASSA_TEST_" if test else "YOOKASSA_"
+    yookassa = YooKassaSettings(
+        test=test,
+        shop_id=_str(f"{prefix}SHOP_ID"),
+        secret_key=_str(f"{prefix}SECRET_KEY"),
+        return_url=_str("YOOKASSA_RETURN_URL", "https://t.me/Events_Now_bot"),
+        receipt_email=_str("YOOKASSA_RECEIPT_EMAIL"),
+        receipt_phone=_str("YOOKASSA_RECEIPT_PHONE"),
+        tax_system_code=_int("YOOKASSA_TAX_SYSTEM_CODE", 1),
+        vat_code=_int("YOOKASSA_VAT_CODE", 1),
+        payment_subject=_str("YOOKASSA_PAYMENT_SUBJECT", "service") or "service",
+        payment_mode=_str("YOOKASSA_PAYMENT_MODE", "full_payment") or "full_payment",
+    )
+    if not yookassa.shop_id:
+        raise RuntimeError(f"{prefix}SHOP_ID is missing in .env")
+    if not yookassa.secret_key:
+        raise RuntimeError(f"{prefix}SECRET_KEY is missing in .env")
+
+    webhook_port = _str("YOOKASSA_WEBHOOK_PORT")
+
+    return Settings(
+        bot_token=bot_token,
+        database_url=database_url,
+        # ADMIN_IDS=823223744,111222333
+        admin_ids=_ids(_str("ADMIN_IDS")),
+        promo_prices=MappingProxyType(
+            {
+                "top": _int("PROMO_PRICE_TOP", 299),
+                "notify": _int("PROMO_PRICE_NOTIFY", 199),
+                "highlight": _int("PROMO_PRICE_HIGHLIGHT", 149),
+                "bump": _int("PROMO_PRICE_BUMP", 99),
+            }
+        ),
+        yookassa=yookassa,
+        # CATALOG_SNAPSHOT_PATH=data/catalog.snap — общий mmap-файл ленты (пусто — выключено)
+        # CATALOG_ROLE=writer — строит каталог из БД и публикует снапшот
+        # CATALOG_ROLE=reader — отдаёт ленту из снапшота, каталог в память не грузит
+        catalog_snapshot_path=_str("CATALOG_SNAPSHOT_PATH"),
+        catalog_role=(_str("CATALOG_ROLE", "writer") or "writer").lower(),
+        # как часто опрашивать PRAGMA data_version (секунды)
+        change_poll_interval=_float("CHANGE_POLL_INTERVAL", 0.5),
+        # YOOKASSA_WEBHOOK_PORT=8081 — включает приёмник уведомлений (пусто — выключен)
+        # YOOKASSA_WEBHOOK_VERIFY=0 — только для локальной проверки (python -m bot.services.yookassa_fake)
+        # YOOKASSA_WEBHOOK_TRUST_PROXY=1 — IP отправителя брать из X-Forwarded-For (бот за nginx)
+        webhook_host=_str("YOOKASSA_WEBHOOK_HOST", "0.0.0.0"),
+        webhook_port=int(webhook_port) if webhook_port.isdigit() else 0,
+        webhook_path=_str("YOOKASSA_WEBHOOK_PATH", "/yookassa/webhook") or "/yookassa/webhook",
+        webhook_verify=_str("YOOKASSA_WEBHOOK_VERIFY", "1") != "0",
+        webhook_trust_proxy=_str("YOOKASSA_WEBHOOK_TRUST_PROXY", "0") == "1",
+        # как часто сверять незакрытые заказы с ЮKassa (секунды) и через сколько часов бросать неоплаченные
+        payment_reconcile_interval=_float("PAYMENT_RECONCILE_INTERVAL", 60.0),
+        promo_order_ttl_hours=_float("PROMO_ORDER_TTL_HOURS", 24.0),
+        # SEND_RATE — сообщений в секунду на все фоновые отправки (рассылки, дайджест,
+        # напоминания, уведомления, канал) вместе; общий лимит Telegram ~30/с, запас —
+        # обычным ответам бота. Больше MAX_SEND_RATE не берём. BROADCAST_RATE — старое имя.
+        send_rate=min(_float("SEND_RATE", _float("BROADCAST_RATE", 20.0)), MAX_SEND_RATE),
+        # DIGEST_TIME=10:00 — во сколько (локальное время) собирать дайджест; off — выключен
+        # DIGEST_SIZE — сколько событий в одном дайджесте
+        digest_time=_str("DIGEST_TIME", "10:00"),
+        digest_size=_int("DIGEST_SIZE", 5),
+        # REMINDER_LEAD_MINUTES — за сколько минут до начала напоминать («🔔 Напомнить»)
+        reminder_lead_minutes=_int("REMINDER_LEAD_MINUTES", 120),
+        # CHANNEL_ID=@eventsnow_channel или -100… — куда публиковать одобренные события
+        # (бот — админ канала); пусто — не публикуем
+        channel_id=_str("CHANNEL_ID"),
+    )
+
+
+_settings = load_settings()
+_listeners: list[Callable[[Settings], None]] = []
+
 
-if not API_TOKEN:
-    raise RuntimeError("BOT_TOKEN is missing in .env")
+def get_settings() -> Settings:
+    """НЕ async. Текущие настройки; объект неизменяемый — можно держать ссылку в рамках запроса."""
+    return _settings
 
-if not DATABASE_URL:
-    raise RuntimeError("DATABASE_URL is missing in .env")
-# --- ADMIN IDS ---
-# В .env добавь строку:
-# ADMIN_IDS=823223744,111222333
-_admin_ids_raw = os.getenv("ADMIN_IDS", "").strip()
-ADMIN_IDS = [int(x) for x in _admin_ids_raw.split(",") if x.strip().isdigit()]
 
-YOOKASSA_SHOP_ID = os.getenv("YOOKASSA_SHOP_ID", "").strip()
-YOOKASSA_SECRET_KEY = os.getenv("YOOKASSA_SECRET_KEY", "").strip()
+def on_settings_reload(fn: Callable[[Settings], None]) -> None:
+    _listeners.append(fn)
 
-YOOKASSA_RETURN_URL = os.getenv(
-    "YOOKASSA_RETURN_URL",
-    "https://t.me/Events_Now_bot"
-)
 
+def reload_settings() -> Settings:
+    """
+    Перечитывает .env и атомарно подменяет настройки (SIGHUP, /reload_config).
+    Если новые значения не проходят проверку — остаются старые, ошибка пробрасывается.
+    """
+    global _settings
+    load_dotenv(override=True)
+    new = load_settings()
+    _settings = new
+    for fn in _listeners:
+        try:
+            fn(new)
+        except Exception:
+            logger.exception("Settings reload listener failed: %r", fn)
+    logger.info("Settings reloaded")
+    return new
 
-if not YOOKASSA_SHOP_ID:
-    raise RuntimeError("YOOKASSA_SHOP_ID is missing in .env")
 
-if not YOOKASSA_SECRET_KEY:
-    raise RuntimeError("YOOKASSA_SECRET_KEY is missing in .env")
\ No newline at end of file
+# значения, которые читаются только при старте процесса
+API_TOKEN = _settings.bot_token
+DATABASE_URL = _settings.database_url
+CATALOG_SNAPSHOT_PATH = _settings.catalog_snapshot_path
+CATALOG_ROLE = _settings.catalog_role
+CHANGE_POLL_INTERVAL = _settings.change_poll_interval
+YOOKASSA_WEBHOOK_HOST = _settings.webhook_host
+YOOKASSA_WEBHOOK_PORT = _settings.webhook_port
+YOOKASSA_WEBHOOK_PATH = _settings.webhook_path
+YOOKASSA_WEBHOOK_VERIFY = _settings.webhook_verify
+YOOKASSA_WEBHOOK_TRUST_PROXY = _settings.webhook_trust_proxy
+PAYMENT_RECONCILE_INTERVAL = _settings.payment_reconcile_interval
+PROMO_ORDER_TTL_HOURS = _settings.promo_order_ttl_hours
+SEND_RATE = _settings.send_rate
+DIGEST_TIME = _settings.digest_time
+DIGEST_SIZE = _settings.digest_size
+REMINDER_LEAD_MINUTES = _settings.reminder_lead_minutes
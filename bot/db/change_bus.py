@@ -0,0 +1,136 @@
+# bot/db/change_bus.py
+from __future__ import annotations
+
+import asyncio
+import inspect
+import logging
+from typing import Any, Awaitable, Callable, Optional
+
+from bot.db.database import get_db, own_changes
+
+logger = logging.getLogger(__name__)
+
+# table, event_id; table == "*" — журнал потерян, сбросить кэш целиком
+Subscriber = Callable[[str, Optional[int]], Optional[Awaitable[None]]]
+
+_BATCH = 500
+
+
+class ChangeBus:
+    """
+    Межпроцессная инвалидация кэшей.
+
+    Раз в interval секунд читаем PRAGMA data_version — он меняется только когда
+    в файл БД закоммитил ДРУГОЙ процесс/подключение. Только тогда дочитываем
+    change_log (его пишут триггеры на events/event_photos/promo_orders) и
+    раздаём подписчикам (table, event_id). Свои записи процесс инвалидирует сам;
+    записи своих transaction() (отдельное подключение — data_version тоже меняют)
+    пропускаем по own_changes().
+    """
+
+    def __init__(self, interval: float = 0.5, retention_hours: int = 24) -> None:
+        self.interval = interval
+        self.retention_hours = retention_hours
+        self._subscribers: list[Subscriber] = []
+        self._cursor = 0
+        self._data_version: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self.published = 0
+
+    def subscribe(self, fn: Subscriber) -> None:
+        self._subscribers.append(fn)
+
+    async def start(self) -> None:
+        db = get_db()
+        cur = await db.execute("SELECT COALESCE(MAX(id), 0) FROM change_log")
+        self._cursor = int((await cur.fetchone())[0])
+        self._data_version = await self._read_data_version()
+        self._task = asyncio.create_task(self._run(), name="change-bus")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _read_data_version(self) -> int:
+        cur = await get_db().execute("PRAGMA data_version")
+        return int((await cur.fetchone())[0])
+
+    async def _run(self) -> None:
+        polls = 0
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.poll_once()
+                polls += 1
+                # чистим журнал примерно раз в час
+                if polls * self.interval >= 3600:
+                    polls = 0
+                    await self.prune()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("ChangeBus poll failed")
+
+    async def poll_once(self) -> int:
+        version = await self._read_data_version()
+        if version == self._data_version:
+            return 0
+        self._data_version = version
+
+        db = get_db()
+        total = 0
+        while True:
+            cur = await db.execute(
+                "SELECT id, table_name, event_id FROM change_log WHERE id > ? ORDER BY id LIMIT ?",
+                (self._cursor, _BATCH),
+            )
+            rows = await cur.fetchall()
+            if not rows:
+                break
+
+            changes: dict[tuple[str, Optional[int]], None] = {}
+            if self._cursor and int(rows[0]["id"]) > self._cursor + 1:
+                # между курсором и журналом дыра (журнал почищен) — сбрасываем всё
+                changes[("*", None)] = None
+            own = own_changes()
+            for r in rows:
+                if any(lo < int(r["id"]) <= hi for lo, hi in own):
+                    continue
+                event_id = r["event_id"]
+                changes[(str(r["table_name"]), int(event_id) if event_id is not None else None)] = None
+            self._cursor = int(rows[-1]["id"])
+            # диапазоны целиком позади курсора больше не нужны
+            own[:] = [(lo, hi) for lo, hi in own if hi > self._cursor]
+
+            for table, event_id in changes:
+                await self._publish(table, event_id)
+            total += len(changes)
+            if len(rows) < _BATCH:
+                break
+        return total
+
+    async def _publish(self, table: str, event_id: Optional[int]) -> None:
+        self.published += 1
+        for fn in self._subscribers:
+            try:
+                res: Any = fn(table, event_id)
+                if inspect.isawaitable(res):
+                    await res
+            except Exception:
+                logger.exception("ChangeBus subscriber failed: %s %s", table, event_id)
+
+    async def prune(self) -> None:
+        db = get_db()
+        await db.execute(
+            "DELETE FROM change_log WHERE changed_at < datetime('now', ?)",
+            (f"-{int(self.retention_hours)} hours",),
+        )
+        await db.commit()
+
+
+change_bus = ChangeBus()
@@ -0,0 +1,49 @@
+# bot/db/codec.py
+"""
+Упаковка сырых ответов провайдера для payment_events.
+
+JSON через orjson, если он установлен (в разы быстрее stdlib json), иначе json.
+Тела больше ZLIB_MIN_SIZE байт сжимаются zlib — ответы ЮKassa с чеком
+хорошо жмутся, а мелкие уведомления сжимать невыгодно.
+"""
+from __future__ import annotations
+
+import json
+import zlib
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # необязательная зависимость
+    orjson = None
+
+CODEC_JSON = "json"
+CODEC_ZLIB = "json+zlib"
+
+ZLIB_MIN_SIZE = 512
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def loads(data: bytes | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def pack(obj: Any, *, compress: bool = True) -> tuple[str, bytes]:
+    """-> (codec, body) для колонок payment_events.codec / body."""
+    body = dumps(obj)
+    if compress and len(body) >= ZLIB_MIN_SIZE:
+        return CODEC_ZLIB, zlib.compress(body, 6)
+    return CODEC_JSON, body
+
+
+def unpack(codec: str, body: bytes | str) -> Any:
+    if codec == CODEC_ZLIB:
+        body = zlib.decompress(body)
+    return loads(body)
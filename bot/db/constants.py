@@ -0,0 +1,12 @@
+# bot/db/constants.py
+"""Константы данных, общие для схемы (миграции) и репозитория — без зависимостей от сервисов."""
+from __future__ import annotations
+
+from datetime import timedelta
+
+# сколько держится оплаченное продвижение (events.promoted_until); notify — разовая рассылка
+PROMO_DURATIONS: dict[str, timedelta] = {
+    "top": timedelta(hours=24),
+    "highlight": timedelta(hours=24),
+    "bump": timedelta(hours=24),
+}
@@ -1,15 +1,28 @@
 # bot/db/database.py
 from __future__ import annotations
 
+import asyncio
 import os
 import sqlite3
 import logging
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import AsyncIterator
 from urllib.parse import urlparse, unquote
 
 import aiosqlite
 
 _db: aiosqlite.Connection | None = None
+# отдельное подключение для многошаговых транзакций (см. transaction())
+_tx_db: aiosqlite.Connection | None = None
+_tx_lock = asyncio.Lock()
+# id записей change_log, сделанных transaction() этого процесса: диапазоны (после, до].
+# Коммит _tx_db меняет PRAGMA data_version у _db, и ChangeBus принял бы их за чужие —
+# а каталог по ним процесс уже обновил сам (catalog.refresh_event после транзакции).
+_own_changes: list[tuple[int, int]] = []
+# дольше — предупреждение: записи через get_db() всё это время ждут (busy_timeout = 5 с)
+_TX_SLOW = 1.0
 
 
 def _default_db_path() -> str:
@@ -79,6 +92,18 @@ def _resolve_path(p: str) -> str:
     return str(pp.resolve())
 
 
+async def _connect(db_path: str) -> aiosqlite.Connection:
+    conn = await aiosqlite.connect(db_path)
+    conn.row_factory = sqlite3.Row
+
+    # Нормальные pragma
+    await conn.execute("PRAGMA foreign_keys = ON")
+    await conn.execute("PRAGMA journal_mode = WAL")
+    await conn.execute("PRAGMA synchronous = NORMAL")
+    await conn.execute("PRAGMA busy_timeout = 5000")
+    return conn
+
+
 async def init_db(db_url_or_path: str | None = None) -> None:
     """
     Инициализация единственного подключения к SQLite на процесс.
@@ -89,7 +114,7 @@ async def init_db(db_url_or_path: str | None = None) -> None:
     2) аргумент db_url_or_path
     3) дефолт bot/db/events.db
     """
-    global _db
+    global _db, _tx_db
     if _db is not None:
         return
 
@@ -100,15 +125,8 @@ async def init_db(db_url_or_path: str | None = None) -> None:
     if folder:
         os.makedirs(folder, exist_ok=True)
 
-    conn = await aiosqlite.connect(db_path)
-    conn.row_factory = sqlite3.Row
-
-    # Нормальные pragma
-    await conn.execute("PRAGMA foreign_keys = ON")
-    await conn.execute("PRAGMA journal_mode = WAL")
-    await conn.execute("PRAGMA synchronous = NORMAL")
-
-    _db = conn
+    _db = await _connect(db_path)
+    _tx_db = await _connect(db_path)
 
     # ЛОГИРУЕМ РЕАЛЬНЫЙ ФАЙЛ, С КОТОРЫМ РАБОТАЕТ БОТ
     logging.info("✅ SQLite DB ready: %s", db_path)
@@ -123,8 +141,71 @@ def get_db() -> aiosqlite.Connection:
     return _db
 
 
+async def _change_log_head(conn: aiosqlite.Connection) -> int | None:
+    try:
+        cur = await conn.execute("SELECT COALESCE(MAX(id), 0) FROM change_log")
+    except sqlite3.OperationalError:
+        return None  # схема ещё не создана
+    return int((await cur.fetchone())[0])
+
+
+def own_changes() -> list[tuple[int, int]]:
+    """Диапазоны id change_log (после, до], записанные transaction() этого процесса (читает и чистит ChangeBus)."""
+    return _own_changes
+
+
+@asynccontextmanager
+async def transaction() -> AsyncIterator[aiosqlite.Connection]:
+    """
+    Атомарная запись из нескольких запросов: BEGIN IMMEDIATE ... COMMIT.
+
+    Идёт через отдельное подключение: на общем get_db() чужой commit()
+    из другого хэндлера зафиксировал бы нашу транзакцию на середине.
+    Последствия второго подключения:
+    - записи через get_db() на время транзакции ждут (busy_timeout 5 с, дальше
+      «database is locked») — внутри только запросы к БД, без сети и Telegram;
+      транзакция дольше _TX_SLOW пишется в лог;
+    - свои записи в change_log ChangeBus пропускает (own_changes()): под
+      BEGIN IMMEDIATE между началом и COMMIT в журнал пишем только мы.
+
+        async with transaction() as tx:
+            await tx.execute(...)
+            await tx.execute(...)
+    """
+    if _tx_db is None:
+        raise RuntimeError("DB is not initialized. Call init_db() on startup.")
+    async with _tx_lock:
+        await _tx_db.execute("BEGIN IMMEDIATE")
+        started = time.monotonic()
+        try:
+            head = await _change_log_head(_tx_db)
+            yield _tx_db
+            tail = await _change_log_head(_tx_db) if head is not None else None
+        except BaseException:
+            await _tx_db.rollback()
+            raise
+        # диапазон регистрируем до COMMIT: ChangeBus может прочитать журнал,
+        # пока мы ещё ждём возврата из commit()
+        own = (head, tail) if head is not None and tail is not None and tail > head else None
+        if own is not None:
+            _own_changes.append(own)
+        try:
+            await _tx_db.commit()
+        except BaseException:
+            if own is not None:
+                _own_changes.remove(own)  # откат — эти id достанутся следующей записи
+            await _tx_db.rollback()
+            raise
+        held = time.monotonic() - started
+        if held > _TX_SLOW:
+            logging.warning("transaction() held the write lock for %.2fs", held)
+
+
 async def close_db() -> None:
-    global _db
+    global _db, _tx_db
+    if _tx_db is not None:
+        await _tx_db.close()
+        _tx_db = None
     if _db is not None:
         await _db.close()
         _db = None
\ No newline at end of file
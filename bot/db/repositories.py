@@ -2,10 +2,18 @@ from __future__ import annotations
 
 import json
 from dataclasses import dataclass
-from datetime import datetime, date
-from typing import Any, Optional, Sequence
+from datetime import datetime, date, timedelta
+from typing import Any, Iterable, Optional, Sequence
 
-from bot.db.database import get_db
+import aiosqlite
+
+from bot.config import get_settings
+from bot.db import codec, schema
+from bot.db.constants import PROMO_DURATIONS
+from bot.db.database import get_db, transaction
+from bot.models.reminder import Reminder
+from bot.services.catalog import FEED_ORDER_SQL, catalog
+from bot.utils.singleflight import event_flight
 
 
 # =========================
@@ -29,6 +37,7 @@ class Event:
     phone: str
     photo_ids: list[str]
     status: str
+    cover_file_id: Optional[str] = None
 
     # promo flags (optional)
     promoted_kind: Optional[str] = None  # "top" / "highlight" / "bump" ...
@@ -49,7 +58,10 @@ class PromoOrder:
     payload_json: dict[str, Any]
     created_at: str
     paid_at: Optional[str] = None
-    yk_payment_id: Optional[str] = None
+    provider_payment_id: Optional[str] = None
+    idempotence_key: Optional[str] = None
+    payment_status: Optional[str] = None
+    confirmation_url: Optional[str] = None
 
 
 # =========================
@@ -72,16 +84,39 @@ def _json_loads_safe(s: Any, default: Any):
         return default
 
 
-async def _table_info(table: str) -> set[str]:
+# колонки таблиц: после ensure_schema() схема не меняется до перезапуска
+_TABLE_COLUMNS: dict[str, frozenset[str]] = {}
+# schema.schema_generation, при котором заполнялся кэш
+_TABLE_COLUMNS_GEN = 0
+
+
+def reset_table_info() -> None:
+    """Сбросить кэш колонок."""
+    _TABLE_COLUMNS.clear()
+
+
+async def _table_info(table: str) -> frozenset[str]:
     """
     Returns set of column names for a table.
     IMPORTANT: uses aiosqlite cursor; must await execute/fetchall.
+    Результат кэшируется — PRAGMA выполняется один раз на таблицу.
     """
+    global _TABLE_COLUMNS_GEN
+    if _TABLE_COLUMNS_GEN != schema.schema_generation:
+        # ensure_schema() добавил колонки — кэш мог застать схему до миграций
+        reset_table_info()
+        _TABLE_COLUMNS_GEN = schema.schema_generation
+    cols = _TABLE_COLUMNS.get(table)
+    if cols is not None:
+        return cols
     db = get_db()  # NO await here!
     cur = await db.execute(f"PRAGMA table_info({table})")
     rows = await cur.fetchall()
     # rows: cid, name, type, notnull, dflt_value, pk
-    return {r[1] for r in rows}
+    cols = frozenset(r[1] for r in rows)
+    if cols:
+        _TABLE_COLUMNS[table] = cols
+    return cols
 
 
 def _row_to_event(row: Any) -> Event:
@@ -122,6 +157,7 @@ def _row_to_event(row: Any) -> Event:
         phone=str(_col(row, "phone", "") or ""),
         photo_ids=photos,
         status=str(_col(row, "status", "") or ""),
+        cover_file_id=str(_col(row, "cover_file_id", "") or "") or None,
         promoted_kind=str(_col(row, "promoted_kind", "") or "") or None,
         is_top=int(_col(row, "is_top", 0) or 0),
         is_highlight=int(_col(row, "is_highlight", 0) or 0),
@@ -144,7 +180,11 @@ def _row_to_order(row: Any) -> PromoOrder:
         payload_json=payload,
         created_at=str(_col(row, "created_at", "") or ""),
         paid_at=str(_col(row, "paid_at", "") or "") or None,
-        yk_payment_id=str(_col(row, "yk_payment_id", "") or "") or None,
+        # yk_payment_id — колонка старых БД, до provider_payment_id
+        provider_payment_id=str(_col(row, "provider_payment_id", "") or _col(row, "yk_payment_id", "") or "") or None,
+        idempotence_key=str(_col(row, "idempotence_key", "") or "") or None,
+        payment_status=str(_col(row, "payment_status", "") or "") or None,
+        confirmation_url=str(_col(row, "confirmation_url", "") or "") or None,
     )
 
 
@@ -229,6 +269,10 @@ async def create_event(
     # если в events есть photo_ids — пишем туда (старый вариант схемы)
     add("photo_ids", payload_photos)
 
+    # обложка = первая афиша; дальше её синхронизируют триггеры на event_photos
+    cover = next((str(fid) for fid in (photo_ids or []) if fid), None)
+    add("cover_file_id", cover)
+
     add("status", str(status))
 
     if not fields:
@@ -278,6 +322,15 @@ async def get_event(event_id: int) -> Optional[Event]:
     return _row_to_event(row) if row else None
 
 
+async def get_event_view(event_id: int) -> Optional[Event]:
+    """
+    get_event для показа в админке: двойной тап «Показать» — один SELECT (event_flight).
+    Склеенный вызов может вернуть состояние до только что закоммиченной записи,
+    поэтому после записи и в outbox-обработчиках — только get_event.
+    """
+    return await event_flight.do(int(event_id), lambda: get_event(int(event_id)))
+
+
 async def get_event_photos(event_id: int) -> list[str]:
     ev = await get_event(event_id)
     if not ev:
@@ -316,6 +369,54 @@ async def set_event_status(event_id: int, status: str) -> None:
         (str(status), int(event_id)),
     )
     await db.commit()
+    await catalog.refresh_event(event_id)
+
+
+async def moderate_event(event_id: int, status: str) -> bool:
+    """
+    Решение модерации ('approved' / 'rejected') и все его последствия — одной транзакцией:
+    организатору — outbox 'event_moderated'; при одобрении ещё задача оповещения
+    подписчиков категории и пост в канал (CHANNEL_ID). Побочные действия доставляют
+    фоновые обработчики уже после commit, поэтому ни одно не теряется.
+
+    Повторное нажатие (статус уже такой) — True, но без повторных уведомлений.
+    False — события нет.
+    """
+    ecols = await _table_info("events")
+    cols = ("updated_at", "approved_at") if status == "approved" else ("updated_at",)
+    touch = "".join(f", {col} = datetime('now')" for col in cols if col in ecols)
+    async with transaction() as tx:
+        cur = await tx.execute("SELECT organizer_id, title, status FROM events WHERE id = ?", (int(event_id),))
+        event = await cur.fetchone()
+        if event is None:
+            return False
+        if event["status"] == status:
+            return True
+        await tx.execute(f"UPDATE events SET status = ?{touch} WHERE id = ?", (str(status), int(event_id)))
+
+        stamp = datetime.now().isoformat(timespec="seconds")
+        await enqueue_outbox(
+            tx,
+            "event_moderated",
+            {
+                "event_id": int(event_id),
+                "organizer_id": int(event["organizer_id"]),
+                "title": str(event["title"] or ""),
+                "status": str(status),
+            },
+            dedupe_key=f"event_moderated:{int(event_id)}:{status}:{stamp}",
+        )
+        if status == "approved":
+            await enqueue_subscribers_broadcast(tx, event_id)
+            if get_settings().channel_id:
+                await enqueue_outbox(
+                    tx,
+                    "channel_post",
+                    {"event_id": int(event_id)},
+                    dedupe_key=f"channel_post:{int(event_id)}:{stamp}",
+                )
+    await catalog.refresh_event(event_id)
+    return True
 
 
 async def get_organizer_events(organizer_id: int, limit: int = 10, status: Optional[str] = None) -> list[Event]:
@@ -378,29 +479,136 @@ async def create_promo_order(
     await db.commit()
     return int(cur.lastrowid)
 
+
+# заказы, по которым ещё не пришёл итог оплаты; queued — платёж ещё не создан (ЮKassa была недоступна)
+UNSETTLED_ORDER_STATUSES = ("created", "new", "queued")
+
+
+def promo_idempotence_key(order_id: int) -> str:
+    """Ключ идемпотентности платежа выводится из заказа: повторная попытка = тот же платёж."""
+    return f"evn-promo-order-{int(order_id)}"
+
+
+async def find_open_order(organizer_id: int, event_id: int, service: str) -> Optional[PromoOrder]:
+    """Последний незакрытый заказ той же услуги — его оплату переиспользуем вместо новой."""
+    db = get_db()
+    marks = ", ".join("?" for _ in UNSETTLED_ORDER_STATUSES)
+    cur = await db.execute(
+        f"""
+        SELECT * FROM promo_orders
+        WHERE organizer_id = ? AND event_id = ? AND service = ? AND status IN ({marks})
+        ORDER BY id DESC
+        LIMIT 1
+        """,
+        (int(organizer_id), int(event_id), str(service), *UNSETTLED_ORDER_STATUSES),
+    )
+    row = await cur.fetchone()
+    return _row_to_order(row) if row else None
+
+
 async def get_order(order_id: int) -> Optional[PromoOrder]:
     db = get_db()
     cur = await db.execute("SELECT * FROM promo_orders WHERE id = ?", (int(order_id),))
     row = await cur.fetchone()
     return _row_to_order(row) if row else None
 
-async def mark_order_paid(order_id: int, yk_payment_id: Optional[str] = None) -> None:
+
+async def get_order_by_payment_id(payment_id: str) -> Optional[PromoOrder]:
+    """Заказ по id платежа ЮKassa (индекс idx_promo_orders_payment)."""
     db = get_db()
-    ocols = await _table_info("promo_orders")
-    paid_at = _now_iso()
+    cur = await db.execute(
+        "SELECT * FROM promo_orders WHERE provider_payment_id = ? ORDER BY id DESC LIMIT 1",
+        (str(payment_id),),
+    )
+    row = await cur.fetchone()
+    return _row_to_order(row) if row else None
 
-    if "yk_payment_id" in ocols:
-        await db.execute(
-            "UPDATE promo_orders SET status = 'paid', paid_at = ?, yk_payment_id = ? WHERE id = ?",
-            (paid_at, yk_payment_id, int(order_id)),
-        )
-    else:
-        await db.execute(
-            "UPDATE promo_orders SET status = 'paid', paid_at = ? WHERE id = ?",
-            (paid_at, int(order_id)),
-        )
+async def mark_order_paid(order_id: int, provider_payment_id: Optional[str] = None) -> bool:
+    """
+    Помечает заказ оплаченным. Идемпотентно: повторный вызов (вебхук + кнопка)
+    ничего не меняет и возвращает False.
+    """
+    db = get_db()
+    cur = await db.execute(
+        """
+        UPDATE promo_orders
+        SET status = 'paid', paid_at = ?, provider_payment_id = COALESCE(?, provider_payment_id)
+        WHERE id = ? AND status <> 'paid'
+        """,
+        (_now_iso(), provider_payment_id, int(order_id)),
+    )
+    await db.commit()
+    return (cur.rowcount or 0) > 0
 
+
+async def mark_order_canceled(order_id: int) -> bool:
+    """Отмена со стороны платёжки. Оплаченные заказы не трогаем."""
+    db = get_db()
+    cur = await db.execute(
+        """
+        UPDATE promo_orders SET status = 'canceled', payment_status = 'canceled'
+        WHERE id = ? AND status NOT IN ('paid', 'canceled')
+        """,
+        (int(order_id),),
+    )
     await db.commit()
+    return (cur.rowcount or 0) > 0
+
+
+async def get_unsettled_orders(
+    limit: int = 100,
+    after: Optional[tuple[str, int]] = None,
+) -> list[PromoOrder]:
+    """
+    Неоплаченные и неотменённые заказы по возрастанию created_at
+    (индекс idx_promo_orders_status_created). after — ключ (created_at, id)
+    последнего заказа предыдущей страницы.
+    """
+    db = get_db()
+    marks = ", ".join("?" for _ in UNSETTLED_ORDER_STATUSES)
+    sql = f"SELECT * FROM promo_orders WHERE status IN ({marks})"
+    params: list[Any] = list(UNSETTLED_ORDER_STATUSES)
+    if after is not None:
+        sql += " AND (created_at, id) > (?, ?)"
+        params += [str(after[0]), int(after[1])]
+    sql += " ORDER BY created_at, id LIMIT ?"
+    params.append(int(limit))
+    cur = await db.execute(sql, params)
+    rows = await cur.fetchall()
+    return [_row_to_order(r) for r in rows]
+
+
+async def mark_order_expired(order_id: int) -> bool:
+    """Брошенный заказ: оплату так и не довели до конца."""
+    db = get_db()
+    marks = ", ".join("?" for _ in UNSETTLED_ORDER_STATUSES)
+    cur = await db.execute(
+        f"UPDATE promo_orders SET status = 'expired' WHERE id = ? AND status IN ({marks})",
+        (int(order_id), *UNSETTLED_ORDER_STATUSES),
+    )
+    await db.commit()
+    return (cur.rowcount or 0) > 0
+
+async def mark_order_queued(order_id: int) -> bool:
+    """Платёж создать не удалось — заказ ждёт, пока ЮKassa снова станет доступна."""
+    db = get_db()
+    cur = await db.execute(
+        "UPDATE promo_orders SET status = 'queued' WHERE id = ? AND status IN ('created', 'new')",
+        (int(order_id),),
+    )
+    await db.commit()
+    return (cur.rowcount or 0) > 0
+
+
+async def mark_order_unqueued(order_id: int) -> bool:
+    """Платёж для отложенного заказа создан — дальше обычный путь created."""
+    db = get_db()
+    cur = await db.execute(
+        "UPDATE promo_orders SET status = 'created' WHERE id = ? AND status = 'queued'",
+        (int(order_id),),
+    )
+    await db.commit()
+    return (cur.rowcount or 0) > 0
 
 async def set_event_promoted(event_id: int, kind: str) -> None:
     """
@@ -432,71 +640,821 @@ async def set_event_promoted(event_id: int, kind: str) -> None:
 
     await db.execute(f"UPDATE events SET {set_sql} WHERE id = ?", params)
     await db.commit()
+    await catalog.refresh_event(event_id)
+
+# более сильное продвижение не перетираем более слабым (порядок как rank_score ленты)
+_PROMO_STRONGER: dict[str, tuple[str, ...]] = {
+    "top": (),
+    "highlight": ("top",),
+    "bump": ("top", "highlight"),
+}
+
+
+async def record_payment(
+    order_id: int,
+    payment_id: Optional[str],
+    status: Optional[str],
+    confirmation_url: Optional[str],
+    raw: Any,
+    source: str,
+) -> None:
+    """
+    Ответ/уведомление ЮKassa: в заказ — только поля, по которым работаем
+    (provider_payment_id, payment_status, confirmation_url), сырой ответ — в payment_events.
+    Пустые значения не затирают уже сохранённые.
+    """
+    db = get_db()
+    await db.execute(
+        """
+        UPDATE promo_orders
+        SET provider_payment_id = COALESCE(?, provider_payment_id),
+            payment_status = COALESCE(?, payment_status),
+            confirmation_url = COALESCE(?, confirmation_url)
+        WHERE id = ?
+        """,
+        (payment_id or None, status or None, confirmation_url or None, int(order_id)),
+    )
+    await add_payment_event(order_id, payment_id, source, status, raw, commit=False)
+    await db.commit()
 
-async def get_promoted_events_feed(limit: int = 10) -> list[Event]:
+
+async def add_payment_event(
+    order_id: int,
+    payment_id: Optional[str],
+    source: str,
+    status: Optional[str],
+    raw: Any,
+    commit: bool = True,
+) -> None:
+    """Дописывает сырой payload в payment_events (append-only, zlib для крупных тел)."""
+    db = get_db()
+    packed_codec, body = codec.pack(raw)
+    await db.execute(
+        """
+        INSERT INTO payment_events (order_id, payment_id, source, status, codec, body)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (int(order_id), payment_id or None, str(source), status or None, packed_codec, body),
+    )
+    if commit:
+        await db.commit()
+
+
+async def get_payment_events(order_id: int) -> list[dict[str, Any]]:
+    """История ответов ЮKassa по заказу (для разбора), от старых к новым."""
+    db = get_db()
+    cur = await db.execute(
+        "SELECT source, status, codec, body, created_at FROM payment_events WHERE order_id = ? ORDER BY id",
+        (int(order_id),),
+    )
+    return [
+        {
+            "source": r["source"],
+            "status": r["status"],
+            "created_at": r["created_at"],
+            "payload": codec.unpack(r["codec"], r["body"]),
+        }
+        for r in await cur.fetchall()
+    ]
+
+
+async def enqueue_outbox(
+    tx: aiosqlite.Connection,
+    kind: str,
+    payload: dict[str, Any],
+    dedupe_key: Optional[str] = None,
+) -> bool:
     """
-    Лента жителя: только approved + только проплаченные/промо.
-    Приоритет:
-      1) ТОП (is_top=1)
-      2) Подсветка (is_highlight=1)
-      3) Остальные промо (promoted_at / promoted_kind)
+    Кладёт побочное действие (сообщение и т.п.) в outbox внутри уже открытой транзакции.
+    Повтор с тем же dedupe_key игнорируется. Отправляет OutboxDispatcher.
+    """
+    cur = await tx.execute(
+        """
+        INSERT INTO outbox (kind, payload_json, dedupe_key)
+        VALUES (?, ?, ?)
+        ON CONFLICT(dedupe_key) DO NOTHING
+        """,
+        (str(kind), json.dumps(payload, ensure_ascii=False), dedupe_key),
+    )
+    return (cur.rowcount or 0) > 0
+
+
+async def settle_order(order_id: int, payment_id: str) -> Optional[PromoOrder]:
+    """
+    Оплата заказа одной транзакцией: заказ -> paid, услуга применена к событию
+    (promoted_until = сейчас + PROMO_DURATIONS) или поставлена задача рассылки (notify),
+    уведомление организатору в outbox.
+    Либо всё, либо ничего — падение посередине не оставит оплаченный заказ без продвижения.
+
+    Идемпотентно по payment_id: заказ уже оплачен или привязан к другому платежу -> None.
+    Вебхук, кнопка «✅ Я оплатил» и сверка могут прийти одновременно — заказ вернёт
+    только первый, и сообщение организатору (dedupe order_paid:<id>) тоже будет одно.
+    """
+    ecols = await _table_info("events")
+    payment_id = str(payment_id)
+    now = datetime.now()
+    paid_at = now.isoformat(timespec="seconds")
+
+    async with transaction() as tx:
+        cur = await tx.execute("SELECT * FROM promo_orders WHERE id = ?", (int(order_id),))
+        row = await cur.fetchone()
+        if row is None or str(row["status"]) == "paid":
+            return None
+        order = _row_to_order(row)
+        if order.provider_payment_id and order.provider_payment_id != payment_id:
+            return None
+
+        await tx.execute(
+            """
+            UPDATE promo_orders
+            SET status = 'paid', paid_at = ?, provider_payment_id = ?, payment_status = 'succeeded'
+            WHERE id = ?
+            """,
+            (paid_at, payment_id, int(order_id)),
+        )
+
+        kind = order.service
+        if kind in PROMO_DURATIONS:
+            stronger = _PROMO_STRONGER[kind]
+            marks = ", ".join("?" for _ in stronger) or "NULL"
+            sets = [f"promoted_kind = CASE WHEN promoted_kind IN ({marks}) THEN promoted_kind ELSE ? END"]
+            params: list[Any] = [*stronger, kind]
+
+            def add(col: str, expr: str, *values: Any) -> None:
+                if col in ecols:
+                    sets.append(f"{col} = {expr}")
+                    params.extend(values)
+
+            if kind == "highlight":
+                add("highlighted", "1")
+                add("is_highlight", "1")  # старые схемы
+            elif kind == "bump":
+                add("bumped_at", "?", paid_at)
+            elif kind == "top":
+                add("is_top", "1")  # старые схемы
+            add("promoted_at", "?", paid_at)
+            # докупка продлевает, а не обрезает уже оплаченный срок
+            until = (now + PROMO_DURATIONS[kind]).isoformat(timespec="seconds")
+            add("promoted_until", "max(COALESCE(promoted_until, ''), ?)", until)
+
+            await tx.execute(f"UPDATE events SET {', '.join(sets)} WHERE id = ?", (*params, int(order.event_id)))
+        elif kind == "notify":
+            # «📣 Оповещение всем»: рассылку ведёт BroadcastEngine, отчёт придёт организатору
+            await enqueue_broadcast(tx, order.event_id, organizer_id=order.organizer_id, order_id=order.id)
+
+        await enqueue_outbox(
+            tx,
+            "order_paid",
+            {
+                "order_id": order.id,
+                "organizer_id": order.organizer_id,
+                "event_id": order.event_id,
+                "service": order.service,
+            },
+            dedupe_key=f"order_paid:{order.id}",
+        )
+
+    order.status = "paid"
+    order.paid_at = paid_at
+    order.provider_payment_id = payment_id
+    order.payment_status = "succeeded"
+    if kind in PROMO_DURATIONS:
+        await catalog.refresh_event(order.event_id)
+    return order
+
+
+async def get_promotion_deadlines() -> list[tuple[str, int]]:
+    """
+    (promoted_until, event_id) всех действующих продвижений — для кучи планировщика.
+    Старые продвижения без срока получили его миграцией в ensure_schema.
+    """
+    db = get_db()
+    cur = await db.execute(
+        "SELECT promoted_until, id FROM events WHERE promoted_until IS NOT NULL AND promoted_until <> ''"
+    )
+    return [(str(r[0]), int(r[1])) for r in await cur.fetchall()]
+
+
+async def get_promoted_until(event_id: int) -> Optional[str]:
+    db = get_db()
+    cur = await db.execute("SELECT promoted_until FROM events WHERE id = ?", (int(event_id),))
+    row = await cur.fetchone()
+    return str(row[0]) if row and row[0] else None
+
+
+async def expire_promotions(now: Optional[datetime] = None, limit: int = 200) -> list[int]:
+    """
+    Снимает истёкшие продвижения (promoted_until <= now) пачкой до limit событий.
+    Строки ленты пересчитывают триггеры. Возвращает id затронутых событий.
     """
     db = get_db()
     ecols = await _table_info("events")
+    now_iso = (now or datetime.now()).isoformat(timespec="seconds")
+    legacy = "".join(f", {c} = 0" for c in ("is_top", "is_highlight") if c in ecols)
+    # execute_fetchall: RETURNING дочитывается в том же вызове — между шагами
+    # оператора не вклинится commit() другого хэндлера на общем подключении
+    rows = await db.execute_fetchall(
+        f"""
+        UPDATE events
+        SET promoted_kind = '', highlighted = 0, bumped_at = NULL, promoted_until = NULL{legacy}
+        WHERE id IN (
+            SELECT id FROM events
+            WHERE promoted_until IS NOT NULL AND promoted_until <> '' AND promoted_until <= ?
+            LIMIT ?
+        )
+        RETURNING id
+        """,
+        (now_iso, int(limit)),
+    )
+    ids = [int(r[0]) for r in rows]
+    await db.commit()
+    return ids
 
-    where_parts = ["status = 'approved'"]
-    promo_parts: list[str] = []
 
-    if "is_top" in ecols:
-        promo_parts.append("is_top = 1")
-    if "is_highlight" in ecols:
-        promo_parts.append("is_highlight = 1")
-    if "promoted_at" in ecols:
-        promo_parts.append("promoted_at IS NOT NULL")
-    if "promoted_kind" in ecols:
-        promo_parts.append("promoted_kind IS NOT NULL AND promoted_kind != ''")
+# =========================
+# USERS: REACHABILITY
+# =========================
+async def touch_users(
+    seen: Iterable[tuple[int, str]],
+    unreachable: Iterable[tuple[int, str]] = (),
+) -> None:
+    """
+    Пакетно: last_seen_at (новых пользователей заводим как resident, доступность
+    восстанавливаем) и unreachable_at для заблокировавших бота. Один commit.
+    """
+    db = get_db()
+    await db.executemany(
+        """
+        INSERT INTO users (user_id, last_seen_at) VALUES (?, ?)
+        ON CONFLICT(user_id) DO UPDATE
+        SET last_seen_at = max(COALESCE(last_seen_at, ''), excluded.last_seen_at), unreachable_at = NULL
+        """,
+        [(int(user_id), str(ts)) for user_id, ts in seen],
+    )
+    await db.executemany(
+        "UPDATE users SET unreachable_at = ? WHERE user_id = ?",
+        [(str(ts), int(user_id)) for user_id, ts in unreachable],
+    )
+    await db.commit()
 
-    # если в events вообще нет промо-колонок — пробуем через promo_orders
-    if not promo_parts:
-        # fallback: через paid orders
-        cur = await db.execute(
+
+async def get_reachable_users(active_days: Optional[int] = None, limit: int = 1000) -> list[int]:
+    """
+    Пользователи, не заблокировавшие бота (индекс idx_users_reachable);
+    active_days — только заходившие за последние N дней.
+    """
+    db = get_db()
+    sql = "SELECT user_id FROM users WHERE unreachable_at IS NULL"
+    params: list[Any] = []
+    if active_days is not None:
+        since = (datetime.now() - timedelta(days=int(active_days))).isoformat(timespec="seconds")
+        sql += " AND last_seen_at >= ?"
+        params.append(since)
+    sql += " ORDER BY last_seen_at DESC LIMIT ?"
+    params.append(int(limit))
+    cur = await db.execute(sql, params)
+    return [int(r[0]) for r in await cur.fetchall()]
+
+
+# =========================
+# SUBSCRIPTIONS
+# =========================
+async def get_subscriptions(user_id: int) -> list[aiosqlite.Row]:
+    """Подписки жителя: (category_code, days)."""
+    db = get_db()
+    cur = await db.execute(
+        "SELECT category_code, days FROM subscriptions WHERE user_id = ? ORDER BY category_code",
+        (int(user_id),),
+    )
+    return await cur.fetchall()
+
+
+async def toggle_subscription(user_id: int, category_code: int, days: Optional[int] = None) -> bool:
+    """Подписать / отписать от категории. True — теперь подписан."""
+    db = get_db()
+    cur = await db.execute(
+        "DELETE FROM subscriptions WHERE category_code = ? AND user_id = ?",
+        (int(category_code), int(user_id)),
+    )
+    if cur.rowcount:
+        await db.commit()
+        return False
+    await db.execute(
+        "INSERT INTO subscriptions (category_code, user_id, days) VALUES (?, ?, ?)",
+        (int(category_code), int(user_id), days),
+    )
+    await db.commit()
+    return True
+
+
+async def set_subscription_days(user_id: int, days: Optional[int]) -> None:
+    """Окно дат — одно на все подписки жителя."""
+    db = get_db()
+    await db.execute("UPDATE subscriptions SET days = ? WHERE user_id = ?", (days, int(user_id)))
+    await db.commit()
+
+
+# =========================
+# REMINDERS
+# =========================
+async def get_event_schedule(event_id: int) -> Optional[aiosqlite.Row]:
+    """(start_date, event_time) актуального события из feed_upcoming; None — события в ленте нет."""
+    db = get_db()
+    cur = await db.execute(
+        "SELECT start_date, event_time FROM feed_upcoming WHERE event_id = ?", (int(event_id),)
+    )
+    return await cur.fetchone()
+
+
+async def get_reminder(user_id: int, event_id: int) -> Optional[Reminder]:
+    db = get_db()
+    cur = await db.execute(
+        "SELECT * FROM reminders WHERE user_id = ? AND event_id = ?", (int(user_id), int(event_id))
+    )
+    row = await cur.fetchone()
+    return Reminder.from_row(row) if row else None
+
+
+async def set_reminder(user_id: int, event_id: int, remind_at: str) -> Reminder:
+    """Поставить (или переставить уже сработавшее/отменённое) напоминание."""
+    db = get_db()
+    await db.execute(
+        """
+        INSERT INTO reminders (user_id, event_id, remind_at) VALUES (?, ?, ?)
+        ON CONFLICT(user_id, event_id) DO UPDATE
+        SET remind_at = excluded.remind_at, status = 'pending', sent_at = NULL
+        """,
+        (int(user_id), int(event_id), str(remind_at)),
+    )
+    await db.commit()
+    return await get_reminder(user_id, event_id)
+
+
+async def cancel_reminder(user_id: int, event_id: int) -> bool:
+    db = get_db()
+    cur = await db.execute(
+        "UPDATE reminders SET status = 'canceled' WHERE user_id = ? AND event_id = ? AND status = 'pending'",
+        (int(user_id), int(event_id)),
+    )
+    await db.commit()
+    return (cur.rowcount or 0) > 0
+
+
+async def get_reminder_window(until: str, after: Optional[str] = None) -> list[tuple[str, int]]:
+    """
+    (remind_at, id) ожидающих напоминаний до until (после after, если задан) —
+    диапазон по частичному индексу idx_reminders_due, без просмотра всей таблицы.
+    """
+    db = get_db()
+    sql = "SELECT remind_at, id FROM reminders WHERE status = 'pending' AND remind_at <= ?"
+    params: list[Any] = [str(until)]
+    if after is not None:
+        sql += " AND remind_at > ?"
+        params.append(str(after))
+    rows = await db.execute_fetchall(sql + " ORDER BY remind_at", params)
+    return [(str(r[0]), int(r[1])) for r in rows]
+
+
+async def queue_due_reminders(now: datetime, limit: int = 500) -> int:
+    """
+    Наступившие напоминания (до limit штук) -> outbox 'reminder' и статус queued —
+    одной транзакцией: после падения напоминание либо в очереди, либо ещё pending.
+    """
+    now_iso = now.isoformat(timespec="seconds")
+    due = """
+        SELECT id FROM reminders
+        WHERE status = 'pending' AND remind_at <= :now
+        ORDER BY remind_at, id
+        LIMIT :limit
+    """
+    params = {"now": now_iso, "limit": int(limit)}
+    async with transaction() as tx:
+        await tx.execute(
+            f"""
+            INSERT OR IGNORE INTO outbox (kind, payload_json, dedupe_key)
+            SELECT
+                'reminder',
+                json_object('reminder_id', id, 'user_id', user_id, 'event_id', event_id),
+                'reminder:' || id || ':' || remind_at
+            FROM reminders
+            WHERE id IN ({due})
+            """,
+            params,
+        )
+        cur = await tx.execute(
+            f"UPDATE reminders SET status = 'queued', sent_at = :now WHERE id IN ({due})",
+            params,
+        )
+        return int(cur.rowcount or 0)
+
+
+# =========================
+# CHANNEL POSTS
+# =========================
+async def get_channel_post(event_id: int) -> Optional[aiosqlite.Row]:
+    db = get_db()
+    cur = await db.execute("SELECT * FROM channel_posts WHERE event_id = ?", (int(event_id),))
+    return await cur.fetchone()
+
+
+async def save_channel_post(
+    event_id: int, chat_id: str, message_id: int, has_photo: bool, cover_file_id: Optional[str]
+) -> None:
+    db = get_db()
+    await db.execute(
+        """
+        INSERT INTO channel_posts (event_id, chat_id, message_id, has_photo, cover_file_id)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(event_id) DO UPDATE SET
+            chat_id = excluded.chat_id,
+            message_id = excluded.message_id,
+            has_photo = excluded.has_photo,
+            cover_file_id = excluded.cover_file_id,
+            synced_version = version,
+            posted_at = datetime('now')
+        """,
+        (int(event_id), str(chat_id), int(message_id), 1 if has_photo else 0, cover_file_id),
+    )
+    await db.commit()
+
+
+async def mark_channel_post_synced(event_id: int, version: int, cover_file_id: Optional[str]) -> None:
+    db = get_db()
+    await db.execute(
+        """
+        UPDATE channel_posts
+        SET synced_version = max(synced_version, ?), cover_file_id = ?, updated_at = datetime('now')
+        WHERE event_id = ?
+        """,
+        (int(version), cover_file_id, int(event_id)),
+    )
+    await db.commit()
+
+
+async def delete_channel_post(event_id: int) -> None:
+    db = get_db()
+    await db.execute("DELETE FROM channel_posts WHERE event_id = ?", (int(event_id),))
+    await db.commit()
+
+
+# =========================
+# DIGEST
+# =========================
+async def get_digest_enabled(user_id: int) -> bool:
+    db = get_db()
+    cur = await db.execute("SELECT enabled FROM digest_cursors WHERE user_id = ?", (int(user_id),))
+    row = await cur.fetchone()
+    return bool(row and row["enabled"])
+
+
+async def set_digest_enabled(user_id: int, enabled: bool) -> None:
+    """Курсор при повторном включении не сбрасываем — старое второй раз не придёт."""
+    db = get_db()
+    await db.execute(
+        """
+        INSERT INTO digest_cursors (user_id, enabled) VALUES (?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET enabled = excluded.enabled
+        """,
+        (int(user_id), 1 if enabled else 0),
+    )
+    await db.commit()
+
+
+async def enqueue_digests(today: str, size: int = 5) -> int:
+    """
+    Дайджесты за день today (локальная дата) — в outbox одним INSERT ... SELECT.
+
+    Для каждого включившего дайджест, кто ещё не получал его сегодня: события ленты,
+    одобренные после его курсора, в категориях его подписок (без подписок — все),
+    ранжированные как лента (FEED_ORDER_SQL); ROW_NUMBER() оставляет первые size.
+    Курсоры и last_digest_on сдвигаются в той же транзакции — повторный запуск
+    в тот же день ничего не добавит (и dedupe_key digest:<user>:<дата> тоже).
+    Возвращает число поставленных дайджестов.
+    """
+    async with transaction() as tx:
+        cur = await tx.execute(
+            f"""
+            INSERT OR IGNORE INTO outbox (kind, payload_json, dedupe_key)
+            SELECT
+                'digest',
+                json_object('user_id', user_id, 'event_ids', json_group_array(event_id)),
+                'digest:' || user_id || ':' || :today
+            FROM (
+                SELECT
+                    d.user_id,
+                    f.event_id,
+                    ROW_NUMBER() OVER (PARTITION BY d.user_id ORDER BY {FEED_ORDER_SQL}) AS rn
+                FROM digest_cursors d
+                JOIN events e ON e.approved_at > COALESCE(d.cursor_at, '')
+                JOIN feed_upcoming f ON f.event_id = e.id
+                WHERE d.enabled = 1
+                  AND COALESCE(d.last_digest_on, '') < :today
+                  AND e.status = 'approved'
+                  AND e.organizer_id <> d.user_id
+                  AND f.end_date >= :today
+                  AND (
+                      NOT EXISTS (SELECT 1 FROM subscriptions s WHERE s.user_id = d.user_id)
+                      OR EXISTS (
+                          SELECT 1 FROM subscriptions s
+                          WHERE s.category_code = f.category_code AND s.user_id = d.user_id
+                      )
+                  )
+                  AND NOT EXISTS (
+                      SELECT 1 FROM users u WHERE u.user_id = d.user_id AND u.unreachable_at IS NOT NULL
+                  )
+                ORDER BY d.user_id, rn
+            )
+            WHERE rn <= :size
+            GROUP BY user_id
+            """,
+            {"today": str(today), "size": int(size)},
+        )
+        queued = int(cur.rowcount or 0)
+        await tx.execute(
             """
-            SELECT e.*
-            FROM events e
-            JOIN promo_orders p ON p.event_id = e.id
-            WHERE e.status='approved' AND p.status='paid'
-            ORDER BY p.paid_at DESC, e.id DESC
-            LIMIT ?
+            UPDATE digest_cursors
+            SET cursor_at = datetime('now'), last_digest_on = :today
+            WHERE enabled = 1 AND COALESCE(last_digest_on, '') < :today
             """,
-            (int(limit),),
+            {"today": str(today)},
         )
-        rows = await cur.fetchall()
-        return [_row_to_event(r) for r in rows]
+    return queued
 
-    where_parts.append("(" + " OR ".join(promo_parts) + ")")
 
-    # сортировка: ТОП выше, затем highlight, затем по promoted_at desc, затем по id
-    order_parts: list[str] = []
-    if "is_top" in ecols:
-        order_parts.append("is_top DESC")
-    if "is_highlight" in ecols:
-        order_parts.append("is_highlight DESC")
-    if "promoted_at" in ecols:
-        order_parts.append("promoted_at DESC")
-    order_parts.append("id DESC")
-
-    sql = f"""
-        SELECT *
-        FROM events
-        WHERE {' AND '.join(where_parts)}
-        ORDER BY {', '.join(order_parts)}
-        LIMIT ?
+# =========================
+# BROADCASTS
+# =========================
+async def enqueue_broadcast(
+    tx: aiosqlite.Connection,
+    event_id: int,
+    organizer_id: Optional[int] = None,
+    order_id: Optional[int] = None,
+    audience: str = "all",
+) -> bool:
     """
+    Задача рассылки карточки события внутри открытой транзакции.
+    Одна задача на заказ (order_id UNIQUE). organizer_id — кому прислать отчёт.
+    """
+    cur = await tx.execute(
+        """
+        INSERT INTO broadcast_jobs (event_id, organizer_id, order_id, audience)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(order_id) DO NOTHING
+        """,
+        (int(event_id), organizer_id, order_id, str(audience)),
+    )
+    return (cur.rowcount or 0) > 0
+
+
+async def enqueue_subscribers_broadcast(tx: aiosqlite.Connection, event_id: int) -> int:
+    """
+    Оповещение подписчиков категории о новом событии — внутри транзакции одобрения.
+
+    Строка feed_upcoming уже пересчитана триггером, поэтому подписчики находятся
+    одним запросом по первичному ключу subscriptions (category_code, user_id) с
+    учётом окна дат; снимок сразу пишется в broadcast_recipients, задача уходит
+    в running — дальше её ведёт BroadcastEngine в общем темпе. Одно событие —
+    одна такая задача (повторное одобрение подписчиков не дёргает).
+    """
+    cur = await tx.execute(
+        """
+        INSERT INTO broadcast_jobs (event_id, audience, status, started_at)
+        SELECT ?, 'subscribers', 'running', datetime('now')
+        WHERE NOT EXISTS (
+            SELECT 1 FROM broadcast_jobs WHERE event_id = ? AND audience = 'subscribers'
+        )
+        """,
+        (int(event_id), int(event_id)),
+    )
+    if not cur.rowcount:
+        return 0
+    job_id = int(cur.lastrowid)
+    cur = await tx.execute(
+        """
+        INSERT OR IGNORE INTO broadcast_recipients (job_id, user_id)
+        SELECT ?, s.user_id
+        FROM feed_upcoming f
+        JOIN events e ON e.id = f.event_id
+        JOIN subscriptions s ON s.category_code = f.category_code
+        WHERE f.event_id = ?
+          AND s.user_id <> e.organizer_id
+          AND (s.days IS NULL OR f.start_date <= date('now', 'localtime', '+' || max(s.days - 1, 0) || ' days'))
+          AND NOT EXISTS (
+              SELECT 1 FROM users u WHERE u.user_id = s.user_id AND u.unreachable_at IS NOT NULL
+          )
+        """,
+        (job_id, int(event_id)),
+    )
+    total = int(cur.rowcount or 0)
+    if not total:
+        # подписчиков нет — задача не нужна (отметку «уже оповещали» не оставляем)
+        await tx.execute("DELETE FROM broadcast_jobs WHERE id = ?", (job_id,))
+        return 0
+    await tx.execute("UPDATE broadcast_jobs SET total = ? WHERE id = ?", (total, job_id))
+    return total
+
+
+async def get_next_broadcast_job() -> Optional[aiosqlite.Row]:
+    """
+    Сначала рассылки подписчикам (push об одобрении не ждёт «📣 Оповещение всем»
+    на 100k получателей), потом прерванная (running), потом самая старая pending.
+    """
+    db = get_db()
+    cur = await db.execute(
+        """
+        SELECT * FROM broadcast_jobs
+        WHERE status IN ('running', 'pending')
+        ORDER BY audience = 'subscribers' DESC, status = 'running' DESC, id
+        LIMIT 1
+        """
+    )
+    return await cur.fetchone()
+
+
+async def get_broadcast_job(job_id: int) -> Optional[aiosqlite.Row]:
+    db = get_db()
+    cur = await db.execute("SELECT * FROM broadcast_jobs WHERE id = ?", (int(job_id),))
+    return await cur.fetchone()
+
+
+async def start_broadcast_job(job_id: int) -> int:
+    """
+    Снимок получателей одним INSERT ... SELECT и перевод задачи в running —
+    одной транзакцией: после падения снимок либо целиком есть, либо его нет.
+    """
+    async with transaction() as tx:
+        cur = await tx.execute(
+            "SELECT organizer_id, audience, status FROM broadcast_jobs WHERE id = ?", (int(job_id),)
+        )
+        job = await cur.fetchone()
+        if job is None or job["status"] != "pending":
+            return 0
+        cur = await tx.execute(
+            """
+            INSERT OR IGNORE INTO broadcast_recipients (job_id, user_id)
+            SELECT ?, user_id FROM users
+            WHERE user_id > 0 AND user_id <> COALESCE(?, 0) AND unreachable_at IS NULL
+            """,
+            (int(job_id), job["organizer_id"]),
+        )
+        total = int(cur.rowcount or 0)
+        await tx.execute(
+            "UPDATE broadcast_jobs SET status = 'running', total = ?, started_at = datetime('now') WHERE id = ?",
+            (total, int(job_id)),
+        )
+    return total
+
+
+async def get_broadcast_batch(job_id: int, after_user_id: int, limit: int) -> list[int]:
+    db = get_db()
+    cur = await db.execute(
+        """
+        SELECT user_id FROM broadcast_recipients
+        WHERE job_id = ? AND user_id > ? AND status = 'pending'
+        ORDER BY user_id
+        LIMIT ?
+        """,
+        (int(job_id), int(after_user_id), int(limit)),
+    )
+    return [int(r[0]) for r in await cur.fetchall()]
+
+
+async def checkpoint_broadcast(job_id: int, results: Sequence[tuple[int, str, Optional[str]]]) -> None:
+    """results: (user_id, 'sent' | 'failed' | 'blocked', error) — статусы и счётчики одной транзакцией."""
+    if not results:
+        return
+    sent = sum(1 for _, status, _ in results if status == "sent")
+    async with transaction() as tx:
+        await tx.executemany(
+            "UPDATE broadcast_recipients SET status = ?, error = ? WHERE job_id = ? AND user_id = ?",
+            [(status, error, int(job_id), int(user_id)) for user_id, status, error in results],
+        )
+        await tx.execute(
+            """
+            UPDATE broadcast_jobs
+            SET sent = sent + ?, failed = failed + ?, last_user_id = max(last_user_id, ?)
+            WHERE id = ?
+            """,
+            (sent, len(results) - sent, max(int(r[0]) for r in results), int(job_id)),
+        )
+
+
+async def finish_broadcast_job(job_id: int) -> None:
+    """Задача done + отчёт организатору в outbox (если задача от заказа)."""
+    async with transaction() as tx:
+        cur = await tx.execute(
+            """
+            UPDATE broadcast_jobs SET status = 'done', finished_at = datetime('now')
+            WHERE id = ? AND status = 'running'
+            """,
+            (int(job_id),),
+        )
+        if not cur.rowcount:
+            return
+        cur = await tx.execute("SELECT * FROM broadcast_jobs WHERE id = ?", (int(job_id),))
+        job = await cur.fetchone()
+        if job["organizer_id"]:
+            await enqueue_outbox(
+                tx,
+                "broadcast_report",
+                {
+                    "job_id": int(job["id"]),
+                    "organizer_id": int(job["organizer_id"]),
+                    "event_id": int(job["event_id"]),
+                    "total": int(job["total"]),
+                    "sent": int(job["sent"]),
+                    "failed": int(job["failed"]),
+                },
+                dedupe_key=f"broadcast_report:{int(job['id'])}",
+            )
+
+
+async def get_due_outbox(limit: int = 50) -> list[aiosqlite.Row]:
+    db = get_db()
+    cur = await db.execute(
+        """
+        SELECT * FROM outbox
+        WHERE status = 'pending' AND next_attempt_at <= datetime('now')
+        -- дайджесты (тысячи записей разом) пропускают вперёд уведомления об оплате и т.п.
+        ORDER BY kind = 'digest', next_attempt_at, id
+        LIMIT ?
+        """,
+        (int(limit),),
+    )
+    return list(await cur.fetchall())
+
+
+async def mark_outbox_sent(outbox_id: int) -> None:
+    db = get_db()
+    await db.execute(
+        "UPDATE outbox SET status = 'sent', sent_at = datetime('now'), attempts = attempts + 1 WHERE id = ?",
+        (int(outbox_id),),
+    )
+    await db.commit()
 
-    cur = await db.execute(sql, (int(limit),))
+
+async def mark_outbox_failed(outbox_id: int, error: str, retry_in: Optional[float]) -> None:
+    """retry_in=None — попытки исчерпаны, запись остаётся в outbox со статусом failed."""
+    db = get_db()
+    if retry_in is None:
+        await db.execute(
+            "UPDATE outbox SET status = 'failed', attempts = attempts + 1, last_error = ? WHERE id = ?",
+            (error[:500], int(outbox_id)),
+        )
+    else:
+        await db.execute(
+            """
+            UPDATE outbox
+            SET attempts = attempts + 1, last_error = ?,
+                next_attempt_at = datetime('now', printf('+%d seconds', ?))
+            WHERE id = ?
+            """,
+            (error[:500], int(retry_in), int(outbox_id)),
+        )
+    await db.commit()
+
+
+async def get_promoted_events_feed(limit: int = 10) -> list[Event]:
+    """
+    Лента жителя: только approved + только проплаченные/промо.
+    Читаем из материализованной feed_upcoming (её ведут триггеры), а не из events.
+    Приоритет:
+      1) ТОП
+      2) Подсветка
+      3) Остальные промо / оплаченные заказы
+    """
+    db = get_db()
+    cur = await db.execute(
+        """
+        SELECT e.*
+        FROM feed_upcoming f
+        JOIN events e ON e.id = f.event_id
+        WHERE f.is_top = 1 OR f.paid_at IS NOT NULL
+        ORDER BY f.rank_score DESC, f.highlighted DESC, f.paid_at DESC, f.event_id DESC
+        LIMIT ?
+        """,
+        (int(limit),),
+    )
     rows = await cur.fetchall()
     return [_row_to_event(r) for r in rows]
 
+
+async def sweep_feed_upcoming(now: Optional[datetime] = None) -> int:
+    """Убирает из feed_upcoming завершившиеся события. Возвращает число удалённых строк."""
+    now = now or datetime.now()
+    today = now.date().isoformat()
+    db = get_db()
+    cur = await db.execute(
+        """
+        DELETE FROM feed_upcoming
+        WHERE end_date < ?
+           OR (end_date = ? AND end_time <> '' AND end_time < ?)
+        """,
+        (today, today, now.strftime("%H:%M:%S")),
+    )
+    await db.commit()
+    return int(cur.rowcount or 0)
+
 # =========================
 # Repo wrapper (как у тебя в коде)
 # =========================
@@ -613,9 +1571,7 @@ class Repo:
         # --- 2) Fallback: старое поведение (если кто-то создаёт событие "кусочками") ---
         db = get_db()
 
-        cur = await db.execute("PRAGMA table_info(events)")
-        rows = await cur.fetchall()
-        cols = {r["name"] for r in rows}
+        cols = await _table_info("events")
 
         if "organizer_id" not in kwargs:
             raise ValueError("create_event: missing required field 'organizer_id'")
@@ -642,6 +1598,9 @@ class Repo:
     async def get_event(self, event_id: int) -> Optional[Event]:
         return await get_event(event_id)
 
+    async def get_event_view(self, event_id: int) -> Optional[Event]:
+        return await get_event_view(event_id)
+
     async def get_event_photos(self, event_id: int) -> list[str]:
         return await get_event_photos(event_id)
 
@@ -669,154 +1628,56 @@ class Repo:
         amt = amount_rub if amount_rub is not None else (amount if amount is not None else 0)
 
         db = get_db()  # ВАЖНО: без await (у тебя это уже всплывало с threads can only be started once)
+        ocols = await _table_info("promo_orders")
+        # в старых базах осталась колонка amount_rub NOT NULL
+        legacy_amount = ", amount_rub" if "amount_rub" in ocols else ""
         cur = await db.execute(
-            """
-            INSERT INTO promo_orders(organizer_id, event_id, service, amount, currency, status, provider, payload_json)
-            VALUES(?, ?, ?, ?, ?, 'created', 'yookassa', ?)
+            f"""
+            INSERT INTO promo_orders(organizer_id, event_id, service, amount, currency, status, provider, payload_json{legacy_amount})
+            VALUES(?, ?, ?, ?, ?, 'created', 'yookassa', ?{", ?" if legacy_amount else ""})
             """,
-            (int(organizer_id), int(event_id), str(service), int(amt), str(currency), str(payload_json)),
+            (int(organizer_id), int(event_id), str(service), int(amt), str(currency), str(payload_json))
+            + ((int(amt),) if legacy_amount else ()),
         )
+        order_id = int(cur.lastrowid)
+        if "idempotence_key" in ocols:
+            await db.execute(
+                "UPDATE promo_orders SET idempotence_key = ? WHERE id = ?",
+                (promo_idempotence_key(order_id), order_id),
+            )
         await db.commit()
-        return int(cur.lastrowid)
+        return order_id
 
-    async def set_order_payload(self, order_id: int, payload: object) -> None:
+    async def set_order_payload(self, order_id: int, payload: dict[str, Any], source: str = "create") -> None:
         """
-        Сохраняет payload (ответ YooKassa) в promo_orders.payload_json.
-        Если в таблице есть колонка yk_payment_id — положит туда payment.id.
-        Статусы/paid_at НЕ трогает.
+        Сохраняет ответ YooKassa по заказу: {id, status, confirmation_url, raw}
+        (наш dict) или сырой ответ API. Статусы заказа/paid_at НЕ трогает.
         """
-        import json
-        import datetime
-        import decimal
-        from bot.db.database import get_db
-
-        db = get_db()
-
-        # узнаем колонки promo_orders
-        cur = await db.execute("PRAGMA table_info(promo_orders)")
-        rows = await cur.fetchall()
-
-        def _colname(r):
-            try:
-                # aiosqlite.Row поддерживает доступ по индексу
-                return r[1]
-            except Exception:
-                try:
-                    return r.get("name")
-                except Exception:
-                    return None
-
-        cols = {c for c in (_colname(r) for r in rows) if c}
-
-        # ---- нормализация payload -> JSON-friendly ----
-        def _to_jsonable(obj, *, _depth=0, _seen=None):
-            if _seen is None:
-                _seen = set()
-
-            # ограничим глубину, чтобы не зависнуть на циклических структурах
-            if _depth > 8:
-                return str(obj)
-
-            # None / базовые типы
-            if obj is None or isinstance(obj, (str, int, float, bool)):
-                return obj
-
-            # Decimal -> str (или float, но str безопаснее)
-            if isinstance(obj, decimal.Decimal):
-                return str(obj)
-
-            # date/datetime -> ISO
-            if isinstance(obj, (datetime.datetime, datetime.date)):
-                try:
-                    return obj.isoformat()
-                except Exception:
-                    return str(obj)
-
-            # bytes -> decode
-            if isinstance(obj, (bytes, bytearray)):
-                try:
-                    return obj.decode("utf-8", errors="replace")
-                except Exception:
-                    return str(obj)
-
-            obj_id = id(obj)
-            if obj_id in _seen:
-                return "<recursive>"
-            _seen.add(obj_id)
-
-            # dict
-            if isinstance(obj, dict):
-                return {
-                    str(k): _to_jsonable(v, _depth=_depth + 1, _seen=_seen)
-                    for k, v in obj.items()
-                }
-
-            # list/tuple/set
-            if isinstance(obj, (list, tuple, set)):
-                return [_to_jsonable(v, _depth=_depth + 1, _seen=_seen) for v in obj]
-
-            # YooKassa SDK часто умеет отдавать dict
-            for meth in ("to_dict", "dict", "json"):
-                if hasattr(obj, meth) and callable(getattr(obj, meth)):
-                    try:
-                        val = getattr(obj, meth)()
-                        # .json() иногда возвращает строку JSON — попробуем распарсить
-                        if isinstance(val, str):
-                            try:
-                                return json.loads(val)
-                            except Exception:
-                                return val
-                        return _to_jsonable(val, _depth=_depth + 1, _seen=_seen)
-                    except Exception:
-                        pass
-
-            # __dict__
-            try:
-                d = vars(obj)
-                return _to_jsonable(d, _depth=_depth + 1, _seen=_seen)
-            except Exception:
-                pass
-
-            # fallback
-            return str(obj)
-
-        data = _to_jsonable(payload)
-
-        # payment_id достаём максимально мягко
-        payment_id = None
-        if isinstance(data, dict):
-            payment_id = data.get("id") or data.get("payment_id")
-            # если payload наш (с ключом raw)
-            if not payment_id and isinstance(data.get("raw"), dict):
-                payment_id = data["raw"].get("id")
-
-        payload_json = json.dumps(data, ensure_ascii=False)
-
-        if "yk_payment_id" in cols:
-            await db.execute(
-                "UPDATE promo_orders SET payload_json = ?, yk_payment_id = ? WHERE id = ?",
-                (payload_json, payment_id, int(order_id)),
-            )
-        else:
-            await db.execute(
-                "UPDATE promo_orders SET payload_json = ? WHERE id = ?",
-                (payload_json, int(order_id)),
-            )
-
-        await db.commit()
+        raw = payload.get("raw") if isinstance(payload.get("raw"), dict) else payload
+        confirmation = raw.get("confirmation") if isinstance(raw.get("confirmation"), dict) else {}
+        await record_payment(
+            order_id,
+            payment_id=str(payload.get("id") or payload.get("payment_id") or raw.get("id") or "") or None,
+            status=str(payload.get("status") or raw.get("status") or "") or None,
+            confirmation_url=payload.get("confirmation_url") or confirmation.get("confirmation_url"),
+            raw=raw,
+            source=source,
+        )
 
     async def set_promo_payment_data(self, order_id: int, payment_id: str, confirmation_url: str,
                                      payload_json: str) -> None:
-        db = get_db()
-        await db.execute(
-            """
-            UPDATE promo_orders
-            SET payload_json = ?
-            WHERE id = ?
-            """,
-            (payload_json, int(order_id)),
+        raw = _json_loads_safe(payload_json, {})
+        if not isinstance(raw, dict):
+            raw = {}
+        await record_payment(
+            order_id,
+            payment_id=str(payment_id),
+            status=str(raw.get("status") or "") or None,
+            confirmation_url=confirmation_url,
+            raw=raw,
+            source="create",
         )
-        await db.commit()
+
     async def mark_promo_paid(self, order_id: int) -> None:
         db = get_db()
         await db.execute(
@@ -828,15 +1689,157 @@ class Repo:
     async def get_order(self, order_id: int) -> Optional[PromoOrder]:
         return await get_order(order_id)
 
-    async def mark_order_paid(self, order_id: int, yk_payment_id: Optional[str] = None) -> None:
-        return await mark_order_paid(order_id=order_id, yk_payment_id=yk_payment_id)
+    async def find_open_order(self, organizer_id: int, event_id: int, service: str) -> Optional[PromoOrder]:
+        return await find_open_order(organizer_id=organizer_id, event_id=event_id, service=service)
+
+    async def get_order_by_payment_id(self, payment_id: str) -> Optional[PromoOrder]:
+        return await get_order_by_payment_id(payment_id=payment_id)
+
+    async def record_payment(
+        self,
+        order_id: int,
+        payment_id: Optional[str],
+        status: Optional[str],
+        confirmation_url: Optional[str],
+        raw: Any,
+        source: str,
+    ) -> None:
+        return await record_payment(order_id, payment_id, status, confirmation_url, raw, source)
+
+    async def add_payment_event(
+        self, order_id: int, payment_id: Optional[str], source: str, status: Optional[str], raw: Any
+    ) -> None:
+        return await add_payment_event(order_id, payment_id, source, status, raw)
+
+    async def get_payment_events(self, order_id: int) -> list[dict[str, Any]]:
+        return await get_payment_events(order_id=order_id)
+
+    async def mark_order_paid(self, order_id: int, provider_payment_id: Optional[str] = None) -> bool:
+        return await mark_order_paid(order_id=order_id, provider_payment_id=provider_payment_id)
+
+    async def mark_order_canceled(self, order_id: int) -> bool:
+        return await mark_order_canceled(order_id=order_id)
+
+    async def get_unsettled_orders(
+        self, limit: int = 100, after: Optional[tuple[str, int]] = None
+    ) -> list[PromoOrder]:
+        return await get_unsettled_orders(limit=limit, after=after)
+
+    async def mark_order_expired(self, order_id: int) -> bool:
+        return await mark_order_expired(order_id=order_id)
+
+    async def mark_order_queued(self, order_id: int) -> bool:
+        return await mark_order_queued(order_id=order_id)
+
+    async def mark_order_unqueued(self, order_id: int) -> bool:
+        return await mark_order_unqueued(order_id=order_id)
 
     async def set_event_promoted(self, event_id: int, kind: str) -> None:
         return await set_event_promoted(event_id=event_id, kind=kind)
 
+    async def settle_order(self, order_id: int, payment_id: str) -> Optional[PromoOrder]:
+        return await settle_order(order_id=order_id, payment_id=payment_id)
+
+    async def get_promotion_deadlines(self) -> list[tuple[str, int]]:
+        return await get_promotion_deadlines()
+
+    async def get_promoted_until(self, event_id: int) -> Optional[str]:
+        return await get_promoted_until(event_id=event_id)
+
+    async def expire_promotions(self, now: Optional[datetime] = None, limit: int = 200) -> list[int]:
+        return await expire_promotions(now=now, limit=limit)
+
+    async def touch_users(
+        self, seen: Iterable[tuple[int, str]], unreachable: Iterable[tuple[int, str]] = ()
+    ) -> None:
+        return await touch_users(seen, unreachable)
+
+    async def get_reachable_users(self, active_days: Optional[int] = None, limit: int = 1000) -> list[int]:
+        return await get_reachable_users(active_days=active_days, limit=limit)
+
+    async def get_subscriptions(self, user_id: int) -> list[aiosqlite.Row]:
+        return await get_subscriptions(user_id)
+
+    async def toggle_subscription(self, user_id: int, category_code: int, days: Optional[int] = None) -> bool:
+        return await toggle_subscription(user_id, category_code, days)
+
+    async def set_subscription_days(self, user_id: int, days: Optional[int]) -> None:
+        return await set_subscription_days(user_id, days)
+
+    async def get_event_schedule(self, event_id: int) -> Optional[aiosqlite.Row]:
+        return await get_event_schedule(event_id)
+
+    async def get_reminder(self, user_id: int, event_id: int) -> Optional[Reminder]:
+        return await get_reminder(user_id, event_id)
+
+    async def set_reminder(self, user_id: int, event_id: int, remind_at: str) -> Reminder:
+        return await set_reminder(user_id, event_id, remind_at)
+
+    async def cancel_reminder(self, user_id: int, event_id: int) -> bool:
+        return await cancel_reminder(user_id, event_id)
+
+    async def get_reminder_window(self, until: str, after: Optional[str] = None) -> list[tuple[str, int]]:
+        return await get_reminder_window(until, after)
+
+    async def queue_due_reminders(self, now: datetime, limit: int = 500) -> int:
+        return await queue_due_reminders(now, limit)
+
+    async def get_channel_post(self, event_id: int) -> Optional[aiosqlite.Row]:
+        return await get_channel_post(event_id)
+
+    async def save_channel_post(
+        self, event_id: int, chat_id: str, message_id: int, has_photo: bool, cover_file_id: Optional[str]
+    ) -> None:
+        return await save_channel_post(event_id, chat_id, message_id, has_photo, cover_file_id)
+
+    async def mark_channel_post_synced(self, event_id: int, version: int, cover_file_id: Optional[str]) -> None:
+        return await mark_channel_post_synced(event_id, version, cover_file_id)
+
+    async def delete_channel_post(self, event_id: int) -> None:
+        return await delete_channel_post(event_id)
+
+    async def get_digest_enabled(self, user_id: int) -> bool:
+        return await get_digest_enabled(user_id)
+
+    async def set_digest_enabled(self, user_id: int, enabled: bool) -> None:
+        return await set_digest_enabled(user_id, enabled)
+
+    async def enqueue_digests(self, today: str, size: int = 5) -> int:
+        return await enqueue_digests(today, size)
+
+    async def get_next_broadcast_job(self) -> Optional[aiosqlite.Row]:
+        return await get_next_broadcast_job()
+
+    async def get_broadcast_job(self, job_id: int) -> Optional[aiosqlite.Row]:
+        return await get_broadcast_job(job_id=job_id)
+
+    async def start_broadcast_job(self, job_id: int) -> int:
+        return await start_broadcast_job(job_id=job_id)
+
+    async def get_broadcast_batch(self, job_id: int, after_user_id: int, limit: int) -> list[int]:
+        return await get_broadcast_batch(job_id=job_id, after_user_id=after_user_id, limit=limit)
+
+    async def checkpoint_broadcast(self, job_id: int, results: Sequence[tuple[int, str, Optional[str]]]) -> None:
+        return await checkpoint_broadcast(job_id=job_id, results=results)
+
+    async def finish_broadcast_job(self, job_id: int) -> None:
+        return await finish_broadcast_job(job_id=job_id)
+
+    async def get_due_outbox(self, limit: int = 50) -> list[aiosqlite.Row]:
+        return await get_due_outbox(limit=limit)
+
+    async def mark_outbox_sent(self, outbox_id: int) -> None:
+        return await mark_outbox_sent(outbox_id=outbox_id)
+
+    async def mark_outbox_failed(self, outbox_id: int, error: str, retry_in: Optional[float]) -> None:
+        return await mark_outbox_failed(outbox_id=outbox_id, error=error, retry_in=retry_in)
+
     async def get_promoted_events_feed(self, limit: int = 10) -> list[Event]:
         return await get_promoted_events_feed(limit=limit)
 
+    async def sweep_feed_upcoming(self) -> int:
+        return await sweep_feed_upcoming()
+
     async def get_event_by_id(self, event_id: int) -> Optional[Any]:
         db = get_db()
         cur = await db.execute("SELECT * FROM events WHERE id = ? LIMIT 1", (int(event_id),))
@@ -864,6 +1867,7 @@ class Repo:
 
         await db.execute("DELETE FROM events WHERE id = ?", (int(event_id),))
         await db.commit()
+        catalog.remove(event_id)
         return True
 
     async def set_event_status(self, event_id: int, status: str) -> bool:
@@ -872,24 +1876,22 @@ class Repo:
         ВАЖНО: get_db() НЕ await-им, иначе aiosqlite падает "threads can only be started once".
         """
         db = get_db()
+        # в старых базах updated_at нет (ALTER TABLE не умеет DEFAULT datetime('now'))
+        touch = ", updated_at = datetime('now')" if "updated_at" in await _table_info("events") else ""
         cur = await db.execute(
-            """
-            UPDATE events
-               SET status = ?,
-                   updated_at = datetime('now')
-             WHERE id = ?
-            """,
+            f"UPDATE events SET status = ?{touch} WHERE id = ?",
             (status, int(event_id)),
         )
         await db.commit()
+        await catalog.refresh_event(event_id)
         return (cur.rowcount or 0) > 0
 
     async def approve_event(self, event_id: int, admin_id: int | None = None) -> bool:
         # admin_id оставляем в сигнатуре, чтобы не ломать handler’ы
-        return await self.set_event_status(event_id, "approved")
+        return await moderate_event(event_id, "approved")
 
     async def reject_event(self, event_id: int, admin_id: int | None = None) -> bool:
-        return await self.set_event_status(event_id, "rejected")
+        return await moderate_event(event_id, "rejected")
 
 def _parse_date_any(s: Optional[str]) -> Optional[date]:
     if not s:
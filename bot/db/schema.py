@@ -1,8 +1,13 @@
 # bot/db/schema.py
 from __future__ import annotations
 
+from bot.db.constants import PROMO_DURATIONS
 from bot.db.database import get_db
 
+# растёт, когда ensure_schema() меняет колонки: по нему репозиторий сбрасывает кэш колонок
+schema_generation = 0
+_columns_added = False
+
 # ВАЖНО:
 # НЕ добавляем сюда индексы, которые ссылаются на новые колонки,
 # потому что на старой БД этих колонок может не быть и бот упадёт на старте.
@@ -11,7 +16,9 @@ CREATE TABLE IF NOT EXISTS users (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     user_id INTEGER UNIQUE NOT NULL,
     role TEXT NOT NULL DEFAULT 'resident',
-    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    last_seen_at TEXT,
+    unreachable_at TEXT
 );
 
 CREATE TABLE IF NOT EXISTS events (
@@ -47,12 +54,16 @@ CREATE TABLE IF NOT EXISTS events (
 
     created_at TEXT NOT NULL DEFAULT (datetime('now')),
     updated_at TEXT NOT NULL DEFAULT (datetime('now')),
+    approved_at TEXT,
 
     -- продвижение/платные опции
     promoted_kind TEXT NOT NULL DEFAULT '',
     promoted_until TEXT,
     highlighted INTEGER NOT NULL DEFAULT 0,
-    bumped_at TEXT
+    bumped_at TEXT,
+
+    -- первая афиша (денормализовано из event_photos)
+    cover_file_id TEXT
 );
 
 CREATE TABLE IF NOT EXISTS event_photos (
@@ -77,13 +88,258 @@ CREATE TABLE IF NOT EXISTS promo_orders (
     provider TEXT NOT NULL DEFAULT 'yookassa',
 
     payload_json TEXT NOT NULL DEFAULT '{}',
+    idempotence_key TEXT,
+    provider_payment_id TEXT,
+    payment_status TEXT,
+    confirmation_url TEXT,
     created_at TEXT NOT NULL DEFAULT (datetime('now')),
     paid_at TEXT,
 
     FOREIGN KEY(event_id) REFERENCES events(id) ON DELETE CASCADE
 );
+
+-- сырые ответы/уведомления ЮKassa (только дописываются); body — bot.db.codec.pack()
+CREATE TABLE IF NOT EXISTS payment_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id INTEGER NOT NULL,
+    payment_id TEXT,
+    source TEXT NOT NULL DEFAULT '',
+    status TEXT,
+    codec TEXT NOT NULL DEFAULT 'json',
+    body BLOB NOT NULL,
+    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+
+-- материализованная лента: одобренные незавершённые события (ведут триггеры)
+CREATE TABLE IF NOT EXISTS feed_upcoming (
+    event_id INTEGER PRIMARY KEY,
+    category_code INTEGER NOT NULL DEFAULT 0,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    end_time TEXT NOT NULL DEFAULT '',
+    event_time TEXT NOT NULL DEFAULT '',
+    rank_score INTEGER NOT NULL DEFAULT 0,
+    highlighted INTEGER NOT NULL DEFAULT 0,
+    bumped_at TEXT NOT NULL DEFAULT '',
+    is_top INTEGER NOT NULL DEFAULT 0,
+    cover_file_id TEXT,
+    paid_at TEXT,
+    FOREIGN KEY(event_id) REFERENCES events(id) ON DELETE CASCADE
+);
+
+-- побочные действия (сообщения), записанные в одной транзакции с изменением состояния
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload_json TEXT NOT NULL DEFAULT '{}',
+    dedupe_key TEXT UNIQUE,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TEXT NOT NULL DEFAULT (datetime('now')),
+    last_error TEXT,
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    sent_at TEXT
+);
+
+-- рассылки: получатели снимаются из users при старте задачи (подписчики — при одобрении
+-- события), прогресс — last_user_id
+CREATE TABLE IF NOT EXISTS broadcast_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_id INTEGER NOT NULL,
+    organizer_id INTEGER,
+    order_id INTEGER UNIQUE,
+    audience TEXT NOT NULL DEFAULT 'all',
+    status TEXT NOT NULL DEFAULT 'pending',
+    total INTEGER NOT NULL DEFAULT 0,
+    sent INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    last_user_id INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    started_at TEXT,
+    finished_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS broadcast_recipients (
+    job_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    error TEXT,
+    PRIMARY KEY (job_id, user_id)
+) WITHOUT ROWID;
+
+-- подписки жителей на категории ленты (category_code как в feed_upcoming);
+-- days — окно дат: только события, начинающиеся в ближайшие N дней (NULL — любые)
+CREATE TABLE IF NOT EXISTS subscriptions (
+    category_code INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    days INTEGER,
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    PRIMARY KEY (category_code, user_id)
+) WITHOUT ROWID;
+
+-- напоминания «🔔 Напомнить»: remind_at — локальное время (как promoted_until);
+-- pending -> queued (ушло в outbox) | canceled
+CREATE TABLE IF NOT EXISTS reminders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    event_id INTEGER NOT NULL,
+    remind_at TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    sent_at TEXT,
+    UNIQUE (user_id, event_id)
+);
+
+-- посты событий в канале (CHANNEL_ID): правим/удаляем по message_id.
+-- version растёт триггером при каждом изменении события, synced_version — что уже в канале
+CREATE TABLE IF NOT EXISTS channel_posts (
+    event_id INTEGER PRIMARY KEY,
+    chat_id TEXT NOT NULL,
+    message_id INTEGER NOT NULL,
+    has_photo INTEGER NOT NULL DEFAULT 0,
+    cover_file_id TEXT,
+    version INTEGER NOT NULL DEFAULT 0,
+    synced_version INTEGER NOT NULL DEFAULT 0,
+    posted_at TEXT NOT NULL DEFAULT (datetime('now')),
+    updated_at TEXT
+);
+
+-- ежедневный дайджест: кто подписан и курсор «что уже видел»
+-- (cursor_at — UTC, как events.approved_at; last_digest_on — локальная дата)
+CREATE TABLE IF NOT EXISTS digest_cursors (
+    user_id INTEGER PRIMARY KEY,
+    enabled INTEGER NOT NULL DEFAULT 1,
+    cursor_at TEXT,
+    last_digest_on TEXT,
+    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+
+-- журнал изменений для межпроцессной инвалидации кэшей (пишут триггеры)
+CREATE TABLE IF NOT EXISTS change_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    row_id INTEGER,
+    event_id INTEGER,
+    op TEXT NOT NULL,
+    changed_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
 """
 
+# (таблица, выражение event_id) — изменения этих таблиц попадают в change_log
+_CHANGE_LOG_SOURCES = (
+    ("events", "id"),
+    ("event_photos", "event_id"),
+    ("promo_orders", "event_id"),
+)
+
+
+# Категории ленты жителя; category_code в feed_upcoming = индекс + 1 (0 — не распознана)
+FEED_CATEGORIES = ("концерт", "спектакль", "мастер-класс", "выставка", "лекция", "другое")
+
+
+def _nn(col: str) -> str:
+    # пустые строки считаем как NULL
+    return f"NULLIF(trim(e.{col}), '')"
+
+
+def _norm_date(expr: str) -> str:
+    e = f"trim({expr})"
+    return (
+        f"date(CASE WHEN {e} LIKE '__.__.____' "
+        f"THEN substr({e}, 7, 4) || '-' || substr({e}, 4, 2) || '-' || substr({e}, 1, 2) "
+        f"ELSE {e} END)"
+    )
+
+
+_BEST_START = _norm_date(f"COALESCE({_nn('sessions_start_date')}, {_nn('start_date')}, {_nn('event_date')})")
+_BEST_END = _norm_date(
+    f"COALESCE({_nn('sessions_end_date')}, {_nn('end_date')}, "
+    f"{_nn('sessions_start_date')}, {_nn('start_date')}, {_nn('event_date')})"
+)
+_EVENT_TIME = "trim(COALESCE(e.event_time, ''))"
+# '' — событие видно до конца дня; нераспознанное время — как начало дня
+_END_TIME = (
+    f"CASE WHEN {_EVENT_TIME} = '' THEN '' ELSE COALESCE(time("
+    f"CASE WHEN length({_EVENT_TIME}) = 5 THEN {_EVENT_TIME} || ':00' ELSE {_EVENT_TIME} END"
+    f"), '00:00:00') END"
+)
+_KIND = "lower(trim(COALESCE(e.promoted_kind, '')))"
+_BUMPED = "COALESCE(e.bumped_at, '')"
+
+
+def _category_code_sql() -> str:
+    text = "(COALESCE(e.category, '') || ' ' || COALESCE(e.category_text, ''))"
+    whens = []
+    for code, cat in enumerate(FEED_CATEGORIES, start=1):
+        variants = " OR ".join(f"instr({text}, '{v}') > 0" for v in (cat, cat.capitalize(), cat.upper()))
+        whens.append(f"WHEN {variants} THEN {code}")
+    return "CASE " + " ".join(whens) + " ELSE 0 END"
+
+
+# SELECT строк feed_upcoming из events (для триггеров и пересборки)
+_FEED_SELECT = f"""
+    SELECT
+        e.id,
+        {_category_code_sql()},
+        {_BEST_START},
+        {_BEST_END},
+        {_END_TIME},
+        {_EVENT_TIME},
+        CASE
+            WHEN {_KIND} IN ('top','топ') THEN 3
+            WHEN COALESCE(e.highlighted,0) = 1 OR {_KIND} IN ('highlight','подсветка') THEN 2
+            WHEN {_KIND} = 'bump' OR {_BUMPED} <> '' THEN 1
+            ELSE 0
+        END,
+        COALESCE(e.highlighted, 0),
+        {_BUMPED},
+        CASE
+            WHEN {_KIND} IN ('top','highlight','bump','топ','подсветка')
+                OR COALESCE(e.highlighted,0) = 1 OR {_BUMPED} <> '' THEN 1
+            ELSE 0
+        END,
+        e.cover_file_id,
+        (SELECT MAX(o.paid_at) FROM promo_orders o WHERE o.event_id = e.id AND o.status = 'paid')
+    FROM events e
+    WHERE e.status = 'approved'
+      AND {_BEST_START} IS NOT NULL
+      AND {_BEST_END} >= date('now', 'localtime')
+"""
+
+_FEED_COLUMNS = (
+    "event_id, category_code, start_date, end_date, end_time, event_time, "
+    "rank_score, highlighted, bumped_at, is_top, cover_file_id, paid_at"
+)
+
+
+def _feed_sync_sql(ref: str) -> str:
+    return f"""
+        DELETE FROM feed_upcoming WHERE event_id = {ref};
+        INSERT INTO feed_upcoming ({_FEED_COLUMNS})
+        {_FEED_SELECT} AND e.id = {ref};
+    """
+
+
+# (имя, событие, ссылка на event_id) — триггеры, пересчитывающие строку ленты
+_FEED_TRIGGERS = (
+    ("trg_feed_events_ins", "AFTER INSERT ON events", "NEW.id"),
+    ("trg_feed_events_upd", "AFTER UPDATE ON events", "NEW.id"),
+    ("trg_feed_orders_ins", "AFTER INSERT ON promo_orders", "NEW.event_id"),
+    ("trg_feed_orders_upd", "AFTER UPDATE OF status, paid_at ON promo_orders", "NEW.event_id"),
+)
+
+# первая афиша (position, id) — денормализуется в events.cover_file_id
+_COVER_SQL = (
+    "(SELECT p.file_id FROM event_photos p WHERE p.event_id = {ref} "
+    "ORDER BY p.position ASC, p.id ASC LIMIT 1)"
+)
+
+_COVER_TRIGGERS = (
+    ("trg_cover_photos_ins", "AFTER INSERT ON event_photos", "NEW.event_id"),
+    ("trg_cover_photos_upd", "AFTER UPDATE ON event_photos", "NEW.event_id"),
+    ("trg_cover_photos_del", "AFTER DELETE ON event_photos", "OLD.event_id"),
+)
+
 
 async def _table_columns(table: str) -> set[str]:
     db = get_db()
@@ -92,13 +348,97 @@ async def _table_columns(table: str) -> set[str]:
     return {r["name"] for r in rows}
 
 
-async def _add_column_if_missing(table: str, column: str, ddl: str) -> None:
+async def _add_column_if_missing(table: str, column: str, ddl: str) -> bool:
+    """True — колонку только что добавили (можно делать бэкфилл)."""
     cols = await _table_columns(table)
     if column in cols:
-        return
+        return False
+    global _columns_added
     db = get_db()
     await db.execute(f"ALTER TABLE {table} ADD COLUMN {ddl}")
     await db.commit()
+    _columns_added = True
+    return True
+
+
+async def _backfill_provider_payment_id() -> None:
+    """id платежа раньше жил только в payload_json (или в yk_payment_id старых БД)."""
+    db = get_db()
+    legacy = "yk_payment_id, " if "yk_payment_id" in await _table_columns("promo_orders") else ""
+    await db.execute(
+        f"""
+        UPDATE promo_orders
+        SET provider_payment_id = COALESCE(
+            {legacy}
+            json_extract(payload_json, '$.id'),
+            json_extract(payload_json, '$.payment_id'),
+            json_extract(payload_json, '$.raw.id')
+        )
+        WHERE json_valid(payload_json)
+        """
+    )
+    await db.commit()
+
+
+async def _split_order_payloads() -> None:
+    """
+    Сырые ответы ЮKassa раньше лежали в promo_orders.payload_json: переносим их
+    в payment_events, в заказе оставляем только статус платежа и ссылку оплаты.
+    """
+    db = get_db()
+    await db.execute(
+        """
+        UPDATE promo_orders
+        SET payment_status = COALESCE(json_extract(payload_json, '$.status'), json_extract(payload_json, '$.raw.status')),
+            confirmation_url = COALESCE(
+                json_extract(payload_json, '$.confirmation_url'),
+                json_extract(payload_json, '$.raw.confirmation.confirmation_url'),
+                json_extract(payload_json, '$.confirmation.confirmation_url')
+            )
+        WHERE json_valid(payload_json)
+        """
+    )
+    await db.execute(
+        """
+        INSERT INTO payment_events (order_id, payment_id, source, status, codec, body, created_at)
+        SELECT id, provider_payment_id, 'migrated', payment_status, 'json', CAST(payload_json AS BLOB), created_at
+        FROM promo_orders
+        WHERE trim(COALESCE(payload_json, '')) NOT IN ('', '{}')
+        """
+    )
+    await db.execute("UPDATE promo_orders SET payload_json = '{}' WHERE payload_json <> '{}'")
+    await db.commit()
+
+
+async def _backfill_promotion_deadlines() -> None:
+    """
+    Продвижения, купленные до появления срока (promoted_until пуст), получают срок
+    PROMO_DURATIONS[вид] от последней оплаты этого вида (иначе — любой оплаты,
+    иначе — от сейчас); без этого провисели бы в топе вечно.
+    Вид: promoted_kind, для старых схем — highlighted / bumped_at.
+    """
+    db = get_db()
+    kind = (
+        "CASE WHEN promoted_kind IN ('top', 'highlight', 'bump') THEN promoted_kind "
+        "WHEN highlighted = 1 THEN 'highlight' ELSE 'bump' END"
+    )
+    hours = " ".join(
+        f"WHEN '{k}' THEN {int(d.total_seconds() // 3600)}" for k, d in PROMO_DURATIONS.items()
+    )
+    await db.execute(
+        f"""
+        UPDATE events
+        SET promoted_until = strftime('%Y-%m-%dT%H:%M:%S', COALESCE(
+            (SELECT MAX(o.paid_at) FROM promo_orders o
+             WHERE o.event_id = events.id AND o.status = 'paid' AND o.service = {kind}),
+            (SELECT MAX(o.paid_at) FROM promo_orders o WHERE o.event_id = events.id AND o.status = 'paid'),
+            datetime('now', 'localtime')
+        ), '+' || (CASE {kind} {hours} END) || ' hours')
+        WHERE COALESCE(promoted_until, '') = ''
+          AND (promoted_kind IN ('top', 'highlight', 'bump') OR highlighted = 1 OR COALESCE(bumped_at, '') <> '')
+        """
+    )
+    await db.commit()
 
 
 async def _create_indexes_safely() -> None:
@@ -115,7 +455,37 @@ async def _create_indexes_safely() -> None:
     await db.execute("CREATE INDEX IF NOT EXISTS idx_event_photos_event ON event_photos(event_id)")
     await db.execute("CREATE INDEX IF NOT EXISTS idx_promo_orders_event ON promo_orders(event_id)")
     await db.execute("CREATE INDEX IF NOT EXISTS idx_promo_orders_org ON promo_orders(organizer_id)")
-    await db.execute("CREATE INDEX IF NOT EXISTS idx_promo_orders_status ON promo_orders(status)")
+    # сверка платежей сканирует незакрытые заказы по возрасту; (status) — префикс, отдельный не нужен
+    await db.execute("DROP INDEX IF EXISTS idx_promo_orders_status")
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_promo_orders_status_created ON promo_orders(status, created_at)"
+    )
+    await db.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_promo_orders_idem "
+        "ON promo_orders(idempotence_key) WHERE idempotence_key IS NOT NULL"
+    )
+    # вебхук и сверка находят заказ по id платежа ЮKassa
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_promo_orders_payment ON promo_orders(provider_payment_id) "
+        "WHERE provider_payment_id IS NOT NULL"
+    )
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_payment_events_order ON payment_events(order_id, id)")
+    # «живые» пользователи для рассылок: заблокировавшие бота в индекс не попадают
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_users_reachable ON users(last_seen_at) WHERE unreachable_at IS NULL"
+    )
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status ON broadcast_jobs(status, id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_event ON broadcast_jobs(event_id)")
+    # подписчиков категории отдаёт первичный ключ; этот — «мои подписки»
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_subscriptions_user ON subscriptions(user_id)")
+    # планировщик напоминаний читает только ближайшее окно ожидающих
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders(remind_at) WHERE status = 'pending'"
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_digest_due ON digest_cursors(last_digest_on) WHERE enabled = 1"
+    )
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at)")
 
     # индекс по продвижению — только если колонки реально есть
     ecols = await _table_columns("events")
@@ -124,11 +494,119 @@ async def _create_indexes_safely() -> None:
             "CREATE INDEX IF NOT EXISTS idx_events_promoted "
             "ON events(promoted_kind, promoted_until, highlighted)"
         )
+        # планировщик снятия продвижений ищет истёкшие по сроку
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_events_promoted_until ON events(promoted_until) "
+            "WHERE promoted_until IS NOT NULL"
+        )
 
     await db.commit()
 
 
-async def ensure_schema() -> None:
+async def _create_change_log_triggers() -> None:
+    db = get_db()
+    for table, event_col in _CHANGE_LOG_SOURCES:
+        for op, when, ref in (("I", "INSERT", "NEW"), ("U", "UPDATE", "NEW"), ("D", "DELETE", "OLD")):
+            await db.execute(
+                f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_changelog_{op.lower()}
+                AFTER {when} ON {table}
+                BEGIN
+                    INSERT INTO change_log(table_name, row_id, event_id, op)
+                    VALUES ('{table}', {ref}.id, {ref}.{event_col}, '{op}');
+                END
+                """
+            )
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_change_log_changed ON change_log(changed_at)")
+    await db.commit()
+
+
+async def _create_cover_triggers() -> None:
+    """events.cover_file_id следует за event_photos (вставка/правка/удаление афиш)."""
+    db = get_db()
+    for name, when, ref in _COVER_TRIGGERS:
+        await db.execute(f"DROP TRIGGER IF EXISTS {name}")
+        await db.execute(
+            f"CREATE TRIGGER {name} {when} BEGIN "
+            f"UPDATE events SET cover_file_id = {_COVER_SQL.format(ref=ref)} WHERE id = {ref}; "
+            f"END"
+        )
+    await db.commit()
+
+
+# поля events, из которых собирается карточка (format_card_text / card_markup) + статус
+_CHANNEL_CARD_COLUMNS = (
+    "title, category, category_text, description, start_date, end_date, event_date, event_time, "
+    "location, price_text, ticket_link, status, promoted_kind, highlighted, cover_file_id"
+)
+
+_CHANNEL_SYNC_SQL = """
+    UPDATE channel_posts SET version = version + 1 WHERE event_id = {ref};
+    INSERT OR IGNORE INTO outbox (kind, payload_json, dedupe_key)
+    SELECT 'channel_sync', json_object('event_id', event_id, 'version', version),
+           'channel_sync:' || event_id || ':' || message_id || ':' || version
+    FROM channel_posts WHERE event_id = {ref};
+"""
+
+_CHANNEL_TRIGGERS = (
+    ("trg_channel_events_upd", f"AFTER UPDATE OF {_CHANNEL_CARD_COLUMNS} ON events", "NEW.id"),
+    ("trg_channel_events_del", "AFTER DELETE ON events", "OLD.id"),
+)
+
+
+async def _create_channel_triggers() -> None:
+    """Событие с постом в канале изменилось / удалено -> outbox 'channel_sync' (правка поста)."""
+    db = get_db()
+    for name, when, ref in _CHANNEL_TRIGGERS:
+        await db.execute(f"DROP TRIGGER IF EXISTS {name}")
+        await db.execute(
+            f"CREATE TRIGGER {name} {when} "
+            f"WHEN EXISTS (SELECT 1 FROM channel_posts WHERE event_id = {ref}) "
+            f"BEGIN {_CHANNEL_SYNC_SQL.format(ref=ref)} END"
+        )
+    await db.commit()
+
+
+async def _create_feed_triggers() -> None:
+    """
+    Триггеры пересоздаются на каждом старте (чтобы подтянуть новую версию логики),
+    после чего лента пересобирается целиком — дальше её ведут только триггеры.
+    """
+    db = get_db()
+    # старые версии пересчитывали обложку прямо из event_photos — теперь это делает events.cover_file_id
+    for old in ("trg_feed_photos_ins", "trg_feed_photos_upd", "trg_feed_photos_del"):
+        await db.execute(f"DROP TRIGGER IF EXISTS {old}")
+
+    for name, when, ref in _FEED_TRIGGERS:
+        await db.execute(f"DROP TRIGGER IF EXISTS {name}")
+        await db.execute(f"CREATE TRIGGER {name} {when} BEGIN {_feed_sync_sql(ref)} END")
+
+    await db.execute("DROP TRIGGER IF EXISTS trg_feed_events_del")
+    await db.execute(
+        "CREATE TRIGGER trg_feed_events_del AFTER DELETE ON events "
+        "BEGIN DELETE FROM feed_upcoming WHERE event_id = OLD.id; END"
+    )
+
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_feed_rank ON feed_upcoming"
+        "(rank_score DESC, highlighted DESC, bumped_at DESC, start_date DESC, event_time DESC, event_id DESC)"
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_feed_category ON feed_upcoming"
+        "(category_code, rank_score DESC, highlighted DESC, bumped_at DESC, start_date DESC)"
+    )
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_feed_top ON feed_upcoming(is_top, rank_score DESC)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_feed_end ON feed_upcoming(end_date, end_time)")
+
+    await db.execute("DELETE FROM feed_upcoming")
+    await db.execute(f"INSERT INTO feed_upcoming ({_FEED_COLUMNS}) {_FEED_SELECT}")
+    await db.commit()
+
+
+async def ensure_schema() -> bool:
+    """Создаёт / догоняет схему. True — добавлены колонки (schema_generation вырос)."""
+    global schema_generation, _columns_added
+    _columns_added = False
     db = get_db()
 
     # 1) создаём таблицы
@@ -139,6 +617,8 @@ async def ensure_schema() -> None:
     # users
     await _add_column_if_missing("users", "user_id", "user_id INTEGER UNIQUE NOT NULL DEFAULT 0")
     await _add_column_if_missing("users", "role", "role TEXT NOT NULL DEFAULT 'resident'")
+    await _add_column_if_missing("users", "last_seen_at", "last_seen_at TEXT")
+    await _add_column_if_missing("users", "unreachable_at", "unreachable_at TEXT")
 
     # events
     await _add_column_if_missing("events", "category_text", "category_text TEXT NOT NULL DEFAULT ''")
@@ -146,12 +626,48 @@ async def ensure_schema() -> None:
     await _add_column_if_missing("events", "promoted_until", "promoted_until TEXT")
     await _add_column_if_missing("events", "highlighted", "highlighted INTEGER NOT NULL DEFAULT 0")
     await _add_column_if_missing("events", "bumped_at", "bumped_at TEXT")
+    if await _add_column_if_missing("events", "cover_file_id", "cover_file_id TEXT"):
+        # бэкфилл обложек для уже существующих событий
+        await db.execute(f"UPDATE events SET cover_file_id = {_COVER_SQL.format(ref='events.id')}")
+        await db.commit()
+    if await _add_column_if_missing("events", "approved_at", "approved_at TEXT"):
+        # точного времени одобрения у старых событий нет — берём время создания
+        await db.execute("UPDATE events SET approved_at = created_at WHERE status = 'approved'")
+        await db.commit()
 
     # promo_orders
     await _add_column_if_missing("promo_orders", "payload_json", "payload_json TEXT NOT NULL DEFAULT '{}'")
     await _add_column_if_missing("promo_orders", "provider", "provider TEXT NOT NULL DEFAULT 'yookassa'")
     await _add_column_if_missing("promo_orders", "currency", "currency TEXT NOT NULL DEFAULT 'RUB'")
     await _add_column_if_missing("promo_orders", "amount", "amount INTEGER NOT NULL DEFAULT 0")
+    await _add_column_if_missing("promo_orders", "idempotence_key", "idempotence_key TEXT")
+    if await _add_column_if_missing("promo_orders", "provider_payment_id", "provider_payment_id TEXT"):
+        await _backfill_provider_payment_id()
+    await _add_column_if_missing("promo_orders", "confirmation_url", "confirmation_url TEXT")
+    if await _add_column_if_missing("promo_orders", "payment_status", "payment_status TEXT"):
+        await _split_order_payloads()
+
+    # одноразовые миграции данных: PRAGMA user_version — номер последней применённой
+    version = (await (await db.execute("PRAGMA user_version")).fetchone())[0]
+    if version < 1:
+        await _backfill_promotion_deadlines()
+        await db.execute("PRAGMA user_version = 1")
+        await db.commit()
+
+    if _columns_added:
+        schema_generation += 1
 
     # 3) индексы — только после миграций
-    await _create_indexes_safely()
\ No newline at end of file
+    await _create_indexes_safely()
+
+    # 4) триггеры журнала изменений
+    await _create_change_log_triggers()
+
+    # 5) обложка события + материализованная лента
+    await _create_cover_triggers()
+    await _create_feed_triggers()
+
+    # 6) правки постов в канале
+    await _create_channel_triggers()
+
+    return _columns_added
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-import os
+import html
 from typing import Any, Iterable, Optional
 
 from aiogram import Router, F
@@ -13,8 +13,15 @@ from aiogram.types import (
     InlineKeyboardButton,
 )
 from aiogram.enums import ParseMode
+from aiogram.filters import Command
 
+from bot.config import get_settings, reload_settings
 from bot.db.repositories import repo
+from bot.services.catalog import catalog
+from bot.services.moderation import apply_moderation
+from bot.services.payment_reconciler import payment_reconciler
+from bot.services.yookassa_client import yookassa_breaker
+from bot.utils.singleflight import singleflight_stats
 
 from typing import Any, Optional
 
@@ -33,24 +40,9 @@ def _val(obj, key: str, default: str = ""):
 # =========================
 # ADMIN IDS
 # =========================
-def _load_admin_ids() -> set[int]:
-    # ENV: ADMIN_IDS="123,456"
-    raw = (os.getenv("ADMIN_IDS") or "").strip()
-    if not raw:
-        return set()
-    ids: set[int] = set()
-    for part in raw.split(","):
-        part = part.strip()
-        if part.isdigit():
-            ids.add(int(part))
-    return ids
-
-
-ADMIN_IDS = _load_admin_ids()
-
-
 def is_admin(user_id: int) -> bool:
-    return user_id in ADMIN_IDS
+    # ADMIN_IDS из .env; меняется без перезапуска через /reload_config
+    return user_id in get_settings().admin_ids
 
 
 # =========================
@@ -204,8 +196,8 @@ async def send_event_for_moderation(
     caption, cut = build_admin_caption(event)
     eid = int(_ev(event, "id"))
 
-    photos = await repo.get_event_photos(eid)
-    photo_id = photos[0] if photos else None
+    # обложка денормализована в events.cover_file_id — отдельный запрос в event_photos не нужен
+    photo_id = _ev(event, "cover_file_id")
 
     kb = moderation_kb(event_id=eid, has_more=cut, next_id=next_id)
 
@@ -303,7 +295,7 @@ async def admin_cb_show(cb: CallbackQuery) -> None:
         return
 
     event_id = int(cb.data.split(":")[1])
-    event = await repo.get_event(event_id)
+    event = await repo.get_event_view(event_id)
     if not event:
         await cb.answer("Событие не найдено", show_alert=True)
         return
@@ -322,21 +314,21 @@ async def admin_cb_approve(cb: CallbackQuery) -> None:
         return
 
     event_id = int(cb.data.split(":")[1])
-    ok = await repo.approve_event(event_id, admin_id=cb.from_user.id)
+    # статус + уведомления организатору/подписчикам/в канал — одним commit, доставка в фоне
+    ok = await apply_moderation(event_id, approve=True, admin_id=cb.from_user.id)
 
     if not ok:
         await cb.answer("Не удалось одобрить", show_alert=True)
         return
 
+    await cb.answer("Одобрено")
     await cb.message.answer(f"✅ Событие <b>{event_id}</b> одобрено.")
     next_id = await _get_next_pending_id(event_id)
     if next_id is not None:
-        ev = await repo.get_event(next_id)
+        ev = await repo.get_event_view(next_id)
         if ev:
             await send_event_for_moderation(cb, ev, next_id=await _get_next_pending_id(next_id))
 
-    await cb.answer("Одобрено")
-
 
 @router.callback_query(F.data.startswith("adm_no:"))
 async def admin_cb_reject(cb: CallbackQuery) -> None:
@@ -345,21 +337,20 @@ async def admin_cb_reject(cb: CallbackQuery) -> None:
         return
 
     event_id = int(cb.data.split(":")[1])
-    ok = await repo.reject_event(event_id, admin_id=cb.from_user.id)
+    ok = await apply_moderation(event_id, approve=False, admin_id=cb.from_user.id)
 
     if not ok:
         await cb.answer("Не удалось отклонить", show_alert=True)
         return
 
+    await cb.answer("Отклонено")
     await cb.message.answer(f"❌ Событие <b>{event_id}</b> отклонено.")
     next_id = await _get_next_pending_id(event_id)
     if next_id is not None:
-        ev = await repo.get_event(next_id)
+        ev = await repo.get_event_view(next_id)
         if ev:
             await send_event_for_moderation(cb, ev, next_id=await _get_next_pending_id(next_id))
 
-    await cb.answer("Отклонено")
-
 
 # =========================
 # MORE
@@ -371,7 +362,7 @@ async def admin_cb_more(cb: CallbackQuery) -> None:
         return
 
     event_id = int(cb.data.split(":")[1])
-    event = await repo.get_event(event_id)
+    event = await repo.get_event_view(event_id)
     if not event:
         await cb.answer("Событие не найдено", show_alert=True)
         return
@@ -382,4 +373,75 @@ async def admin_cb_more(cb: CallbackQuery) -> None:
         return
 
     await cb.message.answer(f"📄 <b>Полное описание (ID {event_id})</b>\n\n{full}")
-    await cb.answer()
\ No newline at end of file
+    await cb.answer()
+
+
+# =========================
+# SERVICE COMMANDS
+# =========================
+@router.message(Command("catalog_check"))
+async def admin_catalog_check(message: Message) -> None:
+    if not is_admin(message.from_user.id):
+        await message.answer("⛔ Доступ запрещён.")
+        return
+
+    if not catalog.loaded:
+        await message.answer("ℹ️ Этот воркер читает общий снапшот ленты — проверку запускай на процессе-писателе.")
+        return
+
+    problems = await catalog.check_consistency()
+    if not problems:
+        await message.answer(f"✅ Каталог совпадает с БД ({len(catalog)} событий).")
+        return
+
+    lines = [f"⚠️ Расхождений: {len(problems)}", *problems[:20]]
+    lines.append("\nКаталог перезагружен из БД.")
+    await catalog.load()
+    await message.answer("\n".join(lines))
+
+
+@router.message(Command("payments"))
+async def admin_payments_status(message: Message) -> None:
+    if not is_admin(message.from_user.id):
+        await message.answer("⛔ Доступ запрещён.")
+        return
+
+    counters = " · ".join(f"{k}: {v}" for k, v in payment_reconciler.counters.items())
+    await message.answer(
+        "💳 <b>Платёжный шлюз</b>\n\n"
+        f"{yookassa_breaker.describe()}\n\n"
+        f"<b>Сверка заказов</b> (с запуска)\n{counters}"
+    )
+
+
+@router.message(Command("inflight"))
+async def admin_inflight_status(message: Message) -> None:
+    if not is_admin(message.from_user.id):
+        await message.answer("⛔ Доступ запрещён.")
+        return
+
+    lines = [html.escape(g.describe()) for g in singleflight_stats()]
+    await message.answer(
+        "🔁 <b>Склейка одинаковых запросов</b> (с запуска)\n\n" + "\n".join(lines)
+    )
+
+
+@router.message(Command("reload_config"))
+async def admin_reload_config(message: Message) -> None:
+    if not is_admin(message.from_user.id):
+        await message.answer("⛔ Доступ запрещён.")
+        return
+
+    try:
+        settings = reload_settings()
+    except Exception as e:
+        await message.answer(f"❌ Настройки не применены, работаем на старых:\n{html.escape(str(e))}")
+        return
+
+    prices = ", ".join(f"{k}: {v}₽" for k, v in settings.promo_prices.items())
+    await message.answer(
+        "✅ Настройки перечитаны.\n"
+        f"Админов: {len(settings.admin_ids)}\n"
+        f"Цены: {prices}\n"
+        f"ЮKassa: {settings.yookassa.mode}"
+    )
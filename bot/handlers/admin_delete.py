@@ -8,8 +8,9 @@ from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 
-from bot.config import ADMIN_IDS
+from bot.config import get_settings
 from bot.db.database import get_db
+from bot.services.catalog import catalog
 
 
 router = Router()
@@ -19,48 +20,8 @@ class AdminDelete(StatesGroup):
     waiting_event_id = State()
 
 
-def _parse_admin_ids(value) -> set[int]:
-    """
-    ADMIN_IDS может быть:
-    - list[int]
-    - list[str]
-    - строка "1,2,3"
-    """
-    if value is None:
-        return set()
-
-    if isinstance(value, (list, tuple, set)):
-        out = set()
-        for x in value:
-            try:
-                out.add(int(x))
-            except Exception:
-                pass
-        return out
-
-    if isinstance(value, str):
-        out = set()
-        for part in value.replace(";", ",").split(","):
-            part = part.strip()
-            if not part:
-                continue
-            try:
-                out.add(int(part))
-            except Exception:
-                pass
-        return out
-
-    try:
-        return {int(value)}
-    except Exception:
-        return set()
-
-
-_ADMIN_SET = _parse_admin_ids(ADMIN_IDS)
-
-
 def _is_admin(user_id: int) -> bool:
-    return int(user_id) in _ADMIN_SET
+    return int(user_id) in get_settings().admin_ids
 
 
 def admin_delete_menu_kb() -> ReplyKeyboardMarkup:
@@ -131,6 +92,7 @@ async def _delete_event_cascade(event_id: int) -> None:
     # Само событие
     await db.execute("DELETE FROM events WHERE id = ?", (event_id,))
     await db.commit()
+    catalog.remove(event_id)
 
 
 @router.message(F.text == "🗑 Удалить событие")
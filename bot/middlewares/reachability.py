@@ -0,0 +1,46 @@
+# bot/middlewares/reachability.py
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject, User
+
+from bot.services.reachability import is_unreachable_error, reachability
+
+
+class LastSeenMiddleware(BaseMiddleware):
+    """dp.update.outer_middleware: любой апдейт от пользователя -> last_seen_at (в памяти)."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user: User | None = data.get("event_from_user")
+        if user is not None and not user.is_bot:
+            reachability.touch(user.id)
+        return await handler(event, data)
+
+
+class UnreachableChatMiddleware(BaseRequestMiddleware):
+    """bot.session.middleware: Forbidden / chat not found на любой отправке -> unreachable_at."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            chat_id = getattr(method, "chat_id", None)
+            # личные чаты — положительные id; группы/каналы не трогаем
+            if isinstance(chat_id, int) and chat_id > 0 and is_unreachable_error(e):
+                reachability.mark_unreachable(chat_id)
+            raise
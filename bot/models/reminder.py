@@ -0,0 +1,63 @@
+# bot/models/reminder.py
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+# статусы reminders.status
+PENDING = "pending"
+QUEUED = "queued"  # поставлено в outbox, дальше доставка как у остальных уведомлений
+CANCELED = "canceled"
+
+# за сколько до начала напоминать, если время события известно
+DEFAULT_LEAD = timedelta(hours=2)
+# время события не указано — напоминаем утром в день события
+MORNING = (9, 0)
+
+_TIME_RE = re.compile(r"(\d{1,2})[:.](\d{2})")
+
+
+@dataclass
+class Reminder:
+    id: int
+    user_id: int
+    event_id: int
+    remind_at: str  # локальное время, ISO (как promoted_until)
+    status: str = PENDING
+    created_at: Optional[str] = None
+    sent_at: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row: Any) -> "Reminder":
+        return cls(
+            id=int(row["id"]),
+            user_id=int(row["user_id"]),
+            event_id=int(row["event_id"]),
+            remind_at=str(row["remind_at"]),
+            status=str(row["status"]),
+            created_at=row["created_at"],
+            sent_at=row["sent_at"],
+        )
+
+
+def plan_reminder(
+    start_date: Optional[str],
+    event_time: Optional[str],
+    lead: timedelta = DEFAULT_LEAD,
+) -> Optional[tuple[datetime, datetime]]:
+    """
+    -> (начало события, когда напомнить) по строке feed_upcoming: start_date — ISO-дата,
+    event_time — как ввёл организатор («19:00», «19.00–21.00», …).
+    Время не распознано — начало считаем концом дня, напоминаем утром в день события.
+    """
+    try:
+        day = datetime.fromisoformat(str(start_date or "").strip()[:10])
+    except ValueError:
+        return None
+    m = _TIME_RE.search(event_time or "")
+    if m and int(m.group(1)) < 24 and int(m.group(2)) < 60:
+        start = day.replace(hour=int(m.group(1)), minute=int(m.group(2)))
+        return start, start - lead
+    return day.replace(hour=23, minute=59), day.replace(hour=MORNING[0], minute=MORNING[1])
@@ -0,0 +1,146 @@
+# bot/services/broadcast.py
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from bot.db.repositories import repo
+from bot.services.outbox import outbox_dispatcher
+from bot.utils.cards import fetch_event_card, send_event_card
+from bot.utils.rate_limit import send_limiter
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_HEADER = "📣 <b>Анонс мероприятия</b>"
+SUBSCRIPTION_HEADER = "🔔 <b>Новое по твоей подписке</b>"
+
+
+class BroadcastEngine:
+    """
+    Рассылка карточки события всем пользователям (услуга «📣 Оповещение всем»)
+    и подписчикам категории при одобрении события (audience 'subscribers').
+    Заблокировавшие бота (users.unreachable_at) в снимок получателей не попадают.
+    Рассылки подписчикам идут первыми: длинная рассылка всем уступает им после
+    текущей пачки (wake()) и потом продолжается с места остановки.
+
+    Задачи — broadcast_jobs: получатели снимаются в broadcast_recipients при старте
+    задачи, дальше идём по user_id пачками по batch и после каждой пачки фиксируем
+    статусы и счётчики (после перезапуска продолжаем с места остановки; повторно
+    получить карточку могут максимум получатели одной незафиксированной пачки).
+
+    Темп — send_limiter, один бюджет с outbox (SEND_RATE), ниже общего лимита Telegram,
+    чтобы обычные ответы бота не упирались в 429. retry_after — пауза и повтор того же
+    получателя; бот заблокирован / чат не найден — получатель blocked, без повторов.
+    """
+
+    def __init__(self, batch: int = 20, retries: int = 2, interval: float = 30.0) -> None:
+        self.batch = batch
+        self.retries = retries
+        self.interval = interval
+        self.bot: Optional[Bot] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    async def start(self, bot: Bot) -> None:
+        self.bot = bot
+        self._task = asyncio.create_task(self._run(), name="broadcast-engine")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                while await self.run_next_job():
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Broadcast failed")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def run_next_job(self) -> bool:
+        job = await repo.get_next_broadcast_job()
+        if job is None:
+            return False
+        job_id = int(job["id"])
+        if job["status"] == "pending":
+            total = await repo.start_broadcast_job(job_id)
+            logger.info("Broadcast %s: event_id=%s, %s recipients", job_id, job["event_id"], total)
+
+        card = await fetch_event_card(int(job["event_id"]))
+        header = SUBSCRIPTION_HEADER if job["audience"] == "subscribers" else BROADCAST_HEADER
+        after = int(job["last_user_id"] or 0)
+        while card is not None:
+            user_ids = await repo.get_broadcast_batch(job_id, after, self.batch)
+            if not user_ids:
+                break
+            results = [(user_id, *await self._deliver(user_id, card, header)) for user_id in user_ids]
+            await repo.checkpoint_broadcast(job_id, results)
+            after = user_ids[-1]
+            if job["audience"] != "subscribers" and self._wakeup.is_set():
+                # пришла новая задача (одобрение -> подписчики): уступаем после пачки,
+                # get_next_broadcast_job отдаст её первой, эта продолжится с last_user_id
+                self._wakeup.clear()
+                return True
+
+        await repo.finish_broadcast_job(job_id)
+        outbox_dispatcher.wake()
+        done = await repo.get_broadcast_job(job_id)
+        logger.info("Broadcast %s done: sent=%s failed=%s", job_id, done["sent"], done["failed"])
+        return True
+
+    async def _deliver(self, user_id: int, card: Any, header: str = BROADCAST_HEADER) -> tuple[str, Optional[str]]:
+        attempt = 0
+        while True:
+            await send_limiter.acquire()
+            try:
+                await send_event_card(self.bot, user_id, card, header=header)
+                return "sent", None
+            except TelegramRetryAfter as e:
+                # лимит общий для бота — тормозим всю рассылку, получателя не теряем
+                logger.warning("Broadcast: retry_after=%ss", e.retry_after)
+                send_limiter.pause(float(e.retry_after))
+            except TelegramForbiddenError as e:
+                return "blocked", str(e)[:200]
+            except TelegramBadRequest as e:
+                if "chat not found" in str(e).lower():
+                    return "blocked", str(e)[:200]
+                return "failed", str(e)[:200]
+            except Exception as e:
+                attempt += 1
+                if attempt > self.retries:
+                    return "failed", f"{type(e).__name__}: {e}"[:200]
+                await asyncio.sleep(attempt)
+
+
+async def _send_broadcast_report(bot: Bot, payload: dict[str, Any]) -> None:
+    """Обработчик outbox 'broadcast_report' (пишет finish_broadcast_job)."""
+    await bot.send_message(
+        int(payload["organizer_id"]),
+        f"📣 Рассылка по событию <b>{payload['event_id']}</b> завершена.\n"
+        f"Доставлено: <b>{payload['sent']}</b> из {payload['total']}\n"
+        f"Не доставлено: {payload['failed']}",
+    )
+
+
+outbox_dispatcher.register("broadcast_report", _send_broadcast_report)
+
+broadcast_engine = BroadcastEngine()
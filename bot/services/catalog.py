@@ -0,0 +1,526 @@
+# bot/services/catalog.py
+from __future__ import annotations
+
+import logging
+from array import array
+from bisect import bisect_left, insort
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Callable, Optional
+
+from bot.db.database import get_db
+from bot.db.schema import FEED_CATEGORIES
+from bot.utils.singleflight import feed_flight
+
+logger = logging.getLogger(__name__)
+
+# Конец дня — если у события нет времени, оно видно в ленте до 23:59:59
+_END_OF_DAY = 24 * 3600 - 1
+
+
+@dataclass
+class EventCard:
+    id: int
+    title: str
+    category: str
+    category_text: str
+    description: str
+    start_date: str | None
+    event_date: str | None
+    event_time: str | None
+    location: str
+    price_text: str
+    ticket_link: str
+    promoted_kind: str
+    highlighted: int
+    cover_file_id: str | None = None
+
+
+# =========================
+# HELPERS
+# =========================
+def _clean(v: Any) -> str:
+    return str(v).strip() if v is not None else ""
+
+
+def _parse_day(s: Any) -> Optional[date]:
+    """dd.mm.yyyy или yyyy-mm-dd (как date() в SQLite после нормализации)."""
+    s = _clean(s)
+    if not s:
+        return None
+    for fmt, chunk in (("%d.%m.%Y", s), ("%Y-%m-%d", s[:10])):
+        try:
+            return datetime.strptime(chunk, fmt).date()
+        except ValueError:
+            pass
+    return None
+
+
+def _parse_secs(s: Any) -> Optional[int]:
+    """HH:MM или HH:MM:SS -> секунды от начала суток."""
+    s = _clean(s)
+    if not s:
+        return None
+    parts = s.split(":")
+    if len(parts) not in (2, 3) or not all(p.isdigit() for p in parts):
+        return None
+    h, m = int(parts[0]), int(parts[1])
+    sec = int(parts[2]) if len(parts) == 3 else 0
+    if h > 23 or m > 59 or sec > 59:
+        return None
+    return h * 3600 + m * 60 + sec
+
+
+def _day_key(d: date, secs: int = 0) -> int:
+    # Монотонная "эпоха" в секундах без часовых поясов: ordinal * 86400 + секунды
+    return d.toordinal() * 86400 + secs
+
+
+def now_key(now: Optional[datetime] = None) -> int:
+    now = now or datetime.now()
+    return _day_key(now.date(), now.hour * 3600 + now.minute * 60 + now.second)
+
+
+def _norm_label(s: Any) -> str:
+    """'🎵 Концерт' -> 'концерт' (без эмодзи и регистра)."""
+    s = _clean(s).lower()
+    return "".join(ch for ch in s if ch.isalpha() or ch in " -").strip()
+
+
+@dataclass
+class _Entry:
+    card: EventCard
+    start: int
+    end: int
+    tier: int
+    bumped: int
+    time_secs: int
+    is_top: bool
+
+    def rank_key(self) -> tuple[int, ...]:
+        c = self.card
+        return (self.tier, -c.highlighted, -self.bumped, -self.start, -self.time_secs, -c.id)
+
+
+def _row_to_entry(r: Any) -> Optional[_Entry]:
+    # даты уже нормализованы триггерами feed_upcoming (bot/db/schema.py)
+    start_d = _parse_day(r["feed_start"])
+    end_d = _parse_day(r["feed_end"])
+    if start_d is None or end_d is None:
+        return None
+
+    end_time = _clean(r["feed_end_time"])
+    end_secs = _parse_secs(end_time) if end_time else _END_OF_DAY
+    event_time = r["event_time"]
+    t = _parse_secs(event_time)
+
+    bumped_at = _clean(r["bumped_at"])
+    bumped_d = _parse_day(bumped_at)
+    bumped = _day_key(bumped_d, _parse_secs(bumped_at[11:19]) or 0) if bumped_d else (1 if bumped_at else 0)
+
+    card = EventCard(
+        id=int(r["id"]),
+        title=str(r["title"] or ""),
+        category=str(r["category"] or ""),
+        category_text=str(r["category_text"] or ""),
+        description=str(r["description"] or ""),
+        start_date=_clean(r["start_date"]) or None,
+        event_date=_clean(r["event_date"]) or None,
+        event_time=_clean(event_time) or None,
+        location=str(r["location"] or ""),
+        price_text=str(r["price_text"] or ""),
+        ticket_link=str(r["ticket_link"] or ""),
+        promoted_kind=str(r["promoted_kind"] or ""),
+        highlighted=int(r["highlighted"] or 0),
+        cover_file_id=_clean(r["cover_file_id"]) or None,
+    )
+    return _Entry(
+        card=card,
+        start=_day_key(start_d),
+        end=_day_key(end_d, end_secs if end_secs is not None else 0),
+        # rank_score: 3 ТОП, 2 подсветка, 1 bump, 0 обычные -> tier 0..3
+        tier=3 - int(r["rank_score"] or 0),
+        bumped=bumped,
+        time_secs=t if t is not None else -1,
+        is_top=bool(r["is_top"]),
+    )
+
+
+# Порядок ленты в SQL (тот же, что у каталога в памяти): ТОП -> подсветка -> bump -> свежие
+FEED_ORDER_SQL = (
+    "f.rank_score DESC, f.highlighted DESC, f.bumped_at DESC,"
+    " f.start_date DESC, f.event_time DESC, f.event_id DESC"
+)
+
+# Каталог грузится из материализованной ленты feed_upcoming + поля карточки из events
+_CATALOG_SQL = """
+SELECT
+    e.id,
+    e.title,
+    e.category,
+    e.category_text,
+    COALESCE(e.description, '') AS description,
+    e.start_date,
+    e.event_date,
+    e.event_time,
+    e.location,
+    e.price_text,
+    e.ticket_link,
+    e.promoted_kind,
+    f.highlighted,
+    f.bumped_at,
+    f.rank_score,
+    f.is_top,
+    f.start_date AS feed_start,
+    f.end_date AS feed_end,
+    f.end_time AS feed_end_time,
+    f.cover_file_id
+FROM feed_upcoming f
+JOIN events e ON e.id = f.event_id
+"""
+
+
+# =========================
+# CATALOG
+# =========================
+class EventCatalog:
+    """
+    In-memory каталог одобренных актуальных событий.
+
+    Колонки лежат в array по "слотам", фильтры — битовые маски (int),
+    сортированные индексы по началу/концу/рангу обновляются через bisect.
+    Лента жителя читается только отсюда, в БД не ходит.
+    """
+
+    def __init__(self) -> None:
+        self.loaded = False
+        self._listeners: list[Callable[["EventCatalog"], None]] = []
+        self._reset()
+
+    def _reset(self) -> None:
+        self._ids = array("q")
+        self._start = array("q")
+        self._end = array("q")
+        self._cat = array("l")
+        self._cat_text = array("l")
+        self._rank = array("b")
+        self._entries: list[Optional[_Entry]] = []
+
+        self._slot_of: dict[int, int] = {}
+        self._free: list[int] = []
+
+        # битовые маски по слотам
+        self._alive = 0
+        self._top = 0
+        self._cat_bits: dict[int, int] = {}
+        self._labels: dict[str, int] = {}
+
+        # сортированные индексы
+        self._by_start: list[tuple[int, int]] = []
+        self._by_end: list[tuple[int, int]] = []
+        self._by_rank: list[tuple[int, ...]] = []
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    # ---------- загрузка / инкрементальные обновления ----------
+    async def load(self) -> None:
+        db = get_db()
+        cur = await db.execute(_CATALOG_SQL)
+        rows = await cur.fetchall()
+
+        self._reset()
+        for r in rows:
+            entry = _row_to_entry(r)
+            if entry is not None:
+                self._put(entry)
+        self.expire()
+        self.loaded = True
+        logger.info("Catalog loaded: %s events", len(self))
+        self._changed()
+
+    async def refresh_event(self, event_id: int) -> None:
+        """Перечитывает одно событие после approve/reject/promote/edit."""
+        # процесс-читатель снапшота каталог не держит — и в БД не ходит
+        if not self.loaded:
+            return
+        db = get_db()
+        cur = await db.execute(_CATALOG_SQL + " WHERE f.event_id = ?", (int(event_id),))
+        row = await cur.fetchone()
+        self._remove(event_id)
+        if row is not None:
+            entry = _row_to_entry(row)
+            if entry is not None:
+                self._put(entry)
+        self._changed()
+
+    async def on_db_change(self, table: str, event_id: Optional[int]) -> None:
+        """Подписчик ChangeBus: запись в БД из другого процесса."""
+        if not self.loaded:
+            return
+        if table == "*":
+            await self.load()
+        elif event_id is not None:
+            await self.refresh_event(event_id)
+
+    def remove(self, event_id: int) -> None:
+        if int(event_id) in self._slot_of:
+            self._remove(event_id)
+            self._changed()
+
+    def subscribe(self, listener: Callable[["EventCatalog"], None]) -> None:
+        """listener(catalog) вызывается после каждого изменения (кроме истечения по времени)."""
+        self._listeners.append(listener)
+
+    def _changed(self) -> None:
+        for listener in self._listeners:
+            try:
+                listener(self)
+            except Exception:
+                logger.exception("Catalog listener failed")
+
+    def _remove(self, event_id: int) -> None:
+        slot = self._slot_of.pop(int(event_id), None)
+        if slot is None:
+            return
+        entry = self._entries[slot]
+        bit = 1 << slot
+
+        self._alive &= ~bit
+        self._top &= ~bit
+        for code in {self._cat[slot], self._cat_text[slot]}:
+            if code in self._cat_bits:
+                self._cat_bits[code] &= ~bit
+
+        self._drop(self._by_start, (self._start[slot], slot))
+        self._drop(self._by_end, (self._end[slot], slot))
+        self._drop(self._by_rank, entry.rank_key() + (slot,))
+
+        self._entries[slot] = None
+        self._free.append(slot)
+
+    def expire(self, now: Optional[int] = None) -> int:
+        """Выкидывает завершившиеся события (голова индекса по концу)."""
+        now = now_key() if now is None else now
+        n = 0
+        while self._by_end and self._by_end[0][0] < now:
+            self._remove(self._ids[self._by_end[0][1]])
+            n += 1
+        return n
+
+    # ---------- чтение ----------
+    def ranked(self) -> list[_Entry]:
+        """Все события в порядке ленты."""
+        return [self._entries[key[-1]] for key in self._by_rank]
+
+    def get(self, event_id: int) -> Optional[EventCard]:
+        slot = self._slot_of.get(int(event_id))
+        return self._entries[slot].card if slot is not None else None
+
+    def query(
+        self,
+        limit: int,
+        days: int | None = None,
+        category: str | None = None,
+        only_top: bool = False,
+        now: Optional[datetime] = None,
+    ) -> list[EventCard]:
+        now = now or datetime.now()
+        self.expire(now_key(now))
+
+        mask = self._alive
+        if only_top:
+            mask &= self._top
+        if category:
+            mask &= self._category_mask(category)
+        if days is not None and mask:
+            # date(start) <= today + (days - 1)
+            cutoff = _day_key(now.date()) + max(days, 1) * 86400
+            hi = bisect_left(self._by_start, (cutoff, -1))
+            window = 0
+            for _, slot in self._by_start[:hi]:
+                window |= 1 << slot
+            mask &= window
+
+        out: list[EventCard] = []
+        if not mask:
+            return out
+        for key in self._by_rank:
+            slot = key[-1]
+            if (mask >> slot) & 1:
+                out.append(self._entries[slot].card)
+                if len(out) >= limit:
+                    break
+        return out
+
+    async def check_consistency(self) -> list[str]:
+        """
+        Сверяет каталог с SQLite. Возвращает список расхождений (пустой — всё ок).
+        """
+        db = get_db()
+        cur = await db.execute(_CATALOG_SQL)
+        rows = await cur.fetchall()
+
+        now = now_key()
+        expected: dict[int, _Entry] = {}
+        for r in rows:
+            entry = _row_to_entry(r)
+            if entry is not None and entry.end >= now:
+                expected[entry.card.id] = entry
+
+        self.expire(now)
+        problems: list[str] = []
+        for event_id in sorted(set(expected) - set(self._slot_of)):
+            problems.append(f"missing in catalog: {event_id}")
+        for event_id in sorted(set(self._slot_of) - set(expected)):
+            problems.append(f"stale in catalog: {event_id}")
+        for event_id in sorted(set(expected) & set(self._slot_of)):
+            if self._entries[self._slot_of[event_id]] != expected[event_id]:
+                problems.append(f"differs: {event_id}")
+        return problems
+
+    # ---------- внутреннее ----------
+    def _code(self, label: str) -> int:
+        if not label:
+            return -1
+        code = self._labels.get(label)
+        if code is None:
+            code = len(self._labels)
+            self._labels[label] = code
+        return code
+
+    def _category_mask(self, category: str) -> int:
+        q = _norm_label(category)
+        mask = 0
+        for label, code in self._labels.items():
+            if q in label:
+                mask |= self._cat_bits.get(code, 0)
+        return mask
+
+    def _put(self, entry: _Entry) -> None:
+        event_id = entry.card.id
+        cat = self._code(_norm_label(entry.card.category))
+        cat_text = self._code(_norm_label(entry.card.category_text))
+
+        if self._free:
+            slot = self._free.pop()
+            self._ids[slot] = event_id
+            self._start[slot] = entry.start
+            self._end[slot] = entry.end
+            self._cat[slot] = cat
+            self._cat_text[slot] = cat_text
+            self._rank[slot] = entry.tier
+            self._entries[slot] = entry
+        else:
+            slot = len(self._entries)
+            self._ids.append(event_id)
+            self._start.append(entry.start)
+            self._end.append(entry.end)
+            self._cat.append(cat)
+            self._cat_text.append(cat_text)
+            self._rank.append(entry.tier)
+            self._entries.append(entry)
+
+        bit = 1 << slot
+        self._slot_of[event_id] = slot
+        self._alive |= bit
+        if entry.is_top:
+            self._top |= bit
+        for code in {cat, cat_text}:
+            if code >= 0:
+                self._cat_bits[code] = self._cat_bits.get(code, 0) | bit
+
+        insort(self._by_start, (entry.start, slot))
+        insort(self._by_end, (entry.end, slot))
+        insort(self._by_rank, entry.rank_key() + (slot,))
+
+    @staticmethod
+    def _drop(index: list, item: tuple) -> None:
+        i = bisect_left(index, item)
+        if i < len(index) and index[i] == item:
+            del index[i]
+
+
+async def fetch_feed_from_db(
+    limit: int,
+    days: int | None = None,
+    category: str | None = None,
+    only_top: bool = False,
+    now: Optional[datetime] = None,
+) -> list[EventCard]:
+    """
+    Та же лента, но запросом к feed_upcoming — когда каталога в процессе нет
+    (например, снапшот писателя ещё не появился). Одинаковые одновременные
+    запросы «на сейчас» склеиваются в один (feed_flight).
+    """
+    if now is None:
+        key = (int(limit), days, category, bool(only_top))
+        return await feed_flight.do(
+            key, lambda: _query_feed(limit, days=days, category=category, only_top=only_top, now=datetime.now())
+        )
+    return await _query_feed(limit, days=days, category=category, only_top=only_top, now=now)
+
+
+async def _query_feed(
+    limit: int,
+    days: int | None,
+    category: str | None,
+    only_top: bool,
+    now: datetime,
+) -> list[EventCard]:
+    today = now.date().isoformat()
+
+    where = ["(f.end_date > ? OR (f.end_date = ? AND (f.end_time = '' OR f.end_time >= ?)))"]
+    params: list[object] = [today, today, now.strftime("%H:%M:%S")]
+
+    if days is not None:
+        date_to = date.fromordinal(now.date().toordinal() + max(days - 1, 0))
+        where.append("f.start_date <= ?")
+        params.append(date_to.isoformat())
+
+    if category:
+        q = _norm_label(category)
+        if q in FEED_CATEGORIES:
+            where.append("f.category_code = ?")
+            params.append(FEED_CATEGORIES.index(q) + 1)
+        else:
+            where.append(
+                "(instr(COALESCE(e.category,''), ?) > 0 OR instr(COALESCE(e.category_text,''), ?) > 0)"
+            )
+            params.extend([category.strip(), category.strip()])
+
+    if only_top:
+        where.append("f.is_top = 1")
+
+    sql = (
+        _CATALOG_SQL
+        + " WHERE " + " AND ".join(where)
+        + " ORDER BY " + FEED_ORDER_SQL
+        + " LIMIT ?"
+    )
+    params.append(int(limit))
+
+    cur = await get_db().execute(sql, tuple(params))
+    rows = await cur.fetchall()
+    out = []
+    for r in rows:
+        entry = _row_to_entry(r)
+        if entry is not None:
+            out.append(entry.card)
+    return out
+
+
+catalog = EventCatalog()
+
+# Источник ленты для хендлеров: сам каталог или читатель общего снапшота
+_feed_source: Any = catalog
+
+
+def feed() -> Any:
+    """EventCatalog или SnapshotReader — у обоих query()/get()/len()."""
+    return _feed_source
+
+
+def use_feed_source(source: Any) -> None:
+    global _feed_source
+    _feed_source = source
@@ -0,0 +1,318 @@
+# bot/services/catalog_snapshot.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from typing import Optional, Sequence
+
+from bot.services.catalog import EventCard, EventCatalog, _Entry, _day_key, _norm_label, now_key
+
+logger = logging.getLogger(__name__)
+
+# Формат файла (little-endian, все колонки выровнены по 8 байт):
+#   header: magic(8) | format(u32) | count(u32) | version(u64) | labels(u32) | pad(u32)
+#   q-колонки: ids, start, end
+#   i-колонки: rank_order (слоты по рангу), by_id (слоты по id), cat, cat_text
+#   b-колонки: highlighted, is_top
+#   u32 offsets: count * len(_STR_FIELDS) + labels + 1 — границы строк в blob
+#   blob: UTF-8 строки подряд
+_MAGIC = b"EVNSNAP1"
+_FORMAT = 1
+_HEADER = struct.Struct("<8sIIQII")
+
+_STR_FIELDS = (
+    "title",
+    "category",
+    "category_text",
+    "description",
+    "start_date",
+    "event_date",
+    "event_time",
+    "location",
+    "price_text",
+    "ticket_link",
+    "promoted_kind",
+    "cover_file_id",
+)
+# поля, где пустая строка означает None
+_OPTIONAL_FIELDS = {"start_date", "event_date", "event_time", "cover_file_id"}
+
+
+def _pad8(n: int) -> int:
+    return (n + 7) & ~7
+
+
+# =========================
+# WRITER
+# =========================
+def write_snapshot(cat: EventCatalog, path: str) -> int:
+    """
+    Пишет снапшот каталога во временный файл и атомарно подменяет path.
+    Возвращает версию снапшота.
+    """
+    return write_entries(cat.ranked(), path)
+
+
+def write_entries(entries: Sequence[_Entry], path: str) -> int:
+    """То же по готовому списку cat.ranked() — без доступа к каталогу, можно из потока."""
+    n = len(entries)
+
+    labels: dict[str, int] = {}
+
+    def code(label: str) -> int:
+        if not label:
+            return -1
+        return labels.setdefault(label, len(labels))
+
+    ids = array("q", (e.card.id for e in entries))
+    start = array("q", (e.start for e in entries))
+    end = array("q", (e.end for e in entries))
+    rank_order = array("i", range(n))  # entries уже в порядке ленты
+    by_id = array("i", sorted(range(n), key=lambda i: ids[i]))
+    cats = array("i", (code(_norm_label(e.card.category)) for e in entries))
+    cats_text = array("i", (code(_norm_label(e.card.category_text)) for e in entries))
+    highlighted = array("b", (1 if e.card.highlighted == 1 else 0 for e in entries))
+    is_top = array("b", (1 if e.is_top else 0 for e in entries))
+
+    blob = bytearray()
+    offsets = array("I", [0])
+    for e in entries:
+        for field in _STR_FIELDS:
+            blob += (getattr(e.card, field) or "").encode("utf-8")
+            offsets.append(len(blob))
+    for label in labels:
+        blob += label.encode("utf-8")
+        offsets.append(len(blob))
+
+    version = time.time_ns()
+    header = _HEADER.pack(_MAGIC, _FORMAT, n, version, len(labels), 0)
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(header)
+        for col in (ids, start, end, rank_order, by_id, cats, cats_text, highlighted, is_top, offsets):
+            raw = col.tobytes()
+            f.write(raw)
+            f.write(b"\0" * (_pad8(len(raw)) - len(raw)))
+        f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return version
+
+
+class SnapshotPublisher:
+    """
+    Процесс-писатель: публикует снапшот после изменений каталога.
+
+    Изменения склеиваются: первое запускает запись через delay секунд, всё, что
+    пришло за это время (и во время записи), попадает в тот же или следующий
+    снапшот. Список событий берётся в цикле событий, а сериализация, fsync и
+    replace идут в потоке — хендлеры не ждут диска.
+    """
+
+    def __init__(self, path: str, delay: float = 0.5) -> None:
+        self.path = path
+        self.delay = delay
+        self.version = 0
+        self._cat: Optional[EventCatalog] = None
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+        self._flush = asyncio.Event()
+
+    def attach(self, cat: EventCatalog) -> None:
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        cat.subscribe(self.publish)
+        if cat.loaded:
+            self.publish(cat)
+
+    def publish(self, cat: EventCatalog) -> None:
+        self._cat = cat
+        self._dirty = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="catalog-snapshot")
+
+    async def _run(self) -> None:
+        while self._dirty:
+            try:
+                await asyncio.wait_for(self._flush.wait(), timeout=self.delay)
+            except asyncio.TimeoutError:
+                pass
+            await self._write()
+
+    async def _write(self) -> None:
+        self._dirty = False
+        entries = self._cat.ranked()
+        try:
+            self.version = await asyncio.to_thread(write_entries, entries, self.path)
+        except OSError:
+            logger.exception("Catalog snapshot publish failed: %s", self.path)
+
+    async def stop(self) -> None:
+        """Не ждём delay: последнее состояние каталога — на диск сразу, начатую запись дописываем."""
+        self._flush.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+
+# =========================
+# READER
+# =========================
+class _Mapped:
+    """Один смэпленный снапшот. Колонки — memoryview поверх mmap, без копирования."""
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            self.stat_key = (st.st_ino, st.st_mtime_ns, st.st_size)
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, fmt, n, version, n_labels, _ = _HEADER.unpack_from(self.mm, 0)
+        if magic != _MAGIC or fmt != _FORMAT:
+            raise ValueError(f"bad catalog snapshot: {path}")
+        self.n = n
+        self.version = version
+
+        buf = memoryview(self.mm)
+        pos = _HEADER.size
+
+        def take(fmt_char: str, count: int) -> memoryview:
+            nonlocal pos
+            size = struct.calcsize(fmt_char) * count
+            view = buf[pos:pos + size].cast(fmt_char)
+            pos += _pad8(size)
+            return view
+
+        self.ids = take("q", n)
+        self.start = take("q", n)
+        self.end = take("q", n)
+        self.rank_order = take("i", n)
+        self.by_id = take("i", n)
+        self.cat = take("i", n)
+        self.cat_text = take("i", n)
+        self.highlighted = take("b", n)
+        self.is_top = take("b", n)
+        self.offsets = take("I", n * len(_STR_FIELDS) + n_labels + 1)
+        self.blob = buf[pos:]
+
+        base = n * len(_STR_FIELDS)
+        self.labels = {self._str(base + i): i for i in range(n_labels)}
+
+    def _str(self, i: int) -> str:
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def card(self, slot: int) -> EventCard:
+        base = slot * len(_STR_FIELDS)
+        values = {}
+        for k, field in enumerate(_STR_FIELDS):
+            v = self._str(base + k)
+            values[field] = (v or None) if field in _OPTIONAL_FIELDS else v
+        return EventCard(id=self.ids[slot], highlighted=self.highlighted[slot], **values)
+
+    def find(self, event_id: int) -> Optional[int]:
+        i = bisect_left(self.by_id, event_id, key=lambda slot: self.ids[slot])
+        if i < self.n and self.ids[self.by_id[i]] == event_id:
+            return self.by_id[i]
+        return None
+
+
+class SnapshotReader:
+    """
+    Процесс-читатель: ленту отдаёт прямо из общего mmap-файла.
+    Память не растёт с числом воркеров, прогрев запросом в БД не нужен.
+    """
+
+    def __init__(self, path: str, check_interval: float = 1.0) -> None:
+        self.path = path
+        self.check_interval = check_interval
+        self._mapped: Optional[_Mapped] = None
+        self._checked_at = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return self._current() is not None
+
+    def __len__(self) -> int:
+        m = self._current()
+        return m.n if m else 0
+
+    @property
+    def version(self) -> int:
+        m = self._current()
+        return m.version if m else 0
+
+    def _current(self) -> Optional[_Mapped]:
+        now = time.monotonic()
+        if self._mapped is not None and now - self._checked_at < self.check_interval:
+            return self._mapped
+        self._checked_at = now
+
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return self._mapped
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if self._mapped is None or self._mapped.stat_key != key:
+            try:
+                # атомарная подмена: старый mmap освободится, когда на него не останется ссылок
+                self._mapped = _Mapped(self.path)
+            except (OSError, ValueError):
+                logger.exception("Catalog snapshot map failed: %s", self.path)
+        return self._mapped
+
+    def get(self, event_id: int) -> Optional[EventCard]:
+        m = self._current()
+        if m is None:
+            return None
+        slot = m.find(int(event_id))
+        if slot is None or m.end[slot] < now_key():
+            return None
+        return m.card(slot)
+
+    def query(
+        self,
+        limit: int,
+        days: int | None = None,
+        category: str | None = None,
+        only_top: bool = False,
+        now: Optional[datetime] = None,
+    ) -> list[EventCard]:
+        m = self._current()
+        if m is None:
+            return []
+
+        now = now or datetime.now()
+        current = now_key(now)
+        cutoff = _day_key(now.date()) + max(days, 1) * 86400 if days is not None else None
+
+        codes: Optional[set[int]] = None
+        if category:
+            q = _norm_label(category)
+            codes = {code for label, code in m.labels.items() if q in label}
+            if not codes:
+                return []
+
+        out: list[EventCard] = []
+        for slot in m.rank_order:
+            if m.end[slot] < current:
+                continue
+            if only_top and not m.is_top[slot]:
+                continue
+            if cutoff is not None and m.start[slot] >= cutoff:
+                continue
+            if codes is not None and m.cat[slot] not in codes and m.cat_text[slot] not in codes:
+                continue
+            out.append(m.card(slot))
+            if len(out) >= limit:
+                break
+        return out
@@ -0,0 +1,151 @@
+# bot/services/channel.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Optional, Union
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, InputMediaPhoto
+
+from bot.config import get_settings
+from bot.db.repositories import repo
+from bot.services.outbox import outbox_dispatcher
+from bot.utils.cards import channel_markup, fetch_event_card, format_card_text, send_event_card
+
+logger = logging.getLogger(__name__)
+
+WITHDRAWN_TEXT = "❌ <b>Мероприятие снято с публикации</b>"
+
+
+def _chat_id(raw: str) -> Union[int, str]:
+    raw = raw.strip()
+    return int(raw) if raw.lstrip("-").isdigit() else raw
+
+
+def _not_modified(e: TelegramBadRequest) -> bool:
+    return "message is not modified" in str(e).lower()
+
+
+class ChannelPublisher:
+    """
+    Публикация одобренных событий в канал CHANNEL_ID — один пост на всех подписчиков
+    канала вместо рассылки каждому.
+
+    Кнопки поста — channel_markup (только URL: билеты и «Подробнее в боте»), без
+    callback'ов ленты.
+
+    Работает через outbox: 'channel_post' ставит approve_event, 'channel_sync' —
+    триггер на events, когда у события с постом меняются поля карточки или оно
+    удалено. Пост — та же карточка, что в ленте (send_event_card: афиша, подпись,
+    кнопки); правка — по message_id из channel_posts, устаревшие правки (version
+    меньше текущей) пропускаются. Снятое / удалённое событие — пост удаляем, а если
+    Telegram не даёт (старый пост) — заменяем текст на WITHDRAWN_TEXT.
+
+    interval — пауза между запросами в канал (Telegram: ~20 сообщений в минуту на чат).
+    """
+
+    def __init__(self, interval: float = 3.0) -> None:
+        self.interval = interval
+        self._next_call = 0.0
+
+    async def _pace(self) -> None:
+        now = time.monotonic()
+        if self._next_call > now:
+            await asyncio.sleep(self._next_call - now)
+        self._next_call = max(now, self._next_call) + self.interval
+
+    async def _markup(self, bot: Bot, card: Any) -> Optional[InlineKeyboardMarkup]:
+        me = await bot.me()  # aiogram кэширует getMe
+        return channel_markup(card, me.username)
+
+    async def publish(self, bot: Bot, payload: dict[str, Any]) -> None:
+        event_id = int(payload["event_id"])
+        channel = get_settings().channel_id
+        if not channel:
+            return
+        if await repo.get_channel_post(event_id) is not None:
+            # повторное одобрение — пост уже есть, приводим его к текущему виду
+            await self.sync(bot, {"event_id": event_id})
+            return
+        event = await repo.get_event(event_id)
+        card = await fetch_event_card(event_id)
+        if event is None or event.status != "approved" or card is None:
+            return
+
+        markup = await self._markup(bot, card)
+        await self._pace()
+        msg = await send_event_card(bot, _chat_id(channel), card, markup=markup)
+        await repo.save_channel_post(event_id, channel, msg.message_id, bool(msg.photo), card.cover_file_id)
+        logger.info("Channel: event_id=%s posted as message_id=%s", event_id, msg.message_id)
+
+    async def sync(self, bot: Bot, payload: dict[str, Any]) -> None:
+        event_id = int(payload["event_id"])
+        post = await repo.get_channel_post(event_id)
+        if post is None:
+            return
+        version = int(payload.get("version") or post["version"])
+        if version < int(post["version"]) or version <= int(post["synced_version"]):
+            # за этой правкой в очереди уже есть более новая
+            return
+        chat_id, message_id = _chat_id(post["chat_id"]), int(post["message_id"])
+
+        event = await repo.get_event(event_id)
+        card = await fetch_event_card(event_id) if event is not None else None
+        if event is None or event.status != "approved" or card is None:
+            await self._withdraw(bot, post)
+            await repo.delete_channel_post(event_id)
+            return
+
+        text, _ = format_card_text(card)
+        markup = await self._markup(bot, card)
+        await self._pace()
+        try:
+            if post["has_photo"] and card.cover_file_id and card.cover_file_id != post["cover_file_id"]:
+                await bot.edit_message_media(
+                    chat_id=chat_id,
+                    message_id=message_id,
+                    media=InputMediaPhoto(media=card.cover_file_id, caption=text, parse_mode="HTML"),
+                    reply_markup=markup,
+                )
+            elif post["has_photo"]:
+                await bot.edit_message_caption(
+                    chat_id=chat_id, message_id=message_id, caption=text, reply_markup=markup, parse_mode="HTML"
+                )
+            else:
+                await bot.edit_message_text(
+                    text, chat_id=chat_id, message_id=message_id, reply_markup=markup, parse_mode="HTML"
+                )
+        except TelegramBadRequest as e:
+            if not _not_modified(e):
+                raise
+        await repo.mark_channel_post_synced(event_id, version, card.cover_file_id if post["has_photo"] else None)
+
+    async def _withdraw(self, bot: Bot, post: Any) -> None:
+        chat_id, message_id = _chat_id(post["chat_id"]), int(post["message_id"])
+        await self._pace()
+        try:
+            await bot.delete_message(chat_id, message_id)
+            return
+        except TelegramBadRequest as e:
+            logger.info("Channel: cannot delete message_id=%s (%s), editing instead", message_id, e)
+        try:
+            if post["has_photo"]:
+                await bot.edit_message_caption(
+                    chat_id=chat_id, message_id=message_id, caption=WITHDRAWN_TEXT, reply_markup=None, parse_mode="HTML"
+                )
+            else:
+                await bot.edit_message_text(
+                    WITHDRAWN_TEXT, chat_id=chat_id, message_id=message_id, reply_markup=None, parse_mode="HTML"
+                )
+        except TelegramBadRequest as e:
+            if not _not_modified(e):
+                logger.warning("Channel: cannot withdraw message_id=%s: %s", message_id, e)
+
+
+channel_publisher = ChannelPublisher()
+
+outbox_dispatcher.register("channel_post", channel_publisher.publish)
+outbox_dispatcher.register("channel_sync", channel_publisher.sync)
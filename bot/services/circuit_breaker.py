@@ -0,0 +1,126 @@
+# bot/services/circuit_breaker.py
+from __future__ import annotations
+
+import html
+import logging
+import time
+from collections import deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Внешний сервис признан недоступным — запрос даже не отправляли."""
+
+    def __init__(self, name: str, retry_in: float) -> None:
+        super().__init__(f"{name}: circuit open, retry in {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Автомат closed -> open -> half_open -> closed.
+
+    closed: считаем исходы последних window вызовов; при min_calls и доле
+    ошибок >= failure_ratio — open. open: все вызовы сразу CircuitOpenError,
+    пока не пройдёт open_seconds. half_open: пропускаем один пробный вызов;
+    успех закрывает автомат, ошибка снова открывает.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        window: int = 20,
+        min_calls: int = 5,
+        failure_ratio: float = 0.5,
+        open_seconds: float = 30.0,
+    ) -> None:
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._results: deque[bool] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.rejected = 0
+        self.opened_count = 0
+        self.last_error: Optional[str] = None
+
+    def _retry_in(self) -> float:
+        return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    def before_call(self) -> None:
+        """Вызывать перед запросом: либо пропускает, либо бросает CircuitOpenError."""
+        if self.state == OPEN:
+            if self._retry_in() > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self._retry_in())
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+            logger.info("Circuit %s: half-open, probing", self.name)
+
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, 0.0)
+            self._probe_in_flight = True
+
+    def release(self) -> None:
+        """Вызов прерван без результата (отмена)."""
+        self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        if self.state == HALF_OPEN:
+            logger.info("Circuit %s: closed", self.name)
+            self.state = CLOSED
+            self._results.clear()
+            self._probe_in_flight = False
+        self._results.append(True)
+
+    def record_failure(self, error: Optional[BaseException] = None) -> None:
+        if error is not None:
+            self.last_error = f"{type(error).__name__}: {error}"[:200]
+        if self.state == HALF_OPEN:
+            self._open()
+            return
+        self._results.append(False)
+        failures = self._results.count(False)
+        if len(self._results) >= self.min_calls and failures / len(self._results) >= self.failure_ratio:
+            self._open()
+
+    def _open(self) -> None:
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self._results.clear()
+        self.opened_count += 1
+        logger.warning("Circuit %s: open for %.0fs (%s)", self.name, self.open_seconds, self.last_error)
+
+    @property
+    def available(self) -> bool:
+        """Можно ли сейчас рассчитывать на сервис (без изменения состояния)."""
+        return self.state == CLOSED or (self.state == OPEN and self._retry_in() <= 0) or (
+            self.state == HALF_OPEN and not self._probe_in_flight
+        )
+
+    def describe(self) -> str:
+        failures = self._results.count(False)
+        text = (
+            f"{self.name}: <b>{self.state}</b>\n"
+            f"ошибок в окне: {failures}/{len(self._results)}\n"
+            f"открывался: {self.opened_count}, отклонено вызовов: {self.rejected}"
+        )
+        if self.state == OPEN:
+            text += f"\nпробный запрос через: {self._retry_in():.0f}с"
+        if self.last_error:
+            text += f"\nпоследняя ошибка: {html.escape(self.last_error)}"
+        return text
@@ -0,0 +1,100 @@
+# bot/services/digest.py
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, time, timedelta
+from typing import Any, Optional
+
+from aiogram import Bot
+
+from bot.db.repositories import repo
+from bot.services.outbox import outbox_dispatcher
+from bot.utils.cards import fetch_event_card, send_digest
+
+logger = logging.getLogger(__name__)
+
+DIGEST_HEADER = "📰 <b>Новое в афише</b>"
+
+
+def _parse_time(value: str) -> Optional[time]:
+    try:
+        return time.fromisoformat(value.strip())
+    except ValueError:
+        return None
+
+
+class DigestScheduler:
+    """
+    Ежедневный дайджест для жителей, включивших его в «🔔 Подписки».
+
+    Раз в день в at (локальное время) repo.enqueue_digests() одним запросом собирает
+    для всех сразу топ size новых событий и ставит по одной записи outbox на
+    пользователя; доставку ведёт OutboxDispatcher в своём темпе. Запуск после
+    перезапуска в тот же день безопасен — кто уже получил, второй раз не получит.
+    """
+
+    def __init__(self, at: str = "10:00", size: int = 5) -> None:
+        self.at = at
+        self.size = size
+        self._at: Optional[time] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._at = _parse_time(self.at)
+        if self._at is None:
+            logger.info("Digest disabled (DIGEST_TIME=%r)", self.at)
+            return
+        self._task = asyncio.create_task(self._run(), name="digest-scheduler")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _next_run(self, now: datetime) -> datetime:
+        run = datetime.combine(now.date(), self._at)
+        return run if run > now else run + timedelta(days=1)
+
+    async def run_once(self, now: Optional[datetime] = None) -> int:
+        now = now or datetime.now()
+        queued = await repo.enqueue_digests(now.date().isoformat(), self.size)
+        if queued:
+            outbox_dispatcher.wake()
+        logger.info("Digest %s: %s queued", now.date().isoformat(), queued)
+        return queued
+
+    async def _run(self) -> None:
+        # проспали время рассылки (перезапуск) — догоняем сразу
+        if datetime.now().time() >= self._at:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Digest failed")
+        while True:
+            now = datetime.now()
+            await asyncio.sleep((self._next_run(now) - now).total_seconds())
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Digest failed")
+
+
+async def _send_digest(bot: Bot, payload: dict[str, Any]) -> None:
+    """Обработчик outbox 'digest' (пишет enqueue_digests)."""
+    cards = [await fetch_event_card(int(event_id)) for event_id in payload.get("event_ids") or []]
+    cards = [c for c in cards if c is not None]
+    if not cards:
+        return
+    await send_digest(bot, int(payload["user_id"]), cards, header=DIGEST_HEADER)
+
+
+outbox_dispatcher.register("digest", _send_digest)
+
+digest_scheduler = DigestScheduler()
@@ -0,0 +1,52 @@
+# bot/services/feed_sweeper.py
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Optional
+
+from bot.db.repositories import repo
+from bot.services.catalog import catalog
+
+logger = logging.getLogger(__name__)
+
+
+class FeedSweeper:
+    """Периодически чистит feed_upcoming и каталог от завершившихся событий."""
+
+    def __init__(self, interval: float = 300.0) -> None:
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="feed-sweeper")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def sweep_once(self) -> int:
+        removed = await repo.sweep_feed_upcoming()
+        if catalog.loaded:
+            catalog.expire()
+        if removed:
+            logger.info("Feed sweep: removed %s ended events", removed)
+        return removed
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.sweep_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Feed sweep failed")
+            await asyncio.sleep(self.interval)
+
+
+feed_sweeper = FeedSweeper()
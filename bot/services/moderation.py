@@ -0,0 +1,47 @@
+# bot/services/moderation.py
+from __future__ import annotations
+
+import html
+import logging
+from typing import Any
+
+from aiogram import Bot
+
+from bot.db.repositories import repo
+from bot.services.broadcast import broadcast_engine
+from bot.services.outbox import outbox_dispatcher
+
+logger = logging.getLogger(__name__)
+
+
+async def apply_moderation(event_id: int, approve: bool, admin_id: int | None = None) -> bool:
+    """
+    Решение модерации: repo.moderate_event пишет статус и все уведомления одной
+    транзакцией (организатору, подписчикам, в канал), здесь только будим доставку.
+    """
+    if approve:
+        ok = await repo.approve_event(event_id, admin_id=admin_id)
+    else:
+        ok = await repo.reject_event(event_id, admin_id=admin_id)
+    if ok:
+        logger.info("MODERATION: event_id=%s %s by admin_id=%s", event_id, "approved" if approve else "rejected", admin_id)
+        if approve:
+            broadcast_engine.wake()
+        outbox_dispatcher.wake()
+    return ok
+
+
+async def _send_event_moderated(bot: Bot, payload: dict[str, Any]) -> None:
+    """Обработчик outbox 'event_moderated' (пишет moderate_event)."""
+    title = html.escape(str(payload.get("title") or ""))
+    if payload["status"] == "approved":
+        text = f"✅ Твоё событие <b>{title}</b> прошло модерацию и опубликовано в ленте!"
+    else:
+        text = (
+            f"❌ Событие <b>{title}</b> не прошло модерацию.\n"
+            "Проверь описание и данные и создай событие заново."
+        )
+    await bot.send_message(int(payload["organizer_id"]), text)
+
+
+outbox_dispatcher.register("event_moderated", _send_event_moderated)
@@ -0,0 +1,127 @@
+# bot/services/outbox.py
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from typing import Any, Awaitable, Callable, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from bot.db.repositories import repo
+from bot.utils.rate_limit import send_limiter
+
+logger = logging.getLogger(__name__)
+
+OutboxHandler = Callable[[Bot, dict[str, Any]], Awaitable[None]]
+
+
+class OutboxDispatcher:
+    """
+    Доставляет записи outbox (их пишут в одной транзакции с изменением состояния).
+
+    Обработчик на kind регистрируется через register(); исключение обработчика —
+    повтор с экспоненциальной паузой, после max_attempts запись остаётся со статусом failed.
+    Бот заблокирован / чат не найден — повторять бессмысленно, сразу failed.
+    wake() — не ждать interval после новой записи.
+
+    Темп — общий с рассылками send_limiter (дайджесты ставят тысячи записей разом);
+    полная пачка — следующая берётся сразу, без ожидания interval.
+    """
+
+    def __init__(
+        self,
+        interval: float = 5.0,
+        batch: int = 50,
+        max_attempts: int = 8,
+        min_delay: float = 10.0,
+        max_delay: float = 3600.0,
+    ) -> None:
+        self.interval = interval
+        self.batch = batch
+        self.max_attempts = max_attempts
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.bot: Optional[Bot] = None
+        self._handlers: dict[str, OutboxHandler] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.counters = {"sent": 0, "retried": 0, "failed": 0}
+
+    def register(self, kind: str, handler: OutboxHandler) -> None:
+        self._handlers[kind] = handler
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    async def start(self, bot: Bot) -> None:
+        self.bot = bot
+        self._task = asyncio.create_task(self._run(), name="outbox-dispatcher")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                while await self.dispatch_once() >= self.batch:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Outbox dispatch failed")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def dispatch_once(self) -> int:
+        rows = await repo.get_due_outbox(limit=self.batch)
+        for row in rows:
+            await send_limiter.acquire()
+            await self._deliver(row)
+        return len(rows)
+
+    async def _deliver(self, row: Any) -> None:
+        outbox_id, kind, attempts = int(row["id"]), str(row["kind"]), int(row["attempts"])
+        handler = self._handlers.get(kind)
+        if handler is None:
+            await repo.mark_outbox_failed(outbox_id, f"no handler for kind {kind!r}", retry_in=None)
+            self.counters["failed"] += 1
+            return
+        try:
+            payload = json.loads(row["payload_json"] or "{}")
+            await handler(self.bot, payload)
+        except TelegramRetryAfter as e:
+            # лимит общий для бота — притормаживаем всю очередь
+            send_limiter.pause(float(e.retry_after))
+            await repo.mark_outbox_failed(outbox_id, str(e), retry_in=float(e.retry_after))
+            self.counters["retried"] += 1
+        except (TelegramForbiddenError, TelegramBadRequest, ValueError) as e:
+            logger.warning("Outbox %s id=%s dropped: %s", kind, outbox_id, e)
+            await repo.mark_outbox_failed(outbox_id, f"{type(e).__name__}: {e}", retry_in=None)
+            self.counters["failed"] += 1
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if attempts + 1 >= self.max_attempts:
+                logger.exception("Outbox %s id=%s failed after %s attempts", kind, outbox_id, attempts + 1)
+                await repo.mark_outbox_failed(outbox_id, error, retry_in=None)
+                self.counters["failed"] += 1
+            else:
+                delay = min(self.max_delay, self.min_delay * (2 ** attempts))
+                await repo.mark_outbox_failed(outbox_id, error, retry_in=delay)
+                self.counters["retried"] += 1
+        else:
+            await repo.mark_outbox_sent(outbox_id)
+            self.counters["sent"] += 1
+
+
+outbox_dispatcher = OutboxDispatcher()
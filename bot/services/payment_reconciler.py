@@ -0,0 +1,189 @@
+# bot/services/payment_reconciler.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from aiogram import Bot
+
+from bot.db.repositories import PromoOrder, repo
+from bot.services.yookassa_client import get_yookassa_client, yookassa_breaker
+from bot.services.yu_cassa_service import (
+    apply_paid_order,
+    order_payment_id,
+    resume_queued_order,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Backoff:
+    attempts: int = 0
+    next_at: float = 0.0
+
+
+class PaymentReconciler:
+    """
+    Сверка незакрытых promo_orders с ЮKassa без участия пользователя.
+
+    Раз в interval секунд проходит заказы в created/new (от старых к новым),
+    спрашивает статус платежа не более чем concurrency запросами сразу:
+    succeeded -> применяет услугу, canceled -> отменяет, висит дольше ttl -> expired.
+    Заказам в queued (ЮKassa была недоступна) создаёт платёж и шлёт ссылку.
+    Заказы с неизменным статусом повторно проверяются с экспоненциальной паузой.
+    Пока автомат yookassa_breaker открыт, проход пропускается.
+    """
+
+    def __init__(
+        self,
+        interval: float = 60.0,
+        batch: int = 100,
+        concurrency: int = 5,
+        ttl: timedelta = timedelta(hours=24),
+        min_delay: float = 30.0,
+        max_delay: float = 1800.0,
+    ) -> None:
+        self.interval = interval
+        self.batch = batch
+        self.concurrency = concurrency
+        self.ttl = ttl
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.bot: Optional[Bot] = None
+        self._backoff: dict[int, _Backoff] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.counters = {
+            "checked": 0,
+            "settled": 0,
+            "resumed": 0,
+            "canceled": 0,
+            "expired": 0,
+            "pending": 0,
+            "errors": 0,
+        }
+
+    async def start(self, bot: Optional[Bot] = None) -> None:
+        self.bot = bot
+        self._task = asyncio.create_task(self._run(), name="payment-reconciler")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.reconcile_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Payment reconcile failed")
+            await asyncio.sleep(self.interval)
+
+    async def reconcile_once(self) -> dict[str, int]:
+        if not yookassa_breaker.available:
+            return {}
+        before = dict(self.counters)
+        now = time.monotonic()
+        sem = asyncio.Semaphore(self.concurrency)
+        seen: set[int] = set()
+
+        async def guarded(order: PromoOrder) -> None:
+            async with sem:
+                await self._reconcile_order(order)
+
+        after: Optional[tuple[str, int]] = None
+        while True:
+            orders = await repo.get_unsettled_orders(limit=self.batch, after=after)
+            if not orders:
+                break
+            after = (orders[-1].created_at, orders[-1].id)
+            due = []
+            for order in orders:
+                seen.add(order.id)
+                state = self._backoff.get(order.id)
+                if state is None or state.next_at <= now:
+                    due.append(order)
+            await asyncio.gather(*(guarded(o) for o in due))
+            if len(orders) < self.batch:
+                break
+
+        # закрытые кем-то другим (вебхук, кнопка) больше не отслеживаем
+        for order_id in set(self._backoff) - seen:
+            self._backoff.pop(order_id, None)
+
+        delta = {k: self.counters[k] - before[k] for k in self.counters}
+        if any(delta.values()):
+            logger.info("Payment reconcile: %s", " ".join(f"{k}={v}" for k, v in delta.items()))
+        return delta
+
+    def _expired(self, order: PromoOrder) -> bool:
+        try:
+            created = datetime.fromisoformat(order.created_at)
+        except ValueError:
+            return False
+        # created_at пишет SQLite: datetime('now') — UTC
+        return datetime.now(timezone.utc).replace(tzinfo=None) - created > self.ttl
+
+    def _defer(self, order_id: int) -> None:
+        state = self._backoff.setdefault(order_id, _Backoff())
+        delay = min(self.max_delay, self.min_delay * (2 ** state.attempts))
+        state.attempts += 1
+        state.next_at = time.monotonic() + delay
+
+    async def _reconcile_order(self, order: PromoOrder) -> None:
+        payment_id = order_payment_id(order)
+        if order.status == "queued" and not payment_id and not self._expired(order):
+            try:
+                if await resume_queued_order(self.bot, order):
+                    self.counters["resumed"] += 1
+                self._backoff.pop(order.id, None)
+            except Exception:
+                self.counters["errors"] += 1
+                logger.warning("Payment reconcile: resume failed order_id=%s", order.id, exc_info=True)
+                self._defer(order.id)
+            return
+
+        if not payment_id:
+            # платёж так и не создали — ждать нечего
+            if self._expired(order) and await repo.mark_order_expired(order.id):
+                self.counters["expired"] += 1
+            return
+
+        try:
+            payment = await get_yookassa_client().get_payment(payment_id)
+        except Exception:
+            self.counters["errors"] += 1
+            logger.warning("Payment reconcile: status check failed order_id=%s", order.id, exc_info=True)
+            self._defer(order.id)
+            return
+
+        self.counters["checked"] += 1
+        if payment.status == "succeeded":
+            if await apply_paid_order(order, payment_id):
+                self.counters["settled"] += 1
+            self._backoff.pop(order.id, None)
+        elif payment.status == "canceled":
+            if await repo.mark_order_canceled(order.id):
+                self.counters["canceled"] += 1
+            self._backoff.pop(order.id, None)
+        elif self._expired(order):
+            if await repo.mark_order_expired(order.id):
+                self.counters["expired"] += 1
+            self._backoff.pop(order.id, None)
+        else:
+            self.counters["pending"] += 1
+            self._defer(order.id)
+
+
+payment_reconciler = PaymentReconciler()
@@ -0,0 +1,108 @@
+# bot/services/promo_expiry.py
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+from datetime import datetime
+from typing import Optional
+
+from bot.db.repositories import repo
+from bot.services.catalog import catalog
+
+logger = logging.getLogger(__name__)
+
+
+class PromoExpiryScheduler:
+    """
+    Снимает оплаченные продвижения по events.promoted_until.
+
+    Куча (promoted_until, event_id) собирается из БД на старте, поэтому сроки
+    переживают перезапуск. Задача спит до ближайшего срока (не опрашивает БД),
+    новая оплата будит её через schedule(). Снятие — пачками по batch событий
+    одним UPDATE; ленту пересчитывают триггеры, каталог обновляется по id.
+    Устаревшие элементы кучи (срок продлили) безвредны: истёкшее решает UPDATE.
+    max_sleep — страховка от сроков, поставленных другими процессами.
+    """
+
+    def __init__(self, batch: int = 200, max_sleep: float = 3600.0) -> None:
+        self.batch = batch
+        self.max_sleep = max_sleep
+        self._heap: list[tuple[str, int]] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.expired = 0
+
+    async def start(self) -> None:
+        self._heap = await repo.get_promotion_deadlines()
+        heapq.heapify(self._heap)
+        self._task = asyncio.create_task(self._run(), name="promo-expiry")
+        logger.info("Promo expiry: %s active promotions", len(self._heap))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def schedule(self, event_id: int, until: str) -> None:
+        head = self._heap[0][0] if self._heap else None
+        heapq.heappush(self._heap, (until, int(event_id)))
+        if head is None or until < head:
+            self._wakeup.set()
+
+    async def schedule_event(self, event_id: int) -> None:
+        """Срок уже записан в events (settle_order) — поставить его в кучу."""
+        until = await repo.get_promoted_until(event_id)
+        if until:
+            self.schedule(event_id, until)
+
+    def _delay(self) -> float:
+        if not self._heap:
+            return self.max_sleep
+        try:
+            deadline = datetime.fromisoformat(self._heap[0][0])
+        except ValueError:
+            return 0.0
+        # promoted_until пишется в локальном времени (как _now_iso)
+        return min(self.max_sleep, max(0.0, (deadline - datetime.now()).total_seconds()))
+
+    async def expire_due(self, now: Optional[datetime] = None) -> int:
+        now = now or datetime.now()
+        now_iso = now.isoformat(timespec="seconds")
+        while self._heap and self._heap[0][0] <= now_iso:
+            heapq.heappop(self._heap)
+
+        total = 0
+        while True:
+            ids = await repo.expire_promotions(now=now, limit=self.batch)
+            for event_id in ids:
+                await catalog.refresh_event(event_id)
+            total += len(ids)
+            if len(ids) < self.batch:
+                break
+        if total:
+            self.expired += total
+            logger.info("Promo expiry: %s promotions lapsed", total)
+        return total
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._delay())
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.expire_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Promo expiry failed")
+                await asyncio.sleep(30)
+
+
+promo_expiry = PromoExpiryScheduler()
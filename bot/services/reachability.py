@@ -0,0 +1,88 @@
+# bot/services/reachability.py
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from bot.db.repositories import repo
+
+logger = logging.getLogger(__name__)
+
+
+def is_unreachable_error(error: BaseException) -> bool:
+    """Бот заблокирован / чат удалён — писать туда бессмысленно."""
+    if isinstance(error, TelegramForbiddenError):
+        return True
+    return isinstance(error, TelegramBadRequest) and "chat not found" in str(error).lower()
+
+
+class ReachabilityTracker:
+    """
+    Кто из пользователей жив: users.last_seen_at и users.unreachable_at.
+
+    touch() на каждый апдейт только пишет в dict (последнее значение на пользователя),
+    раз в interval секунд всё накопленное уходит в users одним пакетным upsert.
+    Новый апдейт от пользователя снимает отметку unreachable — он снова доступен.
+    """
+
+    def __init__(self, interval: float = 30.0) -> None:
+        self.interval = interval
+        self._seen: dict[int, str] = {}
+        self._unreachable: dict[int, str] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.flushed = 0
+
+    def touch(self, user_id: int) -> None:
+        self._seen[int(user_id)] = datetime.now().isoformat(timespec="seconds")
+        self._unreachable.pop(int(user_id), None)
+
+    def mark_unreachable(self, user_id: int) -> None:
+        self._unreachable[int(user_id)] = datetime.now().isoformat(timespec="seconds")
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="reachability-flush")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # последние отметки не теряем
+        await self.flush()
+
+    async def flush(self) -> int:
+        if not self._seen and not self._unreachable:
+            return 0
+        seen, self._seen = self._seen, {}
+        unreachable, self._unreachable = self._unreachable, {}
+        try:
+            await repo.touch_users(seen.items(), unreachable.items())
+        except Exception:
+            # вернём в буфер, более свежие значения не затираем
+            for user_id, ts in seen.items():
+                self._seen.setdefault(user_id, ts)
+            for user_id, ts in unreachable.items():
+                self._unreachable.setdefault(user_id, ts)
+            raise
+        self.flushed += len(seen) + len(unreachable)
+        return len(seen) + len(unreachable)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Reachability flush failed")
+
+
+reachability = ReachabilityTracker()
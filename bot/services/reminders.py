@@ -0,0 +1,141 @@
+# bot/services/reminders.py
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from aiogram import Bot
+
+from bot.db.repositories import repo
+from bot.models.reminder import DEFAULT_LEAD
+from bot.services.outbox import outbox_dispatcher
+from bot.utils.cards import fetch_event_card
+from bot.utils.notifications import send_reminder
+
+logger = logging.getLogger(__name__)
+
+
+class ReminderScheduler:
+    """
+    Срабатывание напоминаний «🔔 Напомнить» (таблица reminders).
+
+    В памяти — только ближайшее окно: куча (remind_at, id) ожидающих напоминаний
+    до now + horizon, читается диапазоном по частичному индексу. Когда окно
+    кончается, дочитывается следующее; вся таблица не сканируется ни на старте,
+    ни потом. Новое напоминание внутри окна попадает в кучу через schedule(),
+    дальше окна — подхватится при чтении своего окна. Напоминания из процессов-
+    читателей (schedule() там ничего не делает) в кучу не попадают — их ловит
+    проверка БД не реже раза в poll секунд.
+
+    Наступившие напоминания уходят в outbox пачками по batch (repo.queue_due_reminders),
+    доставка — OutboxDispatcher. Устаревшие элементы кучи (напоминание отменили)
+    безвредны: что отправлять, решает запрос к БД.
+
+    lead — за сколько до начала напоминать (читает handler «🔔 Напомнить»).
+    """
+
+    def __init__(
+        self, horizon: float = 3600.0, batch: int = 500, lead: timedelta = DEFAULT_LEAD, poll: float = 60.0
+    ) -> None:
+        self.horizon = horizon
+        self.poll = poll
+        self.batch = batch
+        self.lead = lead
+        self._heap: list[tuple[str, int]] = []
+        self._window_end: Optional[datetime] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.queued = 0
+
+    async def start(self) -> None:
+        await self._load_window(datetime.now())
+        self._task = asyncio.create_task(self._run(), name="reminder-scheduler")
+        logger.info("Reminders: %s due within %ss", len(self._heap), int(self.horizon))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _load_window(self, now: datetime) -> None:
+        after = self._window_end.isoformat(timespec="seconds") if self._window_end else None
+        end = now + timedelta(seconds=self.horizon)
+        for item in await repo.get_reminder_window(end.isoformat(timespec="seconds"), after=after):
+            heapq.heappush(self._heap, item)
+        self._window_end = end
+
+    def schedule(self, reminder_id: int, remind_at: str) -> None:
+        if self._window_end is None or remind_at > self._window_end.isoformat(timespec="seconds"):
+            return
+        head = self._heap[0][0] if self._heap else None
+        heapq.heappush(self._heap, (remind_at, int(reminder_id)))
+        if head is None or remind_at < head:
+            self._wakeup.set()
+
+    def _delay(self, now: datetime) -> float:
+        wake_at = self._window_end or now
+        if self._heap:
+            try:
+                wake_at = min(wake_at, datetime.fromisoformat(self._heap[0][0]))
+            except ValueError:
+                return 0.0
+        return min(self.poll, max(0.0, (wake_at - now).total_seconds()))
+
+    async def fire_due(self, now: Optional[datetime] = None) -> int:
+        now = now or datetime.now()
+        now_iso = now.isoformat(timespec="seconds")
+        while self._heap and self._heap[0][0] <= now_iso:
+            heapq.heappop(self._heap)
+
+        total = 0
+        while True:
+            n = await repo.queue_due_reminders(now, limit=self.batch)
+            total += n
+            if n < self.batch:
+                break
+        if total:
+            self.queued += total
+            outbox_dispatcher.wake()
+            logger.info("Reminders: %s queued", total)
+        return total
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._delay(datetime.now()))
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                now = datetime.now()
+                await self.fire_due(now)
+                if self._window_end is None or now >= self._window_end:
+                    await self._load_window(now)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Reminders failed")
+                await asyncio.sleep(30)
+
+
+async def _send_reminder(bot: Bot, payload: dict[str, Any]) -> None:
+    """Обработчик outbox 'reminder' (пишет queue_due_reminders)."""
+    # событие закончилось / снято с публикации — напоминать не о чем
+    if await repo.get_event_schedule(int(payload["event_id"])) is None:
+        return
+    card = await fetch_event_card(int(payload["event_id"]))
+    if card is None:
+        return
+    await send_reminder(bot, int(payload["user_id"]), card)
+
+
+outbox_dispatcher.register("reminder", _send_reminder)
+
+reminder_scheduler = ReminderScheduler()
@@ -0,0 +1,126 @@
+# bot/services/tasks.py
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, Message
+
+logger = logging.getLogger(__name__)
+
+FAILED_TEXT = "⚠️ Что-то пошло не так. Попробуй ещё раз чуть позже."
+
+
+class TaskSupervisor:
+    """
+    Фоновые задачи хендлеров: медленная работа (запросы в ЮKassa и т.п.) не держит
+    апдейт — хендлер отвечает сразу, а работа идёт здесь.
+
+    Одновременно выполняется не больше limit задач, остальные ждут слота.
+    key — одна задача на ключ: повторный тап, пока первая не закончилась, не
+    запускает вторую (spawn вернёт False). Исключение задачи — в лог, наружу не
+    уходит. stop() отменяет незаконченные задачи и ждёт их до timeout секунд.
+    """
+
+    def __init__(self, limit: int = 20) -> None:
+        self.limit = limit
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._tasks: dict[Hashable, asyncio.Task] = {}
+        self._closed = False
+        self.counters = {"started": 0, "done": 0, "failed": 0, "canceled": 0, "rejected": 0}
+
+    @property
+    def running(self) -> int:
+        return len(self._tasks)
+
+    def spawn(self, key: Hashable, work: Callable[[], Awaitable[Any]], name: str = "task") -> bool:
+        if self._closed or key in self._tasks:
+            self.counters["rejected"] += 1
+            return False
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.limit)
+        task = asyncio.create_task(self._guarded(key, work, name), name=f"{name}:{key}")
+        self._tasks[key] = task
+        self.counters["started"] += 1
+        return True
+
+    async def _guarded(self, key: Hashable, work: Callable[[], Awaitable[Any]], name: str) -> None:
+        try:
+            async with self._sem:
+                await work()
+            self.counters["done"] += 1
+        except asyncio.CancelledError:
+            self.counters["canceled"] += 1
+            raise
+        except Exception:
+            self.counters["failed"] += 1
+            logger.exception("Task %s key=%s failed", name, key)
+        finally:
+            self._tasks.pop(key, None)
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        self._closed = True
+        tasks = list(self._tasks.values())
+        if not tasks:
+            return
+        for task in tasks:
+            task.cancel()
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            logger.warning("Tasks: %s did not finish after cancel", len(pending))
+
+
+async def edit_status(message: Optional[Message], text: str, markup: Optional[InlineKeyboardMarkup] = None) -> None:
+    """Текст сообщения с кнопкой -> прогресс / результат; не вышло отредактировать — шлём новое."""
+    if not isinstance(message, Message):
+        return
+    try:
+        await message.edit_text(text, reply_markup=markup)
+        return
+    except TelegramBadRequest as e:
+        if "message is not modified" in str(e).lower():
+            return
+        logger.info("Tasks: cannot edit message_id=%s (%s), sending new", message.message_id, e)
+    await message.answer(text, reply_markup=markup)
+
+
+async def run_callback(
+    cb: CallbackQuery,
+    key: Hashable,
+    work: Callable[[], Awaitable[Any]],
+    progress: str,
+    busy: str = "⏳ Уже выполняется, подожди пару секунд.",
+) -> bool:
+    """
+    Медленный обработчик кнопки: сразу отвечаем на callback (без «часиков» и таймаута
+    Telegram), сообщение с кнопкой -> progress, work выполняется в task_supervisor и
+    сама пишет результат в то же сообщение (edit_status). Упала — пишем FAILED_TEXT.
+    """
+    message = cb.message if isinstance(cb.message, Message) else None
+    shown = asyncio.Event()
+
+    async def _work() -> None:
+        # результат не должен лечь раньше, чем progress
+        await shown.wait()
+        try:
+            await work()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            await edit_status(message, FAILED_TEXT)
+            raise
+
+    if not task_supervisor.spawn(key, _work, name="callback"):
+        await cb.answer(busy)
+        return False
+    try:
+        await cb.answer()
+        await edit_status(message, progress)
+    finally:
+        shown.set()
+    return True
+
+
+task_supervisor = TaskSupervisor()
@@ -1,17 +1,50 @@
 # bot/services/yookassa_client.py
 from __future__ import annotations
 
+import asyncio
 import base64
 import json
+import logging
 import uuid
 from dataclasses import dataclass
 from typing import Any, Dict, Optional
 
 import aiohttp
 
+from bot.config import YooKassaSettings, get_settings, on_settings_reload
+from bot.services.circuit_breaker import CircuitBreaker
+from bot.utils.singleflight import payment_flight
+
 
 YOOKASSA_API = "https://api.yookassa.ru/v3/payments"
 
+logger = logging.getLogger(__name__)
+
+# временные ответы ЮKassa — запрос можно повторить с тем же Idempotence-Key
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# общий для всех вызовов ЮKassa: при сбоях провайдера бот отвечает сразу, а не ждёт таймаутов
+yookassa_breaker = CircuitBreaker("yookassa")
+
+
+class YooKassaError(RuntimeError):
+    def __init__(self, method: str, status: int, data: Any) -> None:
+        super().__init__(f"YooKassa {method} error {status}: {data}")
+        self.status = status
+        self.data = data
+
+    @property
+    def transient(self) -> bool:
+        return self.status in _RETRY_STATUSES
+
+
+def _parse_body(text: str) -> Any:
+    """JSON ответа или None, если тело не JSON (HTML-страница прокси, обрыв)."""
+    try:
+        return json.loads(text) if text else {}
+    except ValueError:
+        return None
+
 
 @dataclass
 class YooPayment:
@@ -27,43 +60,17 @@ def _basic_auth_header(shop_id: str, secret_key: str) -> str:
     return f"Basic {b64}"
 
 
-async def create_payment(
-    *,
-    shop_id: str,
-    secret_key: str,
-    amount_rub: int,
-    description: str,
-    return_url: str,
-    metadata: Optional[Dict[str, Any]] = None,
-    idempotence_key: Optional[str] = None,
-) -> YooPayment:
-    """
-    Создаёт платеж в ЮKassa и возвращает confirmation_url (куда отправлять пользователя).
-    """
-    if amount_rub <= 0:
-        raise ValueError("amount_rub must be > 0")
-
-    idem = idempotence_key or str(uuid.uuid4())
-    headers = {
-        "Authorization": _basic_auth_header(shop_id, secret_key),
-        "Idempotence-Key": idem,
-        "Content-Type": "application/json",
-    }
-
-    payload = {
-        "amount": {"value": f"{amount_rub:.2f}", "currency": "RUB"},
-        "confirmation": {"type": "redirect", "return_url": return_url},
-        "capture": True,
-        "description": description,
-        "metadata": metadata or {},
-    }
-
-    async with aiohttp.ClientSession() as session:
-        async with session.post(YOOKASSA_API, headers=headers, data=json.dumps(payload)) as resp:
-            data = await resp.json(content_type=None)
-            if resp.status >= 400:
-                raise RuntimeError(f"YooKassa create_payment error {resp.status}: {data}")
+def _money(value: object) -> str:
+    try:
+        amount = float(str(value).replace(",", "."))
+    except Exception:
+        raise ValueError(f"Не могу распарсить сумму: {value!r}")
+    if amount <= 0:
+        raise ValueError(f"Сумма должна быть > 0, получено: {amount}")
+    return f"{amount:.2f}"
+
 
+def _to_payment(data: Dict[str, Any]) -> YooPayment:
     confirmation_url = None
     conf = data.get("confirmation") or {}
     if isinstance(conf, dict):
@@ -77,28 +84,248 @@ async def create_payment(
     )
 
 
-async def get_payment(
-    *,
-    shop_id: str,
-    secret_key: str,
-    payment_id: str,
-) -> YooPayment:
-    headers = {"Authorization": _basic_auth_header(shop_id, secret_key)}
+class YooKassaClient:
+    """
+    Асинхронный клиент ЮKassa: создание и проверка платежей, сборка чека.
+
+    Ключи магазина (TEST/PROD) хранятся в экземпляре, а не в глобальной
+    конфигурации SDK. Одна сессия и пул keep-alive соединений на процесс,
+    вместо TCP+TLS рукопожатия на каждый платёж и проверку статуса.
+    """
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{YOOKASSA_API}/{payment_id}", headers=headers) as resp:
-            data = await resp.json(content_type=None)
-            if resp.status >= 400:
-                raise RuntimeError(f"YooKassa get_payment error {resp.status}: {data}")
+    def __init__(
+        self,
+        config: YooKassaSettings,
+        *,
+        limit: int = 20,
+        keepalive: float = 60.0,
+        dns_ttl: int = 300,
+        timeout: float = 15.0,
+        connect_timeout: float = 5.0,
+        retries: int = 3,
+        backoff: float = 0.5,
+    ) -> None:
+        self.configure(config)
+        self.limit = limit
+        self.keepalive = keepalive
+        self.dns_ttl = dns_ttl
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self._session: Optional[aiohttp.ClientSession] = None
 
-    confirmation_url = None
-    conf = data.get("confirmation") or {}
-    if isinstance(conf, dict):
-        confirmation_url = conf.get("confirmation_url")
+    def configure(self, config: YooKassaSettings) -> None:
+        """Новые ключи/чековые поля (перезагрузка настроек). Сессия и пул соединений остаются."""
+        if not config.shop_id or not config.secret_key:
+            raise RuntimeError(
+                "Не заданы ключи ЮKassa для выбранного режима. "
+                "Проверь .env: PAYMENT_MODE и YOOKASSA_*_SHOP_ID/YOOKASSA_*_SECRET_KEY"
+            )
+        # одно присваивание — запрос видит либо старую, либо новую пару ключей
+        self._auth_config = (_basic_auth_header(config.shop_id, config.secret_key), config)
 
-    return YooPayment(
-        id=str(data.get("id")),
-        status=str(data.get("status")),
-        confirmation_url=confirmation_url,
-        raw=data,
-    )
\ No newline at end of file
+    @property
+    def config(self) -> YooKassaSettings:
+        return self._auth_config[1]
+
+    @property
+    def mode(self) -> str:
+        return self.config.mode
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                keepalive_timeout=self.keepalive,
+                ttl_dns_cache=self.dns_ttl,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _request(self, method: str, url: str, *, headers: Dict[str, str], body: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Вызов через автомат yookassa_breaker: открыт — CircuitOpenError без запроса.
+        В автомат идёт один исход на логический вызов (после всех повторов);
+        ответы 4xx — ошибка запроса, а не провайдера, и автомат не открывают.
+        """
+        yookassa_breaker.before_call()
+        try:
+            data = await self._request_with_retries(method, url, headers=headers, body=body)
+        except YooKassaError as e:
+            if e.transient:
+                yookassa_breaker.record_failure(e)
+            else:
+                yookassa_breaker.record_success()
+            raise
+        except asyncio.CancelledError:
+            # отмена — не исход вызова, но пробный слот освобождаем
+            yookassa_breaker.release()
+            raise
+        except Exception as e:
+            # сеть, таймауты, нечитаемый ответ
+            yookassa_breaker.record_failure(e)
+            raise
+        yookassa_breaker.record_success()
+        return data
+
+    async def _request_with_retries(
+        self, method: str, url: str, *, headers: Dict[str, str], body: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Повторяет запрос на 429/5xx и сетевых ошибках. Заголовки (в т.ч. Idempotence-Key)
+        одни и те же на всех попытках — ЮKassa не создаст второй платёж.
+        """
+        headers = {"Authorization": self._auth_config[0], **headers}
+        attempt = 0
+        while True:
+            delay = self.backoff * (2 ** attempt)
+            try:
+                async with self.session.request(method, url, headers=headers, data=body) as resp:
+                    # тело разбираем без исключений: прокси на 502/503/504 отдаёт HTML — решает статус
+                    text = await resp.text(errors="replace")
+                    data = _parse_body(text)
+                    if resp.status in _RETRY_STATUSES and attempt < self.retries:
+                        retry_after = resp.headers.get("Retry-After", "")
+                        if retry_after.isdigit():
+                            delay = max(delay, float(retry_after))
+                        logger.warning("YooKassa %s %s -> %s, retry in %.1fs", method, url, resp.status, delay)
+                    elif resp.status >= 400 or data is None:
+                        # 5xx/429 после повторов остаётся transient и с нечитаемым телом
+                        if data is None:
+                            data = {"error": "invalid JSON in response", "body": text[:200]}
+                        raise YooKassaError(method, resp.status, data)
+                    else:
+                        return data if isinstance(data, dict) else {}
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt >= self.retries:
+                    raise
+                logger.warning("YooKassa %s %s: network error, retry in %.1fs", method, url, delay, exc_info=True)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def build_receipt(self, description: str, amount_value: str) -> Dict[str, Any]:
+        """Чек 54-ФЗ на одну позицию. Без email/телефона покупателя ЮKassa платёж не примет."""
+        config = self.config
+        if not config.receipt_email and not config.receipt_phone:
+            raise RuntimeError(
+                "YooKassa требует чек (receipt), но не задано ни YOOKASSA_RECEIPT_EMAIL, ни YOOKASSA_RECEIPT_PHONE в .env"
+            )
+        customer: Dict[str, str] = {}
+        if config.receipt_email:
+            customer["email"] = config.receipt_email
+        if config.receipt_phone:
+            customer["phone"] = config.receipt_phone
+
+        return {
+            "customer": customer,
+            "tax_system_code": config.tax_system_code,
+            "items": [
+                {
+                    "description": (description or "Оплата услуг").strip()[:128],
+                    "quantity": "1.00",
+                    "amount": {"value": amount_value, "currency": "RUB"},
+                    "vat_code": config.vat_code,
+                    "payment_subject": config.payment_subject,
+                    "payment_mode": config.payment_mode,
+                }
+            ],
+        }
+
+    async def create_payment(
+        self,
+        *,
+        amount_rub: object,
+        description: str,
+        return_url: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        idempotence_key: Optional[str] = None,
+        capture: bool = True,
+    ) -> YooPayment:
+        """
+        Создаёт платеж в ЮKassa и возвращает confirmation_url (куда отправлять пользователя).
+        """
+        amount_value = _money(amount_rub)
+        if not return_url or not str(return_url).startswith("http"):
+            raise RuntimeError(
+                "Не задан return_url для YooKassa. "
+                "Добавь YOOKASSA_RETURN_URL в .env (например https://t.me/Events_Now_bot)"
+            )
+
+        idem = idempotence_key or str(uuid.uuid4())
+        headers = {
+            "Idempotence-Key": idem,
+            "Content-Type": "application/json",
+        }
+
+        payload: Dict[str, Any] = {
+            "amount": {"value": amount_value, "currency": "RUB"},
+            "confirmation": {"type": "redirect", "return_url": str(return_url)},
+            "capture": bool(capture),
+            "description": description or "Оплата услуг",
+            "receipt": self.build_receipt(description, amount_value),
+        }
+        if metadata:
+            # ЮKassa принимает в metadata только строки
+            payload["metadata"] = {str(k): str(v) for k, v in metadata.items() if v is not None}
+
+        logger.info(
+            "YOOKASSA: mode=%s create payment amount=%s order_id=%s idempotence=%s",
+            self.mode, amount_value, (metadata or {}).get("order_id"), idem,
+        )
+        data = await self._request("POST", YOOKASSA_API, headers=headers, body=json.dumps(payload))
+        return _to_payment(data)
+
+    async def get_payment(self, payment_id: str) -> YooPayment:
+        # «Я оплатил» дважды, сверка и вебхук по одному платежу — один запрос на всех
+        return await payment_flight.do(str(payment_id), lambda: self._get_payment(str(payment_id)))
+
+    async def _get_payment(self, payment_id: str) -> YooPayment:
+        data = await self._request("GET", f"{YOOKASSA_API}/{payment_id}", headers={})
+        return _to_payment(data)
+
+
+_client: YooKassaClient | None = None
+
+
+async def init_yookassa_client(**kwargs: Any) -> None:
+    """Один клиент на процесс: создаём в on_startup, закрываем в on_shutdown."""
+    global _client
+    if _client is None:
+        try:
+            _client = YooKassaClient(get_settings().yookassa, **kwargs)
+        except RuntimeError:
+            # бот работает и без платежей; ошибка всплывёт при первой оплате
+            logger.exception("YooKassa client is not configured")
+
+
+def get_yookassa_client() -> YooKassaClient:
+    """
+    НЕ async. Без init_yookassa_client() (скрипты, консоль) создаёт клиент
+    из настроек — его тоже закроет close_yookassa_client().
+    """
+    global _client
+    if _client is None:
+        _client = YooKassaClient(get_settings().yookassa)
+    return _client
+
+
+async def close_yookassa_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def _on_settings_reload(settings) -> None:
+    if _client is not None and _client.config != settings.yookassa:
+        _client.configure(settings.yookassa)
+        logger.info("YooKassa client reconfigured: mode=%s", _client.mode)
+
+
+on_settings_reload(_on_settings_reload)
@@ -0,0 +1,55 @@
+# bot/services/yookassa_fake.py
+"""
+Локальная имитация уведомлений ЮKassa для проверки вебхука.
+
+Бот запускать с YOOKASSA_WEBHOOK_VERIFY=0 (без проверки IP и перезапроса платежа):
+
+    python -m bot.services.yookassa_fake --order 12 --payment 2d0a...-000f-5000-9000-1b2c3d4e5f60
+    python -m bot.services.yookassa_fake --order 12 --payment ... --event payment.canceled
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from typing import Any
+
+import aiohttp
+
+
+def build_notification(event: str, payment_id: str, order_id: int, amount_rub: int = 0) -> dict[str, Any]:
+    status = event.split(".", 1)[1] if "." in event else event
+    return {
+        "type": "notification",
+        "event": event,
+        "object": {
+            "id": payment_id,
+            "status": status,
+            "paid": status == "succeeded",
+            "amount": {"value": f"{amount_rub:.2f}", "currency": "RUB"},
+            "metadata": {"order_id": str(order_id)},
+        },
+    }
+
+
+async def send_notification(url: str, notification: dict[str, Any]) -> int:
+    async with aiohttp.ClientSession() as session:
+        async with session.post(url, json=notification) as resp:
+            return resp.status
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake YooKassa notifier")
+    parser.add_argument("--url", default="http://127.0.0.1:8081/yookassa/webhook")
+    parser.add_argument("--order", type=int, required=True)
+    parser.add_argument("--payment", required=True)
+    parser.add_argument("--event", default="payment.succeeded", choices=["payment.succeeded", "payment.canceled"])
+    parser.add_argument("--amount", type=int, default=0)
+    args = parser.parse_args()
+
+    notification = build_notification(args.event, args.payment, args.order, args.amount)
+    status = asyncio.run(send_notification(args.url, notification))
+    print(f"{args.event} -> {args.url}: HTTP {status}")
+
+
+if __name__ == "__main__":
+    main()
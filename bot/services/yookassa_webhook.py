@@ -0,0 +1,159 @@
+# bot/services/yookassa_webhook.py
+from __future__ import annotations
+
+import ipaddress
+import logging
+from typing import Any, Optional
+
+from aiogram import Bot
+from aiohttp import web
+
+from bot.db.repositories import repo
+from bot.services.yookassa_client import get_yookassa_client
+from bot.services.yu_cassa_service import apply_paid_order, order_payment_id
+
+logger = logging.getLogger(__name__)
+
+# адреса, с которых ЮKassa шлёт уведомления (https://yookassa.ru/developers/using-api/webhooks)
+YOOKASSA_NETWORKS = tuple(
+    ipaddress.ip_network(n)
+    for n in (
+        "185.71.76.0/27",
+        "185.71.77.0/27",
+        "77.75.153.0/25",
+        "77.75.156.11/32",
+        "77.75.156.35/32",
+        "77.75.154.128/25",
+        "2a02:5180::/32",
+    )
+)
+
+HANDLED_EVENTS = {"payment.succeeded", "payment.canceled"}
+
+
+def _ip_allowed(ip: Optional[str]) -> bool:
+    try:
+        addr = ipaddress.ip_address((ip or "").strip())
+    except ValueError:
+        return False
+    return any(addr in net for net in YOOKASSA_NETWORKS)
+
+
+class YooKassaWebhook:
+    """
+    Приёмник уведомлений ЮKassa (payment.succeeded / payment.canceled).
+
+    Телу уведомления не доверяем: проверяем IP отправителя и перечитываем
+    платёж из API. Применение идемпотентно — повтор уведомления или гонка
+    с кнопкой «✅ Я оплатил» услугу второй раз не применят.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        *,
+        host: str = "0.0.0.0",
+        port: int = 8081,
+        path: str = "/yookassa/webhook",
+        verify: bool = True,
+        trust_proxy: bool = False,
+    ) -> None:
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.path = path
+        self.verify = verify
+        self.trust_proxy = trust_proxy
+        self._runner: Optional[web.AppRunner] = None
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        return app
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info("YooKassa webhook listening on %s:%s%s (verify=%s)", self.host, self.port, self.path, self.verify)
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _client_ip(self, request: web.Request) -> Optional[str]:
+        if self.trust_proxy:
+            forwarded = request.headers.get("X-Forwarded-For", "")
+            if forwarded:
+                return forwarded.split(",")[0].strip()
+        return request.remote
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.verify and not _ip_allowed(self._client_ip(request)):
+            logger.warning("YOOKASSA webhook: rejected ip=%s", self._client_ip(request))
+            return web.Response(status=403)
+
+        try:
+            body: Any = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        if not isinstance(body, dict) or not isinstance(body.get("object"), dict):
+            return web.Response(status=400)
+
+        event = str(body.get("event") or "")
+        obj = body["object"]
+        payment_id = str(obj.get("id") or "")
+        if event not in HANDLED_EVENTS or not payment_id:
+            # неинтересные события подтверждаем, иначе ЮKassa будет их повторять
+            return web.Response(status=200)
+
+        try:
+            await self.process(payment_id, obj)
+        except Exception:
+            logger.exception("YOOKASSA webhook: failed payment_id=%s event=%s", payment_id, event)
+            # 5xx -> ЮKassa повторит уведомление позже
+            return web.Response(status=500)
+        return web.Response(status=200)
+
+    async def process(self, payment_id: str, obj: dict[str, Any]) -> None:
+        if self.verify:
+            payment = await get_yookassa_client().get_payment(payment_id)
+            status, raw = payment.status, payment.raw
+        else:
+            status, raw = str(obj.get("status") or ""), obj
+
+        # обычно заказ уже привязан к платежу (provider_payment_id, индекс);
+        # metadata.order_id — если уведомление обогнало сохранение ответа ЮKassa
+        order = await repo.get_order_by_payment_id(payment_id)
+        if order is None:
+            metadata = raw.get("metadata") if isinstance(raw.get("metadata"), dict) else {}
+            order_id = str(metadata.get("order_id") or "")
+            if not order_id.isdigit():
+                logger.warning("YOOKASSA webhook: payment_id=%s without order_id in metadata", payment_id)
+                return
+            order = await repo.get_order(int(order_id))
+            if order is None:
+                logger.warning("YOOKASSA webhook: order_id=%s not found (payment_id=%s)", order_id, payment_id)
+                return
+        order_id = order.id
+        known = order_payment_id(order)
+        if known and known != payment_id:
+            logger.warning(
+                "YOOKASSA webhook: payment_id=%s does not match order_id=%s (%s)", payment_id, order_id, known
+            )
+            return
+
+        await repo.record_payment(
+            order.id,
+            payment_id=payment_id,
+            status=status,
+            confirmation_url=None,
+            raw=raw,
+            source="webhook" if self.verify else "webhook:unverified",
+        )
+        if status == "succeeded":
+            await apply_paid_order(order, payment_id)
+        elif status == "canceled":
+            if await repo.mark_order_canceled(order.id):
+                logger.info("YOOKASSA webhook: order_id=%s canceled (payment_id=%s)", order.id, payment_id)
@@ -0,0 +1,247 @@
+# bot/services/yu_cassa_service.py
+from __future__ import annotations
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
+
+import aiohttp
+from aiogram import Bot
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from bot.config import get_settings
+from bot.db.repositories import PROMO_DURATIONS, PromoOrder, promo_idempotence_key, repo
+from bot.services.broadcast import broadcast_engine
+from bot.services.circuit_breaker import CircuitOpenError
+from bot.services.outbox import outbox_dispatcher
+from bot.services.promo_expiry import promo_expiry
+from bot.services.yookassa_client import YooKassaError, get_yookassa_client
+
+logger = logging.getLogger(__name__)
+
+SERVICE_TITLES = {
+    "top": "⭐ Топ на 24ч",
+    "notify": "📣 Оповещение всем",
+    "highlight": "✨ Подсветка",
+    "bump": "⬆️ Поднять (bump)",
+}
+
+
+def order_payment_id(order: Optional[PromoOrder]) -> Optional[str]:
+    """payment_id из заказа (колонка provider_payment_id)."""
+    if order is None:
+        return None
+    return order.provider_payment_id
+
+
+class PaymentQueued(Exception):
+    """ЮKassa недоступна: заказ сохранён в queued, ссылку пришлём позже."""
+
+    def __init__(self, order: PromoOrder) -> None:
+        super().__init__(f"order {order.id} queued")
+        self.order = order
+
+
+def payment_kb(order_id: int, pay_url: str) -> InlineKeyboardMarkup:
+    """
+    Клавиатура оплаты:
+    - URL-кнопка "Оплатить в ЮKassa" ведёт на confirmation_url
+    - "✅ Я оплатил" и "❌ Отмена" — callback'и промо-роутера
+    """
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="💳 Оплатить в ЮKassa", url=pay_url)],
+            [InlineKeyboardButton(text="✅ Я оплатил", callback_data=f"promo_paid:{order_id}")],
+            [InlineKeyboardButton(text="❌ Отмена", callback_data=f"promo_cancel:{order_id}")],
+        ]
+    )
+
+
+def order_confirmation_url(order: Optional[PromoOrder]) -> Optional[str]:
+    if order is None:
+        return None
+    return order.confirmation_url
+
+
+# платёж по ключу заказа отменён / истёк: ЮKassa ещё сутки вернёт его же на тот же ключ
+DEAD_PAYMENT_STATUSES = frozenset({"canceled"})
+
+
+class PaymentCanceled(Exception):
+    """ЮKassa вернула по ключу заказа отменённый платёж — нужен новый заказ с новым ключом."""
+
+
+# двойной тап по услуге не должен создать два заказа; [замок, сколько держат/ждут]
+_order_locks: dict[tuple[int, int, str], list] = {}
+
+
+@asynccontextmanager
+async def _order_lock(key: tuple[int, int, str]) -> AsyncIterator[None]:
+    entry = _order_locks.get(key)
+    if entry is None:
+        entry = _order_locks[key] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        # последний вышел — запись не копится
+        entry[1] -= 1
+        if entry[1] == 0 and _order_locks.get(key) is entry:
+            del _order_locks[key]
+
+
+async def start_promo_payment(
+    *,
+    organizer_id: int,
+    event_id: int,
+    service: str,
+    amount_rub: int,
+) -> tuple[PromoOrder, str]:
+    """
+    Единственный путь создания оплаты услуги: ровно один платёж на заказ.
+
+    Незакрытый заказ той же услуги с живой ссылкой переиспользуется без
+    запроса в ЮKassa. Иначе платёж создаётся с ключом идемпотентности из
+    promo_orders.idempotence_key — повтор после сбоя вернёт тот же платёж.
+    Возвращает (заказ, confirmation_url); если ЮKassa недоступна — PaymentQueued.
+    """
+    key = (int(organizer_id), int(event_id), str(service))
+    async with _order_lock(key):
+        for _ in range(2):
+            try:
+                return await _start_order_payment(organizer_id, event_id, service, amount_rub)
+            except PaymentCanceled:
+                # заказ закрыт, следующий круг создаст новый с новым ключом
+                continue
+        raise RuntimeError(f"YooKassa returned canceled payments for {key}")
+
+
+async def _start_order_payment(organizer_id: int, event_id: int, service: str, amount_rub: int) -> tuple[PromoOrder, str]:
+    order = await repo.find_open_order(organizer_id, event_id, service)
+    if order is not None and int(order.amount) != int(amount_rub):
+        # цена поменялась — старую ссылку не показываем
+        order = None
+
+    if order is not None and order_payment_id(order) and order.payment_status in DEAD_PAYMENT_STATUSES:
+        # вебхук об отмене не дошёл до статуса заказа — закрываем, платим новым заказом
+        await repo.mark_order_canceled(order.id)
+        order = None
+
+    if order is not None:
+        url = order_confirmation_url(order)
+        if url and order_payment_id(order) and order.payment_status == "pending":
+            return order, url
+    else:
+        order_id = await repo.create_promo_order(
+            organizer_id=int(organizer_id),
+            event_id=int(event_id),
+            service=str(service),
+            amount_rub=int(amount_rub),
+            currency="RUB",
+        )
+        order = await repo.get_order(order_id)
+
+    try:
+        url = await _create_order_payment(order)
+    except (CircuitOpenError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        await repo.mark_order_queued(order.id)
+        raise PaymentQueued(order) from e
+    except YooKassaError as e:
+        if not e.transient:
+            raise
+        await repo.mark_order_queued(order.id)
+        raise PaymentQueued(order) from e
+    if order.status == "queued":
+        await repo.mark_order_unqueued(order.id)
+    return await repo.get_order(order.id) or order, url
+
+
+async def _create_order_payment(order: PromoOrder) -> str:
+    client = get_yookassa_client()
+    pay = await client.create_payment(
+        amount_rub=order.amount,
+        description=f"EventsNow: promo {order.service} для события #{order.event_id}",
+        return_url=get_settings().yookassa.return_url,
+        metadata={
+            "order_id": order.id,
+            "event_id": order.event_id,
+            "service": order.service,
+            "organizer_id": order.organizer_id,
+        },
+        idempotence_key=order.idempotence_key or promo_idempotence_key(order.id),
+    )
+    if pay.status in DEAD_PAYMENT_STATUSES:
+        await repo.record_payment(
+            order.id, payment_id=pay.id, status=pay.status, confirmation_url=None, raw=pay.raw,
+            source=f"create:{client.mode.lower()}",
+        )
+        await repo.mark_order_canceled(order.id)
+        raise PaymentCanceled(pay.id)
+    if not pay.confirmation_url:
+        raise RuntimeError(f"YooKassa payment {pay.id} without confirmation_url")
+
+    await repo.record_payment(
+        order.id,
+        payment_id=pay.id,
+        status=pay.status,
+        confirmation_url=pay.confirmation_url,
+        raw=pay.raw,
+        source=f"create:{client.mode.lower()}",
+    )
+    return pay.confirmation_url
+
+
+async def resume_queued_order(bot: Optional[Bot], order: PromoOrder) -> bool:
+    """Создаёт платёж для заказа из очереди и отправляет организатору ссылку."""
+    try:
+        url = await _create_order_payment(order)
+    except PaymentCanceled:
+        # заказ уже закрыт; организатор создаст новый кнопкой услуги
+        return False
+    if not await repo.mark_order_unqueued(order.id):
+        return False
+    if bot is not None:
+        title = SERVICE_TITLES.get(order.service, order.service)
+        try:
+            await bot.send_message(
+                int(order.organizer_id),
+                f"💳 Платёжный сервис снова доступен.\n"
+                f"Ссылка на оплату услуги «{title}» для события <b>{order.event_id}</b> ({order.amount}₽):",
+                reply_markup=payment_kb(order.id, url),
+            )
+        except Exception:
+            logger.exception("PROMO: failed to send payment link organizer_id=%s order_id=%s", order.organizer_id, order.id)
+    return True
+
+
+async def apply_paid_order(order: PromoOrder, payment_id: str) -> bool:
+    """
+    Оплата заказа: repo.settle_order — заказ, продвижение и уведомление организатору
+    (outbox) одной транзакцией. Идемпотентно: True только у того, кто реально перевёл
+    заказ в paid (вебхук, кнопка «✅ Я оплатил» и сверка могут прийти одновременно).
+    """
+    settled = await repo.settle_order(order.id, str(payment_id))
+    if settled is None:
+        return False
+    logger.info("PROMO: order_id=%s paid, event_id=%s promoted kind=%s", order.id, order.event_id, order.service)
+    if order.service in PROMO_DURATIONS:
+        await promo_expiry.schedule_event(int(order.event_id))
+    elif order.service == "notify":
+        broadcast_engine.wake()
+    outbox_dispatcher.wake()
+    return True
+
+
+async def _send_order_paid(bot: Bot, payload: dict[str, Any]) -> None:
+    """Обработчик outbox 'order_paid' (пишет settle_order)."""
+    title = SERVICE_TITLES.get(str(payload["service"]), str(payload["service"]))
+    await bot.send_message(
+        int(payload["organizer_id"]),
+        f"✅ Оплата подтверждена YooKassa.\n"
+        f"Услуга «{title}» применена к событию <b>{payload['event_id']}</b>!",
+    )
+
+
+outbox_dispatcher.register("order_paid", _send_order_paid)
@@ -0,0 +1,260 @@
+# bot/utils/cards.py
+"""Карточка события: текст, клавиатура и отправка (лента жителя, рассылки, дайджест)."""
+from __future__ import annotations
+
+import html
+import logging
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, Message
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from bot.db.database import get_db
+from bot.services.catalog import EventCard, feed
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_LEN = 100
+CAPTION_LIMIT = 1024
+
+
+def event_best_date(e: EventCard) -> str | None:
+    return e.start_date or e.event_date
+
+
+def is_top_recommended(e: EventCard) -> bool:
+    k = (e.promoted_kind or "").strip().lower()
+    return k in {"top", "топ", "recommended", "recommend", "рекомендуем"} or int(e.highlighted or 0) == 1
+
+
+async def fetch_event_card(event_id: int) -> EventCard | None:
+    card = feed().get(event_id)
+    if card is not None:
+        return card
+
+    # события уже нет в каталоге (например, только что закончилось) — читаем из БД
+    db = get_db()
+    cur = await db.execute(
+        """
+        SELECT
+            id,
+            title,
+            category,
+            category_text,
+            COALESCE(description, '') AS description,
+            start_date,
+            event_date,
+            event_time,
+            location,
+            price_text,
+            ticket_link,
+            promoted_kind,
+            highlighted,
+            cover_file_id
+        FROM events
+        WHERE id = ?
+        LIMIT 1
+        """,
+        (event_id,),
+    )
+    r = await cur.fetchone()
+    if not r:
+        return None
+
+    return EventCard(
+        id=int(r["id"]),
+        title=str(r["title"] or ""),
+        category=str(r["category"] or ""),
+        category_text=str(r["category_text"] or ""),
+        description=str(r["description"] or ""),
+        start_date=r["start_date"],
+        event_date=r["event_date"],
+        event_time=r["event_time"],
+        location=str(r["location"] or ""),
+        price_text=str(r["price_text"] or ""),
+        ticket_link=str(r["ticket_link"] or ""),
+        promoted_kind=str(r["promoted_kind"] or ""),
+        highlighted=int(r["highlighted"] or 0),
+        cover_file_id=r["cover_file_id"],
+    )
+
+
+def format_card_text(e: EventCard) -> tuple[str, bool]:
+    """
+    Возвращает:
+      (text, has_more)
+    где has_more=True если описание длиннее PREVIEW_LEN и нужно показать кнопку "Подробнее"
+    """
+    d = event_best_date(e)
+    t = (e.event_time or "").strip()
+
+    when = "📅 <b>Дата:</b> не указана"
+    if d:
+        when = f"📅 <b>Дата:</b> {d}"
+    if d and t:
+        when = f"📅 <b>Дата:</b> {d}  ⏰ <b>Время:</b> {t}"
+    elif t and not d:
+        when = f"⏰ <b>Время:</b> {t}"
+
+    cat_raw = (getattr(e, "category", "") or "").strip()
+    if not cat_raw:
+        cat_raw = (e.category_text or "").strip()
+    cat_line = f"🎭 <b>Категория:</b> {cat_raw}" if cat_raw else ""
+
+    loc_line = f"📍 <b>Место:</b> {e.location}" if e.location else ""
+    price_line = f"💳 <b>Цена:</b> {e.price_text}" if e.price_text else ""
+
+    badge = "🔥 <b>Рекомендуем</b>\n" if is_top_recommended(e) else ""
+
+    desc_raw = (e.description or "").strip()
+    has_more = False
+    if desc_raw:
+        desc_escaped = html.escape(desc_raw)
+        if len(desc_raw) > PREVIEW_LEN:
+            has_more = True
+            desc_line = f"📝 {desc_escaped[:PREVIEW_LEN].rstrip()}…"
+        else:
+            desc_line = f"📝 {desc_escaped}"
+    else:
+        desc_line = ""
+
+    lines = [
+        badge + f"🧾 <b>{html.escape(e.title)}</b>",
+        cat_line,
+        desc_line,
+        when,
+        loc_line,
+        price_line,
+    ]
+    lines = [x for x in lines if x]
+    return "\n".join(lines), has_more
+
+
+def ticket_kb(e: EventCard) -> InlineKeyboardMarkup | None:
+    link = (e.ticket_link or "").strip()
+    if not link:
+        return None
+
+    bad_values = {"нет", "no", "-", "—", "n/a", "не указано", "отсутствует"}
+    if link.lower() in bad_values:
+        return None
+
+    if not (link.startswith("http://") or link.startswith("https://")):
+        return None
+
+    return InlineKeyboardMarkup(
+        inline_keyboard=[[InlineKeyboardButton(text="🎟 Купить билет", url=link)]]
+    )
+
+
+def details_kb(event_id: int) -> InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+    kb.button(text="📄 Подробнее", callback_data=f"resident_details:{event_id}")
+    return kb.as_markup()
+
+
+def remind_kb(event_id: int) -> InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+    kb.button(text="🔔 Напомнить", callback_data=f"remind:{event_id}")
+    return kb.as_markup()
+
+
+def merge_inline_kb(*kbs: InlineKeyboardMarkup | None) -> InlineKeyboardMarkup | None:
+    rows: list[list[InlineKeyboardButton]] = []
+    for kb in kbs:
+        if kb and kb.inline_keyboard:
+            rows.extend(kb.inline_keyboard)
+    return InlineKeyboardMarkup(inline_keyboard=rows) if rows else None
+
+
+def card_markup(e: EventCard, has_more: bool) -> InlineKeyboardMarkup | None:
+    return merge_inline_kb(details_kb(e.id) if has_more else None, ticket_kb(e), remind_kb(e.id))
+
+
+def event_deep_link(bot_username: str, event_id: int) -> str:
+    return f"https://t.me/{bot_username}?start=event_{int(event_id)}"
+
+
+def channel_markup(e: EventCard, bot_username: str) -> InlineKeyboardMarkup | None:
+    """
+    Кнопки поста в канале — только URL: callback'и из канала ответили бы в сам канал
+    («Подробнее») или упали бы Forbidden у тех, кто бота не запускал («Напомнить»).
+    Подробности и напоминание — в личке по ссылке t.me/<бот>?start=event_<id>.
+    """
+    kb = InlineKeyboardBuilder()
+    kb.button(text="📄 Подробнее в боте", url=event_deep_link(bot_username, e.id))
+    return merge_inline_kb(ticket_kb(e), kb.as_markup())
+
+
+async def send_event_card(
+    bot: Bot,
+    chat_id: int | str,
+    e: EventCard,
+    header: str = "",
+    markup: InlineKeyboardMarkup | None = None,
+) -> Message:
+    """
+    Карточка с афишей; если фото не отправилось — текстом.
+    markup — свои кнопки вместо card_markup (пост в канале).
+    Бот заблокирован / лимит Telegram — исключение наружу (решает вызывающий).
+    """
+    text, has_more = format_card_text(e)
+    if header:
+        text = f"{header}\n\n{text}"
+    ikb = markup if markup is not None else card_markup(e, has_more)
+
+    if e.cover_file_id:
+        try:
+            return await bot.send_photo(chat_id, photo=e.cover_file_id, caption=text, reply_markup=ikb, parse_mode="HTML")
+        except (TelegramForbiddenError, TelegramRetryAfter):
+            raise
+        except Exception as ex:
+            logger.warning("failed to send photo for event_id=%s, photo_id=%r: %s", e.id, e.cover_file_id, ex)
+
+    return await bot.send_message(chat_id, text, reply_markup=ikb, parse_mode="HTML")
+
+
+def format_digest_text(events: list[EventCard], header: str = "") -> str:
+    lines = [header] if header else []
+    for i, e in enumerate(events, start=1):
+        d = event_best_date(e)
+        t = (e.event_time or "").strip()
+        when = " ".join(x for x in (d, t) if x)
+        line = f"{i}. <b>{html.escape(e.title)}</b>"
+        if when:
+            line += f"\n    📅 {html.escape(when)}"
+        if e.location:
+            line += f"  📍 {html.escape(e.location)}"
+        lines.append(line)
+    return "\n\n".join(lines)
+
+
+def digest_kb(events: list[EventCard]) -> InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+    for i, e in enumerate(events, start=1):
+        kb.button(text=f"📄 {i}", callback_data=f"resident_details:{e.id}")
+    kb.adjust(5)
+    return kb.as_markup()
+
+
+async def send_digest(bot: Bot, chat_id: int, events: list[EventCard], header: str = "") -> None:
+    """
+    Дайджест одним сообщением: альбом из афиш с подписью-списком, если афиш хотя бы
+    две и подпись влезает в лимит; иначе текст с кнопками «📄 N» (альбом кнопок не несёт).
+    """
+    text = format_digest_text(events, header)
+    covers = [e.cover_file_id for e in events if e.cover_file_id][:10]
+    if len(covers) >= 2 and len(text) <= CAPTION_LIMIT:
+        media = [InputMediaPhoto(media=file_id) for file_id in covers]
+        media[0].caption = text
+        media[0].parse_mode = "HTML"
+        try:
+            await bot.send_media_group(chat_id, media=media)
+            return
+        except (TelegramForbiddenError, TelegramRetryAfter):
+            raise
+        except Exception as ex:
+            logger.warning("failed to send digest album to chat_id=%s: %s", chat_id, ex)
+
+    await bot.send_message(chat_id, text, reply_markup=digest_kb(events), parse_mode="HTML")
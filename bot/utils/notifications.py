@@ -0,0 +1,21 @@
+# bot/utils/notifications.py
+"""Тексты и отправка персональных уведомлений жителю (напоминания)."""
+from __future__ import annotations
+
+from aiogram import Bot
+from aiogram.types import Message
+
+from bot.services.catalog import EventCard
+from bot.utils.cards import event_best_date, send_event_card
+
+
+def reminder_header(e: EventCard) -> str:
+    d = event_best_date(e)
+    t = (e.event_time or "").strip()
+    when = " ".join(x for x in (d, t) if x)
+    return "🔔 <b>Напоминание</b>: скоро начнётся" + (f" ({when})" if when else "")
+
+
+async def send_reminder(bot: Bot, chat_id: int, e: EventCard) -> Message:
+    """Карточка события с шапкой-напоминанием; ошибки Telegram — наружу (решает outbox)."""
+    return await send_event_card(bot, chat_id, e, header=reminder_header(e))
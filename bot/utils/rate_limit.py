@@ -0,0 +1,55 @@
+# bot/utils/rate_limit.py
+"""Общий темп исходящих сообщений бота (рассылки + outbox) под лимитом Telegram."""
+from __future__ import annotations
+
+import asyncio
+import time
+
+# общий лимит Telegram ~30 сообщений/с на бота; фоновым отправкам — не больше этого,
+# остаток — обычным ответам хендлеров
+MAX_SEND_RATE = 25.0
+
+
+class TokenBucket:
+    """
+    rate токенов в секунду, не больше burst в запасе; acquire() ждёт токен.
+    Ждущие обслуживаются по очереди (FIFO), поэтому несколько отправителей
+    делят один бюджет, а не складывают свои.
+
+    pause(seconds) — Telegram ответил retry_after: лимит общий для бота, стоят все.
+    """
+
+    def __init__(self, rate: float, burst: float = 1.0) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._stamp = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if self._paused_until > now:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + float(seconds))
+        self._tokens = 0.0
+        self._stamp = max(self._stamp, now)
+
+
+# один бюджет на процесс: BroadcastEngine и OutboxDispatcher (SEND_RATE в .env)
+send_limiter = TokenBucket(rate=20.0)
@@ -0,0 +1,65 @@
+# bot/utils/singleflight.py
+"""Склейка одинаковых одновременных вызовов (двойной тап, нетерпеливый пользователь)."""
+from __future__ import annotations
+
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Один вызов на ключ в полёте: пока первый do(key, fn) не закончился, остальные
+    с тем же ключом ждут его результат (или его исключение), а не повторяют работу.
+    Закончился — следующий вызов идёт заново, результаты не кэшируются.
+
+    Работа выполняется отдельной задачей: отмена одного ждущего (пользователь ушёл,
+    хендлер отменён) не отменяет её для остальных. Результат общий — вызывающие
+    не должны его менять.
+
+    hits — вызов присоединился к чужому, misses — запустил работу сам.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._flights: dict[Hashable, asyncio.Future] = {}
+        self.counters = {"hits": 0, "misses": 0}
+        _groups[name] = self
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        fut = self._flights.get(key)
+        if fut is not None:
+            self.counters["hits"] += 1
+        else:
+            self.counters["misses"] += 1
+            fut = asyncio.ensure_future(fn())
+            self._flights[key] = fut
+            fut.add_done_callback(lambda f, key=key: self._done(key, f))
+        return await asyncio.shield(fut)
+
+    def _done(self, key: Hashable, fut: asyncio.Future) -> None:
+        if self._flights.get(key) is fut:
+            del self._flights[key]
+        # все ждущие могли уйти — не оставляем «exception was never retrieved»
+        if not fut.cancelled():
+            fut.exception()
+
+    def describe(self) -> str:
+        hits, misses = self.counters["hits"], self.counters["misses"]
+        total = hits + misses
+        share = f" ({hits * 100 // total}%)" if total else ""
+        return f"{self.name}: склеено {hits}{share} из {total}, в полёте {len(self._flights)}"
+
+
+_groups: dict[str, SingleFlight] = {}
+
+
+def singleflight_stats() -> list[SingleFlight]:
+    return list(_groups.values())
+
+
+# общие группы: ключи — аргументы операции
+payment_flight = SingleFlight("payment_check")  # payment_id
+feed_flight = SingleFlight("feed")  # (limit, days, category, only_top)
+event_flight = SingleFlight("event")  # event_id